@@ -77,8 +77,16 @@ const ACTIVEDOC_TIMEOUT = (process.env.NODE_ENV === 'production') ? 30 : 5;
 // We'll wait this long between re-measuring sandbox memory.
 const MEMORY_MEASUREMENT_INTERVAL_MS = 60 * 1000;
 
+// Maximum number of rows to fetch from the data engine in one call, to keep messages to and from
+// the sandbox bounded. Note that the chunks still get combined into one result in this process.
+const FETCH_CHUNK_ROWS = 10000;
+
+// Whether to defer loading tables that no formula depends on into the data engine until they are
+// first needed. This is experimental, so off unless GRIST_DEFER_TABLES is set.
+const DEFER_TABLES = Boolean(process.env.GRIST_DEFER_TABLES);
+
 // A hook for dependency injection.
-export const Deps = {ACTIVEDOC_TIMEOUT};
+export const Deps = {ACTIVEDOC_TIMEOUT, DEFER_TABLES};
 
 /**
  * Represents an active document with the given name. The document isn't actually open until
@@ -152,6 +160,10 @@ export class ActiveDoc extends EventEmitter {
       logTimes: true,
       logMeta: {docId: docName},
       docUrl: options?.docUrl,
+      // Lets the data engine load tables whose loading it deferred (see _finishInitialization).
+      exports: {
+        fetch_table: (tableName: string) => this._fetchTableIfPresent(tableName),
+      },
     });
 
     this._activeDocImport = new ActiveDocImport(this);
@@ -1310,7 +1322,14 @@ export class ActiveDoc extends EventEmitter {
   @ActiveDoc.keepDocOpen
   private async _finishInitialization(docSession: OptDocSession, pendingTableNames: string[], startTime: number) {
     try {
-      await this._loadTables(docSession, pendingTableNames);
+      // Optionally, tables that no formula depends on are only loaded into the data engine when
+      // first needed.
+      const deferredTableNames = new Set<string>(
+        Deps.DEFER_TABLES ? await this._pyCall('get_unreferenced_tables') : []);
+      await this._loadTables(docSession, pendingTableNames.filter(name => !deferredTableNames.has(name)));
+      for (const tableName of pendingTableNames.filter(name => deferredTableNames.has(name))) {
+        await this._pyCall('defer_table', tableName);
+      }
       // Calculations are not associated specifically with the user opening the document.
       // TODO: be careful with which users can create formulas.
       await this._applyUserActions(makeExceptionalDocSession('system'), [['Calculate']]);
@@ -1348,7 +1367,28 @@ export class ActiveDoc extends EventEmitter {
   }
 
   private async _fetchQueryFromDataEngine(query: Query): Promise<TableDataAction> {
-    return this._pyCall('fetch_table', query.tableId, true, query.filters);
+    // Fetch the table in chunks of rows, each starting after the last row of the previous one. The
+    // lock ensures that no actions get applied in-between. This bounds the size of each message
+    // from the sandbox (and what the sandbox builds up to send it), but not the memory used here:
+    // callers of fetchQuery() get the whole table as a single TableDataAction.
+    return this._modificationLock.runExclusive(async () => {
+      const rowIds: number[] = [];
+      const columns: BulkColValues = {};
+      let startRowId = 0;
+      for (;;) {
+        const chunk: TableDataAction = await this._rawPyCall('fetch_table', query.tableId, true,
+          query.filters, null, startRowId, FETCH_CHUNK_ROWS);
+        const [, , chunkRowIds, chunkColumns] = chunk;
+        rowIds.push(...chunkRowIds);
+        for (const colId of Object.keys(chunkColumns)) {
+          const values = columns[colId] || (columns[colId] = []);
+          values.push(...chunkColumns[colId]);
+        }
+        if (chunkRowIds.length < FETCH_CHUNK_ROWS) { break; }
+        startRowId = chunkRowIds[chunkRowIds.length - 1] + 1;
+      }
+      return ['TableData', query.tableId, rowIds, columns] as TableDataAction;
+    });
   }
 
   private async _reportDataEngineMemory() {
@@ -17,6 +17,8 @@ export interface ISandboxCreationOptions {
   importMount?: string;  // if defined, make this path available read-only as "/importdir"
 
   docUrl?: string;      // to support SELF_HYPERLINK.
+
+  exports?: {[name: string]: (...args: any[]) => any};  // Functions made available to the sandbox.
 }
 
 export interface ISandbox {
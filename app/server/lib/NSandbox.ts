@@ -355,6 +355,7 @@ export class NSandboxCreator implements ISandboxCreator {
     }
     return new NSandbox({
       args,
+      exports: options.exports,
       logCalls: options.logCalls,
       logMeta: options.logMeta,
       logTimes: options.logTimes,
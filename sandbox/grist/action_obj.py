@@ -41,11 +41,11 @@ class ActionGroup(object):
     """
     self.summary.pop_column_delta_as_actions(table_id, col_id, self.stored, self.undo)
 
-  def get_repr(self):
+  def get_repr(self, compact=False):
     return {
-      "calc":     map(actions.get_action_repr, self.calc),
-      "stored":   map(actions.get_action_repr, self.stored),
-      "undo":     map(actions.get_action_repr, self.undo),
+      "calc":     [actions.get_action_repr(a, compact) for a in self.calc],
+      "stored":   [actions.get_action_repr(a, compact) for a in self.stored],
+      "undo":     [actions.get_action_repr(a, compact) for a in self.undo],
       "retValues": self.retValues
     }
 
@@ -82,12 +82,16 @@ class ActionBundle(object):
     self.retValues = []
     self.rules = set()        # RowIds of ACLRule records used to construct this ActionBundle.
 
-  def to_json_obj(self):
+  def to_json_obj(self, compact=False):
+    """
+    Returns the bundle as a JSON-compatible object. If compact is set, bulk actions are encoded
+    compactly (see actions.get_action_repr()).
+    """
     return {
       "envelopes": [e.to_json_obj() for e in self.envelopes],
-      "stored":    [(env, actions.get_action_repr(a)) for (env, a) in self.stored],
-      "calc":      [(env, actions.get_action_repr(a)) for (env, a) in self.calc],
-      "undo":      [(env, actions.get_action_repr(a)) for (env, a) in self.undo],
+      "stored":    [(env, actions.get_action_repr(a, compact)) for (env, a) in self.stored],
+      "calc":      [(env, actions.get_action_repr(a, compact)) for (env, a) in self.calc],
+      "undo":      [(env, actions.get_action_repr(a, compact)) for (env, a) in self.undo],
       "retValues": self.retValues,
       "rules":     sorted(self.rules)
     }
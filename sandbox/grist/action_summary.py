@@ -22,16 +22,31 @@ class ActionSummary(object):
     self._tables = {}         # maps tableId to TableDelta
     self._table_renames = LabelRenames()
 
-  def add_changes(self, table_id, col_id, changes):
+  def add_changes(self, table_id, col_id, changes, recomputable=False):
     """
-    Record changes for the given table and column, in the form (row_id, before, after).
+    Record changes for the given table and column, in the form (row_id, before, after). If
+    recomputable is set, and all changes to the column so far were too, no undo actions are
+    generated for them (see Engine.lazy_formula_undo).
     """
-    col_deltas = self._forTable(table_id).column_deltas.setdefault(col_id, {})
+    t = self._forTable(table_id)
+    if not recomputable:
+      t.recomputable_columns.discard(col_id)
+    elif col_id not in t.column_deltas:
+      t.recomputable_columns.add(col_id)
+    col_deltas = t.column_deltas.setdefault(col_id, {})
     for (row_id, before, after) in changes:
       # If a change was already recorded, update the 'after' value and keep the 'before' one.
       previous = col_deltas.get(row_id)
       col_deltas[row_id] = (previous[0] if previous else before, after)
 
+  def keep_undo_for_column(self, table_id, col_id):
+    """
+    Record that undo actions are needed for all changes to the given column in this bundle, even
+    recomputable ones. This is the case for a data column converted to a formula column, whose
+    first recompute overwrites stored values that recomputing can't bring back.
+    """
+    self.add_changes(table_id, col_id, [])
+
   def convert_deltas_to_actions(self, out_stored, out_undo):
     """
     Go through all prepared deltas, construct DocActions for them, and add them to out_stored
@@ -41,7 +56,8 @@ class ActionSummary(object):
       table_delta = self._tables[table_id]
       for col_id in sorted(table_delta.column_deltas):
         column_delta = table_delta.column_deltas[col_id]
-        self._changes_to_actions(table_id, col_id, column_delta, out_stored, out_undo)
+        self._changes_to_actions(table_id, col_id, column_delta, out_stored, out_undo,
+                                 col_id in table_delta.recomputable_columns)
 
   def pop_column_delta_as_actions(self, table_id, col_id, out_stored, out_undo):
     """
@@ -50,7 +66,11 @@ class ActionSummary(object):
     """
     table_delta = self._tables.get(table_id)
     col_delta = table_delta and table_delta.column_deltas.pop(col_id, None)
-    return self._changes_to_actions(table_id, col_id, col_delta or {}, out_stored, out_undo)
+    recomputable = bool(table_delta) and col_id in table_delta.recomputable_columns
+    if recomputable:
+      table_delta.recomputable_columns.discard(col_id)
+    return self._changes_to_actions(table_id, col_id, col_delta or {}, out_stored, out_undo,
+                                    recomputable)
 
   def update_new_rows_map(self, table_id, temp_row_ids, final_row_ids):
     """
@@ -69,10 +89,12 @@ class ActionSummary(object):
     t = self._forTable(table_id)
     return [t.temp_row_ids.get(r, r) for r in row_ids]
 
-  def _changes_to_actions(self, table_id, col_id, column_delta, out_stored, out_undo):
+  def _changes_to_actions(self, table_id, col_id, column_delta, out_stored, out_undo,
+                          recomputable=False):
     """
     Given a column and a dict of column_deltas for it, of the form {row_id: (before_value,
-    after_value)}, creates DocActions and adds them to out_stored and out_undo lists.
+    after_value)}, creates DocActions and adds them to out_stored and out_undo lists. If
+    recomputable is set, only adds to out_stored.
     """
     if not column_delta:
       return
@@ -92,6 +114,9 @@ class ActionSummary(object):
     if self.is_created(table_id, col_id) and not defunct:
       # A newly-create column, and not replacing a defunct one. Don't generate undo actions.
       pass
+    elif recomputable:
+      # Values which undo will recompute. Don't generate undo actions.
+      pass
     else:
       row_ids = self.filter_out_new_rows(table_id, full_row_ids)
       if row_ids:
@@ -151,6 +176,9 @@ class ActionSummary(object):
     t.column_renames.add_rename(old_col_id, new_col_id)
     if old_col_id in t.column_deltas:
       t.column_deltas[new_col_id] = t.column_deltas.pop(old_col_id)
+    if old_col_id in t.recomputable_columns:
+      t.recomputable_columns.remove(old_col_id)
+      t.recomputable_columns.add(new_col_id)
 
   def add_table(self, table_id):
     self.rename_table(None, table_id)
@@ -171,6 +199,7 @@ class TableDelta(object):
     self._rows_present_after = {}
     self.column_renames = LabelRenames()
     self.column_deltas = {}   # maps col_id to the dict {row_id: (before_value, after_value)}
+    self.recomputable_columns = set()   # col_ids whose deltas don't need undo actions
 
     # Map of negative row_ids that may be used in [Bulk]AddRecord actions to the final row_ids for
     # those rows; to allow translating Reference values added in the same action bundle.
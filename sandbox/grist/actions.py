@@ -8,6 +8,7 @@ When communicating with Node, docActions are represented as arrays [actionName,
 from collections import namedtuple
 import inspect
 
+import columnar
 import objtypes
 
 def _eq_with_type(self, other):
@@ -71,6 +72,9 @@ TableData = namedtuple_eq('TableData', BulkAddRecord._fields)
 action_types = dict((key, val) for (key, val) in globals().items()
                     if inspect.isclass(val) and issubclass(val, tuple))
 
+# Actions which include row_ids and a dict of columns of values.
+_bulk_action_types = (BulkAddRecord, BulkUpdateRecord, ReplaceTableData, TableData)
+
 # This is the set of names of all the actions that affect the schema.
 schema_actions = {name for name in action_types
                   if name.endswith("Column") or name.endswith("Table")}
@@ -97,10 +101,16 @@ _add_simplify(RemoveRecord, BulkRemoveRecord)
 _add_simplify(UpdateRecord, BulkUpdateRecord)
 
 
-def get_action_repr(action_obj):
+def get_action_repr(action_obj, compact=False):
   """
-  Converts an action object, such as UpdateRecord into a docAction array.
+  Converts an action object, such as UpdateRecord into a docAction array. If compact is set, the
+  row_ids and values of bulk actions are encoded as described in columnar.py, which is much
+  smaller for e.g. a formula recalculated for all rows of a table.
   """
+  if compact and isinstance(action_obj, _bulk_action_types):
+    return [action_obj.__class__.__name__, action_obj.table_id,
+            columnar.compact_row_ids(action_obj.row_ids),
+            {k: columnar.compact_column(v) for (k, v) in action_obj.columns.iteritems()}]
   return [action_obj.__class__.__name__] + list(encode_objects(action_obj))
 
 def action_from_repr(doc_action):
@@ -112,10 +122,14 @@ def action_from_repr(doc_action):
     raise ValueError('Unknown action %s' % (doc_action[0],))
 
   try:
-    return decode_objects(action_type(*doc_action[1:]))
+    action = decode_objects(action_type(*doc_action[1:]))
   except TypeError as e:
     raise TypeError("%s: %s" % (doc_action[0], e.message))
 
+  if isinstance(action, _bulk_action_types) and columnar.is_encoded_column(action.row_ids):
+    action = action._replace(row_ids=columnar.decode_column(action.row_ids))
+  return action
+
 
 def convert_recursive_helper(converter, data):
   """
@@ -143,9 +157,12 @@ def convert_action_values(converter, action):
   if isinstance(action, (AddRecord, UpdateRecord)):
     return type(action)(action.table_id, action.row_id,
                         {k: converter(v) for k, v in action.columns.iteritems()})
-  if isinstance(action, (BulkAddRecord, BulkUpdateRecord, ReplaceTableData, TableData)):
+  if isinstance(action, _bulk_action_types):
+    # Columns of actions received in compact form are encoded, and get decoded here.
     return type(action)(action.table_id, action.row_ids,
-                        {k: map(converter, v) for k, v in action.columns.iteritems()})
+                        {k: (columnar.decode_column(v, converter) if columnar.is_encoded_column(v)
+                             else map(converter, v))
+                         for k, v in action.columns.iteritems()})
   return action
 
 def convert_recursive_in_action(converter, data):
@@ -171,9 +188,11 @@ def decode_objects(data, decoder=objtypes.decode_object):
 def decode_bulk_values(bulk_values, decoder=objtypes.decode_object):
   """
   Decode objects in values of the form {col_id: array_of_values}, as present in bulk DocActions
-  and UserActions.
+  and UserActions. Arrays of values may also be columns encoded as described in columnar.py.
   """
-  return {k: map(decoder, v) for (k, v) in bulk_values.iteritems()}
+  return {k: (columnar.decode_column(v, decoder) if columnar.is_encoded_column(v)
+              else map(decoder, v))
+          for (k, v) in bulk_values.iteritems()}
 
 def transpose_bulk_action(bulk_action):
   """
@@ -1,4 +1,5 @@
 import ast
+from collections import namedtuple
 import contextlib
 import re
 import six
@@ -20,19 +21,54 @@ LAZY_ARG_FUNCTIONS = {
   'IFERROR': slice(0, 1),
 }
 
+# Version of the transformation done by transform_formula(). It must be incremented whenever the
+# transformation changes, since its results may be cached on disk (see formula_cache.py).
+TRANSFORM_VERSION = 1
+
+
 def make_formula_body(formula, default_value, assoc_value=None):
   """
   Given a formula, returns a textbuilder.Builder object suitable to be the body of a function,
   with the formula transformed to replace `$foo` with `rec.foo`, and to insert `return` if
   appropriate. Assoc_value is associated with textbuilder.Text() to be returned by map_back_patch.
   """
+  return build_formula_body(formula, transform_formula(formula, default_value), assoc_value)
+
+
+def build_formula_body(formula, transform, assoc_value=None):
+  """
+  Returns the textbuilder.Builder for the body of a formula function, given the result of
+  transform_formula() for that formula. This part is cheap; the parsing is all in the transform.
+  """
+  if isinstance(formula, six.binary_type):
+    formula = formula.decode('utf8')
+
+  kind, arg = transform
+  if kind == 'patches':
+    patches = [textbuilder.Patch(*p) for p in arg]
+    return textbuilder.Replacer(textbuilder.Text(formula, assoc_value), patches)
+  elif kind == 'default':
+    return textbuilder.Text(arg, assoc_value)
+  else:
+    return textbuilder.Text(arg)
+
+
+def transform_formula(formula, default_value):
+  """
+  Parses a formula to figure out how to turn it into the body of a function, as described in
+  make_formula_body(). Returns a marshallable tuple (kind, arg) for build_formula_body(), where
+  kind is one of:
+    'patches': arg is the list of patches (as tuples) to apply to the formula.
+    'default': arg is the code returning default_value, for an empty formula.
+    'error': arg is the code raising the formula's syntax error.
+  """
   if isinstance(formula, six.binary_type):
     formula = formula.decode('utf8')
 
   if not formula.strip():
-    return textbuilder.Text('return ' + repr(default_value), assoc_value)
+    return ('default', 'return ' + repr(default_value))
 
-  formula_builder_text = textbuilder.Text(formula, assoc_value)
+  formula_builder_text = textbuilder.Text(formula)
 
   # Start with a temporary builder, since we need to translate "$" before we can parse the code at
   # all (namely, we turn '$foo' into 'DOLLARfoo' first). Once we can parse the code, we'll create
@@ -46,14 +82,14 @@ def make_formula_body(formula, default_value, assoc_value=None):
   try:
     atok = asttokens.ASTTokens(tmp_formula.get_text(), parse=True)
   except SyntaxError as e:
-    return textbuilder.Text(_create_syntax_error_code(tmp_formula, formula, e))
+    return ('error', _create_syntax_error_code(tmp_formula, formula, e))
 
   # Parse formula and generate error code on assignment to rec
   with use_inferences(InferRecAssignment):
     try:
       astroid.parse(tmp_formula.get_text())
     except SyntaxError as e:
-      return textbuilder.Text(_create_syntax_error_code(tmp_formula, formula, e))
+      return ('error', _create_syntax_error_code(tmp_formula, formula, e))
 
   # Once we have a tree, go through it and create a subset of the dollar patches that are actually
   # relevant. E.g. this is where we'll skip the "$foo" patches that appear in strings or comments.
@@ -96,10 +132,10 @@ def make_formula_body(formula, default_value, assoc_value=None):
   try:
     atok = asttokens.ASTTokens(final_formula.get_text(), parse=True)
   except SyntaxError as e:
-    return textbuilder.Text(_create_syntax_error_code(final_formula, formula, e))
+    return ('error', _create_syntax_error_code(final_formula, formula, e))
 
-  # We return the text-builder object whose .get_text() is the final formula.
-  return final_formula
+  # We return the patches which turn the formula into the final code.
+  return ('patches', [tuple(p) for p in sorted(patches)])
 
 
 def _create_syntax_error_code(builder, input_text, err):
@@ -124,6 +160,135 @@ def _create_syntax_error_code(builder, input_text, err):
 
 #----------------------------------------------------------------------
 
+# Types of AST nodes allowed in formulas accepted by make_batch_formula().
+_BATCH_NODE_TYPES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+                     ast.Num, ast.Str, ast.Name, ast.Load, ast.Param, ast.arguments, ast.Lambda,
+                     ast.operator, ast.unaryop, ast.boolop, ast.cmpop)
+
+# Names other than field arguments allowed in formulas accepted by make_batch_formula().
+_BATCH_CONSTANT_NAMES = ('None', 'True', 'False')
+
+# Result of make_batch_formula(): func(*values) evaluates the formula given the values of the
+# fields listed in col_ids, in the same order.
+BatchFormula = namedtuple('BatchFormula', ('col_ids', 'func'))
+
+class _FieldArgsTransformer(ast.NodeTransformer):
+  """
+  Replaces references to fields of the current record (`$foo` translated to `DOLLARfoo`, or
+  `rec.foo`) with names of arguments, collecting the list of referenced col_ids.
+  """
+  def __init__(self):
+    super(_FieldArgsTransformer, self).__init__()
+    self.col_ids = []
+    self.dollar_count = 0
+
+  def _make_arg(self, col_id, node):
+    if col_id not in self.col_ids:
+      self.col_ids.append(col_id)
+    arg = ast.Name(id=_batch_arg_name(self.col_ids.index(col_id)), ctx=ast.Load())
+    return ast.copy_location(arg, node)
+
+  def visit_Name(self, node):
+    if node.id.startswith('DOLLAR'):
+      self.dollar_count += 1
+      return self._make_arg(node.id[len('DOLLAR'):], node)
+    return node
+
+  def visit_Attribute(self, node):
+    if isinstance(node.value, ast.Name) and node.value.id == 'rec':
+      return self._make_arg(node.attr, node)
+    return self.generic_visit(node)
+
+def _batch_arg_name(index):
+  return '_arg%d' % index
+
+def make_batch_formula(formula):
+  """
+  Returns a BatchFormula if the formula is a single expression that only combines fields of the
+  current record (as `$foo` or `rec.foo`) and constants using arithmetic, comparison, and boolean
+  operators, e.g. `$A * $B` or `$Price > 10 and $Name + "!"`. Such a formula is a pure function
+  of the values of a single record, which allows evaluating it for many records at once, without
+  the overhead of constructing Record objects. Returns None for any other formula.
+  """
+  if isinstance(formula, six.binary_type):
+    formula = formula.decode('utf8')
+
+  # Formulas which use an identifier starting with 'DOLLAR' aren't worth the trouble.
+  if 'DOLLAR' in formula:
+    return None
+  formula = formula.strip()
+  if not formula:
+    return None
+  try:
+    tree = ast.parse(DOLLAR_REGEX.sub('DOLLAR', formula), mode='eval')
+  except SyntaxError:
+    return None
+
+  transformer = _FieldArgsTransformer()
+  tree = transformer.visit(tree)
+  arg_names = [_batch_arg_name(i) for i in xrange(len(transformer.col_ids))]
+
+  # Any `$foo` inside a string literal got translated too; if so, there are fewer field references
+  # than dollar signs matched, and the literal would be wrong, so we give up on such formulas.
+  if len(DOLLAR_REGEX.findall(formula)) != transformer.dollar_count:
+    return None
+
+  func_tree = ast.Expression(body=ast.Lambda(
+    args=ast.arguments(args=[ast.Name(id=name, ctx=ast.Param()) for name in arg_names],
+                       vararg=None, kwarg=None, defaults=[]),
+    body=tree.body))
+
+  for node in ast.walk(func_tree):
+    if not isinstance(node, _BATCH_NODE_TYPES):
+      return None
+    if (isinstance(node, ast.Name) and node.id not in arg_names and
+        node.id not in _BATCH_CONSTANT_NAMES):
+      return None
+
+  ast.fix_missing_locations(func_tree)
+  code = compile(func_tree, '<formula>', 'eval', dont_inherit=True)
+  return BatchFormula(tuple(transformer.col_ids), eval(code, {}))   # pylint: disable=eval-used
+
+#----------------------------------------------------------------------
+
+# Functions that parse_group_aggregate() recognizes when applied to a field of `$group`.
+GROUP_AGGREGATE_FUNCS = ('SUM', 'sum', 'AVERAGE', 'COUNT', 'MIN', 'MAX')
+
+# Result of parse_group_aggregate(): `func` is one of GROUP_AGGREGATE_FUNCS or 'len', and col_id
+# is the field of `$group` it's applied to (None for 'len').
+GroupAggregate = namedtuple('GroupAggregate', ('func', 'col_id'))
+
+def _is_group_node(node):
+  return (isinstance(node, ast.Attribute) and node.attr == 'group' and
+          isinstance(node.value, ast.Name) and node.value.id == 'rec')
+
+def parse_group_aggregate(formula):
+  """
+  Returns a GroupAggregate if the formula is one of the common aggregations over the records of
+  a summary group, `len($group)` or `FUNC($group.Field)` with FUNC in GROUP_AGGREGATE_FUNCS, and
+  None otherwise. Such formulas can be maintained incrementally as records change.
+  """
+  if isinstance(formula, six.binary_type):
+    formula = formula.decode('utf8')
+  try:
+    tree = ast.parse(DOLLAR_REGEX.sub('rec.', formula.strip()), mode='eval')
+  except SyntaxError:
+    return None
+
+  call = tree.body
+  if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and
+          len(call.args) == 1 and not call.keywords and not call.starargs and not call.kwargs):
+    return None
+  arg = call.args[0]
+  if call.func.id == 'len' and _is_group_node(arg):
+    return GroupAggregate('len', None)
+  if (call.func.id in GROUP_AGGREGATE_FUNCS and isinstance(arg, ast.Attribute) and
+      _is_group_node(arg.value)):
+    return GroupAggregate(call.func.id, arg.attr)
+  return None
+
+#----------------------------------------------------------------------
+
 def infer(node):
   try:
     return next(node.infer(), None)
@@ -1,8 +1,11 @@
+import itertools
 import types
 from collections import namedtuple
 
+import column_data
 import depend
 import objtypes
+import records
 import usertypes
 import relabeling
 import relation
@@ -46,6 +49,9 @@ def is_virtual_column(col_id):
 def is_validation_column_name(name):
   return name.startswith("validation___")
 
+# Types of raw values that get_plain_cell_values() returns.
+_PLAIN_TYPES = frozenset([float, int, long, bool, str, unicode, types.NoneType])
+
 ColInfo = namedtuple('ColInfo', ('type_obj', 'is_formula', 'method'))
 
 def get_col_info(col_model, default_func=None):
@@ -60,9 +66,16 @@ class BaseColumn(object):
   """
   BaseColumn holds a column of data, whether raw or computed.
   """
+  # The container class for this column's values; see column_data.py.
+  _data_class = column_data.ListData
+
+  # Whether right-type values held in typed storage are what get_cell_value() returns, so that
+  # get_stored_cell_values() may return them as is.
+  _stored_values_are_rich = False
+
   def __init__(self, table, col_id, col_info):
     self.type_obj = col_info.type_obj
-    self._data = []
+    self._data = self._data_class(self.getdefault())
     self.col_id = col_id
     self.table_id = table.table_id
     self.node = depend.Node(self.table_id, col_id)
@@ -102,18 +115,17 @@ class BaseColumn(object):
     return self.method is not None
 
   def clear(self):
-    self._data = []
+    self._data.clear()
     self.growto(1)    # Always include the special empty record at index 0.
 
   def destroy(self):
     """
     Called when the column is deleted.
     """
-    del self._data[:]
+    self._data.clear()
 
   def growto(self, size):
-    if len(self._data) < size:
-      self._data.extend([self.getdefault()] * (size - len(self._data)))
+    self._data.growto(size)
 
   def size(self):
     return len(self._data)
@@ -149,6 +161,22 @@ class BaseColumn(object):
       return self._make_rich_value(raw)
     return usertypes.AltText(str(raw), self.type_obj.typename())
 
+  def get_cell_value_via(self, row_id, relation):
+    """
+    Returns the same value as get_cell_value(), but with any Record or RecordSet adjusted to have
+    been obtained via the given relation (see records.adjust_record()). This is what formulas see
+    when accessing this column of a record obtained via that relation.
+    """
+    return records.adjust_record(relation, self.get_cell_value(row_id))
+
+  def iter_cell_values_via(self, row_ids, relation):
+    """
+    Yields get_cell_value_via(row_id, relation) for each of the given row_ids. This is how a
+    ColumnView is iterated, and may be overridden to produce values in bulk.
+    """
+    for row_id in row_ids:
+      yield self.get_cell_value_via(row_id, relation)
+
   def _make_rich_value(self, typed_value):
     """
     Called by get_cell_value() with a value of the right type for this column. Should be
@@ -157,6 +185,37 @@ class BaseColumn(object):
     # pylint: disable=no-self-use
     return typed_value
 
+  def get_plain_cell_values(self, row_ids, missing):
+    """
+    Returns a list of the values that get_cell_value() would return for each of row_ids, for use
+    in batch evaluation of simple formulas. Cells for which get_cell_value() would raise an
+    exception, or return alttext or anything other than a basic Python value, are returned as the
+    `missing` value, and should be evaluated the usual way. Returns None if the column doesn't
+    support this (e.g. references, whose rich values depend on how a record was obtained).
+    """
+    is_right_type = self.type_obj.is_right_type
+    make_rich_value = self._make_rich_value
+    return [make_rich_value(raw) if (type(raw) in _PLAIN_TYPES and is_right_type(raw)) else missing
+            for raw in itertools.imap(self.raw_get, row_ids)]
+
+  def get_stored_cell_values(self, row_ids):
+    """
+    Returns the list of values that get_cell_value() would return for each of row_ids, when they
+    can all be read directly from the column's typed storage, i.e. the column's rich values are its
+    raw values, and none of these cells holds an error, alttext, or other outlier. Returns None
+    otherwise. This is the fast path for aggregate functions such as SUM() over a ColumnView.
+    """
+    if not self._stored_values_are_rich:
+      return None
+    return self._data.get_stored_values(row_ids)
+
+  def lookup_raw_values(self, values):
+    """
+    Returns the set of row_ids whose raw values are among the given values, if the column keeps an
+    index that can answer this quickly. Returns None otherwise.
+    """
+    return None
+
   def raw_get(self, row_id):
     """
     Returns the value stored for the given row_id. This may be an error or alttext, and it does
@@ -192,7 +251,7 @@ class BaseColumn(object):
     """
     Replace this column's data entirely with data from another column of the same exact type.
     """
-    self._data[:] = other_column._data
+    self._data.copy_from(other_column._data)
 
   def convert(self, value_to_convert):
     """
@@ -201,6 +260,12 @@ class BaseColumn(object):
     """
     return self.type_obj.convert(value_to_convert)
 
+  def convert_list(self, values):
+    """
+    Converts a list of values, returning a list of what convert() returns for each.
+    """
+    return self.type_obj.convert_list(values)
+
   def prepare_new_values(self, values, ignore_data=False, action_summary=None):
     """
     This allows us to modify values and also produce adjustments to existing records. This
@@ -219,7 +284,17 @@ class DataColumn(BaseColumn):
   """
   pass
 
+class IntColumn(BaseColumn):
+  """
+  IntColumn holds integers, as for Int columns and the special "id" column.
+  """
+  _data_class = column_data.IntData
+  _stored_values_are_rich = True
+
 class BoolColumn(BaseColumn):
+  _data_class = column_data.BoolData
+  _stored_values_are_rich = True
+
   def set(self, row_id, value):
     # When 1 or 1.0 is loaded, we should see it as True, and similarly 0 as False. This is similar
     # to how, after loading a number into a DateColumn, we should see a date, except we adjust
@@ -228,6 +303,9 @@ class BoolColumn(BaseColumn):
     super(BoolColumn, self).set(row_id, bool_value)
 
 class NumericColumn(BaseColumn):
+  _data_class = column_data.FloatData
+  _stored_values_are_rich = True
+
   def set(self, row_id, value):
     # Make sure any integers are treated as floats to avoid truncation.
     # Uses `type(value) == int` rather than `isintance(value, int)` to specifically target
@@ -236,6 +314,11 @@ class NumericColumn(BaseColumn):
     # pylint: disable=unidiomatic-typecheck
     super(NumericColumn, self).set(row_id, float(value) if type(value) == int else value)
 
+# Number of cells that DateTimeColumn converts at once when iterated in bulk, and the types of
+# values it converts that way.
+_BULK_CHUNK_SIZE = 1000
+_timestamp_types = frozenset([float, int, type(None)])
+
 _sample_date = moment.ts_to_date(0)
 _sample_datetime = moment.ts_to_dt(0, None, moment.TZ_UTC)
 
@@ -244,6 +327,8 @@ class DateColumn(NumericColumn):
   DateColumn contains numerical timestamps represented as seconds since epoch, in type float,
   to midnight of specific UTC dates. Accessing them yields date objects.
   """
+  _stored_values_are_rich = False
+
   def _make_rich_value(self, typed_value):
     return typed_value and moment.ts_to_date(typed_value)
 
@@ -255,6 +340,8 @@ class DateTimeColumn(NumericColumn):
   DateTimeColumn contains numerical timestamps represented as seconds since epoch, in type float,
   and a timestamp associated with the column. Accessing them yields datetime objects.
   """
+  _stored_values_are_rich = False
+
   def __init__(self, table, col_id, col_info):
     super(DateTimeColumn, self).__init__(table, col_id, col_info)
     self._timezone = col_info.type_obj.timezone
@@ -262,6 +349,22 @@ class DateTimeColumn(NumericColumn):
   def _make_rich_value(self, typed_value):
     return typed_value and moment.ts_to_dt(typed_value, self._timezone)
 
+  def iter_cell_values_via(self, row_ids, relation):
+    # Converts timestamps to datetimes in bulk, for chunks of cells that are all timestamps.
+    # Chunks with any other values (e.g. errors, which get raised) are processed cell by cell.
+    row_id_iter = iter(row_ids)
+    while True:
+      chunk = list(itertools.islice(row_id_iter, _BULK_CHUNK_SIZE))
+      if not chunk:
+        break
+      raw_values = map(self.raw_get, chunk)
+      if _timestamp_types.issuperset(map(type, raw_values)):
+        for value in moment.ts_list_to_dt(raw_values, self._timezone):
+          yield value
+      else:
+        for row_id in chunk:
+          yield self.get_cell_value_via(row_id, relation)
+
   def sample_value(self):
     return _sample_datetime
 
@@ -336,12 +439,17 @@ class BaseReferenceColumn(BaseColumn):
   def sample_value(self):
     return self._target_table.sample_record
 
+  def get_plain_cell_values(self, row_ids, missing):
+    return None
+
 
 class ReferenceColumn(BaseReferenceColumn):
   """
   ReferenceColumn contains IDs of rows in another table. Accessing them yields the records in the
   other table.
   """
+  _data_class = column_data.IntData
+
   def _make_rich_value(self, typed_value):
     # If we refer to an invalid table, return integers rather than fail completely.
     if not self._target_table:
@@ -350,12 +458,28 @@ class ReferenceColumn(BaseReferenceColumn):
     # the 0 index will contain the all-defaults record.
     return self._target_table.Record(self._target_table, typed_value, self._relation)
 
+  def get_cell_value_via(self, row_id, relation):
+    # This is a hot path when formulas follow references. It makes the Record with the composed
+    # relation directly, reusing one made earlier for the same formula if possible.
+    raw = self.raw_get(row_id)
+    if self._target_table and type(raw) is int and objtypes.is_int_short(raw):
+      return self._target_table._engine.make_record(self._target_table, raw,
+                                                    relation.compose(self._relation))
+    return super(ReferenceColumn, self).get_cell_value_via(row_id, relation)
+
   def _update_references(self, row_id, old_value, new_value):
     if old_value:
       self._relation.remove_reference(row_id, old_value)
     if new_value:
       self._relation.add_reference(row_id, new_value)
 
+  def lookup_raw_values(self, values):
+    # The relation's inverse map is an index of all non-empty references.
+    if not all(type(v) is int and v > 0 for v in values):  # pylint: disable=unidiomatic-typecheck
+      return None
+    inverse_map = self._relation.inverse_map
+    return set().union(*[inverse_map.get(v, ()) for v in values])
+
   def prepare_new_values(self, values, ignore_data=False, action_summary=None):
     if action_summary and values:
       values = action_summary.translate_new_row_ids(self._target_table.table_id, values)
@@ -391,6 +515,8 @@ usertypes.Date.ColType = DateColumn
 usertypes.PositionNumber.ColType = PositionColumn
 usertypes.Bool.ColType = BoolColumn
 usertypes.Numeric.ColType = NumericColumn
+usertypes.Int.ColType = IntColumn
+usertypes.Id.ColType = IntColumn
 
 def create_column(table, col_id, col_info):
   return col_info.type_obj.ColType(table, col_id, col_info)
@@ -0,0 +1,220 @@
+"""
+Containers used by Column objects to hold the values of a column, indexed by row_id.
+
+Most columns use ListData, which is a plain Python list. Columns whose values are nearly always of
+one primitive type (Numeric, Date, DateTime, Bool, Int, Ref, and the row ID column) use one of
+the TypedArrayData classes instead, which keep such values in a compact `array.array`, avoiding a
+boxed Python object per cell.
+
+A typed column may still contain values of other types: alttext, errors, None, or numbers of a
+different Python type (e.g. a long in a Numeric column). These "outliers" are kept in a dict keyed by
+row_id, and a side bitmap (a bytearray with one flag per row) tells which rows are outliers, so
+that the common case never touches the dict. An outlier equal to the column's default (such as
+None for Date columns) is represented by the flag alone, without a dict entry.
+
+All containers support the list-like interface used by column.py: len(), indexing (including
+with negative indices) with an IndexError past the end, assignment to an existing index, and iteration, plus growto(), clear()
+and copy_from().
+"""
+import array
+import itertools
+
+
+class ListData(list):
+  """
+  A list of arbitrary values, with the few extra methods expected by column.py.
+  """
+  __slots__ = ('_default',)
+
+  def __init__(self, default):
+    super(ListData, self).__init__()
+    self._default = default
+
+  def growto(self, size):
+    """
+    Extends the list to the given size, filling new positions with the default value.
+    """
+    if len(self) < size:
+      self.extend([self._default] * (size - len(self)))
+
+  def clear(self):
+    del self[:]
+
+  def copy_from(self, other_data):
+    """
+    Replaces the contents with those of another container.
+    """
+    self[:] = other_data
+
+
+class TypedArrayData(object):
+  """
+  Base class for containers storing right-type values in an array.array of `typecode`. Derived
+  classes define `typecode` and `_is_storable()`, and may override `_decode()`.
+  """
+  typecode = None
+
+  def __init__(self, default):
+    self._default = default
+    self._values = array.array(self.typecode)
+    self._outlier_flags = bytearray()
+    self._outliers = {}
+    # Filler stored in the array at positions whose actual value is an outlier.
+    self._filler = array.array(self.typecode, [0])
+
+  @staticmethod
+  def _is_storable(value):
+    """
+    Returns whether value can be stored in the array so that reading it back gives a value of
+    the same type that is equal to it.
+    """
+    raise NotImplementedError()
+
+  @staticmethod
+  def _decode(stored_value):
+    """
+    Converts a value read from the array back into the value that was stored.
+    """
+    return stored_value
+
+  def __len__(self):
+    return len(self._outlier_flags)
+
+  def _normalize_index(self, index):
+    # Outliers are keyed by non-negative index, so negative ones must be converted as for a list.
+    if index < 0:
+      index += len(self._outlier_flags)
+      if index < 0:
+        raise IndexError("%s index out of range" % type(self).__name__)
+    return index
+
+  def __getitem__(self, index):
+    if index < 0:
+      index = self._normalize_index(index)
+    if self._outlier_flags[index]:
+      return self._outliers.get(index, self._default)
+    return self._decode(self._values[index])
+
+  def __setitem__(self, index, value):
+    if index < 0:
+      index = self._normalize_index(index)
+    # Reading the flag first raises IndexError for an out-of-range index before any changes.
+    is_outlier = self._outlier_flags[index]
+    if self._is_storable(value):
+      try:
+        self._values[index] = value
+      except OverflowError:
+        pass
+      else:
+        if is_outlier:
+          self._outlier_flags[index] = 0
+          self._outliers.pop(index, None)
+        return
+
+    self._outlier_flags[index] = 1
+    if value is self._default:
+      self._outliers.pop(index, None)
+    else:
+      self._outliers[index] = value
+
+  def __iter__(self):
+    decode = self._decode
+    outliers = self._outliers
+    default = self._default
+    pairs = itertools.izip(self._outlier_flags, self._values)
+    for index, (flag, value) in enumerate(pairs):
+      yield outliers.get(index, default) if flag else decode(value)
+
+  def growto(self, size):
+    """
+    Extends the container to the given size, filling new positions with the default value.
+    """
+    count = size - len(self)
+    if count <= 0:
+      return
+    if self._is_storable(self._default):
+      self._values.extend(array.array(self.typecode, [self._default]) * count)
+      self._outlier_flags.extend(bytearray(count))
+    else:
+      self._values.extend(self._filler * count)
+      self._outlier_flags.extend(b'\x01' * count)
+
+  def clear(self):
+    self._values = array.array(self.typecode)
+    self._outlier_flags = bytearray()
+    self._outliers = {}
+
+  def copy_from(self, other_data):
+    """
+    Replaces the contents with those of another container. Copying between containers of the same
+    class copies the underlying buffers directly.
+    """
+    if type(other_data) is type(self) and other_data._default is self._default:
+      self._values = array.array(self.typecode, other_data._values)
+      self._outlier_flags = bytearray(other_data._outlier_flags)
+      self._outliers = other_data._outliers.copy()
+    else:
+      values = list(other_data)
+      self.clear()
+      self.growto(len(values))
+      for index, value in enumerate(values):
+        self[index] = value
+
+  def get_stored_values(self, indices):
+    """
+    Returns the list of values at the given indices, read straight from the array, if none of them
+    is an outlier. Returns None if any of them is an outlier or out of range.
+    """
+    try:
+      if any(map(self._outlier_flags.__getitem__, indices)):
+        return None
+    except IndexError:
+      return None
+    return map(self._values.__getitem__, indices)
+
+  def count_outliers(self):
+    """
+    Returns the number of positions holding values that aren't stored in the array.
+    """
+    return self._outlier_flags.count(b'\x01')
+
+
+class FloatData(TypedArrayData):
+  """
+  Stores Python floats as 8-byte doubles. Used for Numeric, Date, and DateTime columns.
+  """
+  typecode = 'd'
+
+  @staticmethod
+  def _is_storable(value):
+    return type(value) is float     # pylint: disable=unidiomatic-typecheck
+
+
+class IntData(TypedArrayData):
+  """
+  Stores Python ints that fit into a C int (4 bytes). Used for Int, Ref, and row ID columns.
+  """
+  typecode = 'i'
+
+  @staticmethod
+  def _is_storable(value):
+    return type(value) is int       # pylint: disable=unidiomatic-typecheck
+
+
+class BoolData(TypedArrayData):
+  """
+  Stores True and False as single bytes. Used for Bool columns.
+  """
+  typecode = 'b'
+
+  @staticmethod
+  def _is_storable(value):
+    return type(value) is bool      # pylint: disable=unidiomatic-typecheck
+
+  @staticmethod
+  def _decode(stored_value):
+    return stored_value != 0
+
+  def get_stored_values(self, indices):
+    values = super(BoolData, self).get_stored_values(indices)
+    return None if values is None else map(bool, values)
@@ -0,0 +1,186 @@
+"""
+Columnar encoding of bulk values, to send large amounts of data to and from the sandbox.
+
+Bulk values (as in TableData, BulkAddRecord, and BulkUpdateRecord) map col_ids to lists of cell
+values. Marshalling such lists, and decoding each cell (e.g. with objtypes.decode_object), costs
+Python work per cell. Instead, a list of values may be sent as an "encoded column": a dict in one
+of these forms:
+
+  {"type": "f8", "data": <bytes>}   - floats, as little-endian 8-byte doubles.
+  {"type": "i4", "data": <bytes>}   - ints, as little-endian 4-byte signed ints.
+  {"type": "b1", "data": <bytes>}   - bools, as one byte each (0 or 1).
+  {"type": "text", "data": <bytes>, "offsets": <bytes>}
+                                    - strings (utf8-encoded), concatenated in "data", with
+                                      "offsets" containing N+1 little-endian 4-byte offsets of
+                                      where each string starts and ends.
+
+Any of these may also include "outlier_indices" and "outlier_values": parallel lists of the
+indices of values that don't fit the type (such as None, or alttext), and of those values, encoded
+as cell values; the slots for them in "data" are ignored. (These are lists rather than a dict keyed
+by index, since dict keys turn into strings on the way through Node.)
+
+Columns with long runs of repeated values, such as row_ids or recalculated formula values, may
+instead be sent in these forms (see compact_column() and compact_row_ids()):
+
+  {"type": "runs", "values": [...], "counts": [...]}
+                                    - each of "values" (encoded as a cell value) repeated the
+                                      corresponding number of times in "counts".
+  {"type": "ranges", "starts": [...], "counts": [...]}
+                                    - ints, as ranges of consecutive ints, one per each of
+                                      "starts", of the corresponding length in "counts".
+
+Ordinary columns are lists, so encoded columns are told apart by being dicts. Decoding an encoded
+column only needs per-cell Python work for the outliers.
+"""
+import array
+from collections import Counter
+from itertools import groupby, izip
+import sys
+
+import objtypes
+
+# The array typecode for each fixed-size type, and the Python type whose values it holds.
+_FIXED_TYPES = {
+  "f8": ('d', float),
+  "i4": ('i', int),
+  "b1": ('b', bool),
+}
+
+_TYPE_NAMES = {float: "f8", int: "i4", bool: "b1", str: "text"}
+
+# Only columns at least this long get encoded; for shorter ones, it saves nothing.
+MIN_ENCODED_LENGTH = 16
+
+
+def is_encoded_column(values):
+  return isinstance(values, dict)
+
+
+def _to_little_endian(arr):
+  if sys.byteorder != 'little':
+    arr.byteswap()
+  return arr
+
+
+def _array_from_bytes(typecode, data):
+  arr = array.array(typecode)
+  arr.fromstring(data)
+  return _to_little_endian(arr)
+
+
+def decode_column(encoded, decoder=objtypes.decode_object):
+  """
+  Returns the list of values represented by an encoded column, using decoder for the outliers.
+  """
+  type_name = encoded["type"]
+  if type_name == "runs":
+    values = []
+    for value, count in izip(encoded["values"], encoded["counts"]):
+      values.extend([decoder(value)] * count)
+    return values
+  elif type_name == "ranges":
+    return [r for start, count in izip(encoded["starts"], encoded["counts"])
+            for r in xrange(start, start + count)]
+  elif type_name == "text":
+    offsets = _array_from_bytes('i', encoded["offsets"])
+    data = encoded["data"]
+    values = map(data.__getslice__, offsets[:-1], offsets[1:])
+  elif type_name in _FIXED_TYPES:
+    values = _array_from_bytes(_FIXED_TYPES[type_name][0], encoded["data"]).tolist()
+    if type_name == "b1":
+      values = map(bool, values)
+  else:
+    raise ValueError("Unknown column encoding %r" % (type_name,))
+
+  for index, value in izip(encoded.get("outlier_indices", ()), encoded.get("outlier_values", ())):
+    values[index] = decoder(value)
+  return values
+
+
+def encode_column(values, encoder=objtypes.encode_object):
+  """
+  Returns values as an encoded column of their most common supported type, with values of other
+  types as outliers. If there are too few values, or none of a supported type, returns them as a
+  list of cell values encoded using encoder.
+  """
+  type_counts = Counter(map(type, values))
+  main_type = max(_TYPE_NAMES, key=type_counts.__getitem__)
+  if len(values) < MIN_ENCODED_LENGTH or not type_counts[main_type]:
+    return map(encoder, values)
+
+  outlier_indices = []
+  main_values = values
+  if len(type_counts) > 1:
+    outlier_indices = [i for (i, v) in enumerate(values) if type(v) is not main_type]
+    filler = main_type()
+    main_values = list(values)
+    for index in outlier_indices:
+      main_values[index] = filler
+
+  type_name = _TYPE_NAMES[main_type]
+  if main_type is str:
+    offsets = array.array('i', [0])
+    position = 0
+    for value in main_values:
+      position += len(value)
+      offsets.append(position)
+    encoded = {"type": type_name, "data": "".join(main_values),
+               "offsets": _to_little_endian(offsets).tostring()}
+  else:
+    try:
+      arr = array.array(_FIXED_TYPES[type_name][0], main_values)
+    except OverflowError:
+      # Ints that don't fit into 4 bytes are sent as ordinary cell values.
+      return map(encoder, values)
+    encoded = {"type": type_name, "data": _to_little_endian(arr).tostring()}
+
+  if outlier_indices:
+    encoded["outlier_indices"] = outlier_indices
+    encoded["outlier_values"] = [encoder(values[i]) for i in outlier_indices]
+  return encoded
+
+
+def encode_bulk_values(bulk_values, encoder=objtypes.encode_object):
+  """
+  Returns bulk values with each column encoded using encode_column().
+  """
+  return {k: encode_column(v, encoder) for (k, v) in bulk_values.iteritems()}
+
+
+def compact_column(values, encoder=objtypes.encode_object):
+  """
+  Returns values as a "runs" column if they consist of few enough runs of repeated values, or
+  otherwise the same as encode_column().
+  """
+  if len(values) >= MIN_ENCODED_LENGTH:
+    # Values are grouped by type too, so that e.g. 1 and 1.0 don't end up in the same run.
+    runs = [(value, sum(1 for _ in group))
+            for ((_, value), group) in groupby(values, key=lambda v: (type(v), v))]
+    if len(runs) * 2 <= len(values):
+      return {"type": "runs", "values": [encoder(v) for (v, _) in runs],
+              "counts": [count for (_, count) in runs]}
+  return encode_column(values, encoder)
+
+
+def compact_row_ids(row_ids):
+  """
+  Returns a list of ints as a "ranges" column if it consists of few enough ranges of consecutive
+  ints, or otherwise returns it unchanged.
+  """
+  if len(row_ids) < MIN_ENCODED_LENGTH:
+    return row_ids
+  starts = []
+  counts = []
+  expected = None
+  for row_id in row_ids:
+    if type(row_id) is not int:
+      return row_ids
+    if row_id == expected:
+      counts[-1] += 1
+    else:
+      starts.append(row_id)
+      counts.append(1)
+    expected = row_id + 1
+  if len(starts) * 2 > len(row_ids):
+    return row_ids
+  return {"type": "ranges", "starts": starts, "counts": counts}
@@ -0,0 +1,341 @@
+"""
+Snapshots of the dependency graph and lookup indexes, to speed up opening a document.
+
+Normally, opening a document recomputes every formula cell, since that's the only way the engine
+learns the dependencies between cells (and builds the lookup maps used by lookupRecords). For a
+document whose stored formula values are up-to-date, that work only reproduces what the engine
+already knew when the document was last saved.
+
+make_snapshot() captures that knowledge from an up-to-date engine: the edges of the dependency
+graph (with enough information to rebuild their relations), the contents of lookup maps and of
+the relations that track which rows looked up which keys, and the values of private formula
+columns (such as summary helper columns), which aren't stored in the document. Loading the
+snapshot after the document data (but before Engine.load_done()) restores all that, and marks the
+covered formula columns as up-to-date, so that they don't get evaluated on open.
+
+The snapshot is keyed by a hash of all data columns in the document (including metadata, and so
+all formulas), and is ignored if it doesn't match the loaded data. Whatever the snapshot doesn't
+cover (e.g. relations of unknown kind, lookup keys that can't be serialized, or incrementally
+maintained aggregates) is simply left to be recomputed on open as usual.
+
+Formulas that may produce a different value on open than when the snapshot was made (those that
+mention NOW(), TODAY(), random numbers and the like, see _VOLATILE_NAMES) are never covered, and
+neither is anything that depends on a formula that gets recomputed on open.
+"""
+import hashlib
+import marshal
+import re
+
+import column
+import depend
+import lookup
+import objtypes
+import relation as relation_module
+import schema
+
+import logger
+log = logger.Logger(__name__, logger.INFO)
+
+# Version of the snapshot format. Snapshots of a different version are ignored.
+SNAPSHOT_VERSION = 2
+
+# Names whose use makes a formula volatile, i.e. possibly different each time it's evaluated. This
+# is a conservative test: a formula mentioning any of them anywhere is never covered.
+_VOLATILE_NAMES = ('NOW', 'TODAY', 'RAND', 'RANDBETWEEN', 'UUID', 'now', 'today', 'utcnow',
+                   'random', 'uuid', 'uuid1', 'uuid4', 'time', 'os', 'open', 'urllib', 'urllib2',
+                   'socket', 'subprocess')
+_volatile_re = re.compile(r'\b(%s)\b' % '|'.join(_VOLATILE_NAMES))
+
+
+class _Unencodable(Exception):
+  """
+  Raised internally for state that can't be included in a snapshot.
+  """
+  pass
+
+
+def _marshal_or_none(value):
+  """
+  Returns the marshalled representation of value, or None if value can't be marshalled.
+  """
+  try:
+    return marshal.dumps(value)
+  except ValueError:
+    return None
+
+
+def _is_volatile(engine, table_id, col_id):
+  """
+  Returns whether the formula of the given column may evaluate differently on open.
+  """
+  schema_table = engine.schema.get(table_id)
+  schema_col = schema_table and schema_table.columns.get(col_id)
+  return bool(schema_col and _volatile_re.search(schema_col.formula))
+
+
+def get_data_key(engine):
+  """
+  Returns a hash of all data (i.e. non-formula) columns in all tables of the engine. It serves to
+  check that a snapshot matches the data it gets loaded with.
+  """
+  digest = hashlib.sha1()
+  digest.update(marshal.dumps((SNAPSHOT_VERSION, schema.SCHEMA_VERSION)))
+  for table_id in sorted(engine.tables):
+    table = engine.tables[table_id]
+    row_ids = list(table.row_ids)
+    digest.update(marshal.dumps((table_id, row_ids)))
+    for col_id in sorted(table.all_columns):
+      col = table.all_columns[col_id]
+      if col.is_formula() or column.is_virtual_column(col_id):
+        continue
+      values = map(col.raw_get, row_ids)
+      data = _marshal_or_none(values)
+      if data is None:
+        data = marshal.dumps([objtypes.encode_object(v) for v in values])
+      digest.update(marshal.dumps(col_id))
+      digest.update(data)
+  return digest.hexdigest()
+
+
+class _RelationEncoder(object):
+  """
+  Encodes relations as entries in a list, so that relations shared among edges (and the state of
+  lookup relations) are only included once. Composed relations refer to the entries of their
+  parts, which always precede them in the list.
+  """
+  def __init__(self, engine, lookup_maps):
+    self._engine = engine
+    self._lookup_maps = lookup_maps
+    self._indices = {}
+    self.entries = []
+
+  def encode(self, rel):
+    """
+    Returns the index of the entry for the given relation, or raises _Unencodable.
+    """
+    index = self._indices.get(id(rel))
+    if index is None:
+      entry = self._make_entry(rel)
+      index = self._indices[id(rel)] = len(self.entries)
+      self.entries.append(entry)
+    return index
+
+  def rollback(self, count):
+    """
+    Forgets all entries after the first count, e.g. those added for a column that turned out not
+    to be encodable in full.
+    """
+    del self.entries[count:]
+    self._indices = {k: i for (k, i) in self._indices.iteritems() if i < count}
+
+  def _make_entry(self, rel):
+    # pylint: disable=unidiomatic-typecheck,protected-access
+    tables = self._engine.tables
+    if type(rel) is relation_module.IdentityRelation:
+      table = tables.get(rel.referring_table)
+      if table and rel is table._identity_relation:
+        return ('I', rel.referring_table)
+
+    elif type(rel) is relation_module.ReferenceRelation:
+      table = tables.get(rel.referring_table)
+      col_id = rel._ref_col_id
+      if table and table.has_column(col_id) and rel is table.get_column(col_id)._relation:
+        return ('R', rel.referring_table, col_id)
+
+    elif type(rel) is relation_module.ComposedRelation:
+      return ('C', self.encode(rel.source_relation), self.encode(rel.target_relation))
+
+    elif type(rel) is lookup._LookupRelation:
+      lookup_map = rel._lookup_map
+      node = rel._referring_node
+      if (lookup_map.node in self._lookup_maps and
+          lookup_map._lookup_relations.get(node) is rel):
+        items = [(row_id, list(keys)) for (row_id, keys) in rel._row_key_map.left_items()]
+        if _marshal_or_none(items) is not None:
+          return ('L', lookup_map.table_id, lookup_map._col_ids_tuple, tuple(node), items)
+
+    raise _Unencodable(str(rel))
+
+
+def _encode_lookup_map(lookup_map):
+  """
+  Returns the state of a LookupMapColumn for restore_dependencies(), or None if its keys can't all
+  be serialized.
+  """
+  # pylint: disable=protected-access
+  if type(lookup_map) is not lookup.LookupMapColumn:
+    # Other kinds of lookup maps (e.g. for range lookups) aren't included in snapshots.
+    return None
+  items = list(lookup_map._row_key_map.left_items())
+  if _marshal_or_none(items) is None:
+    return None
+  return (lookup_map.table_id, lookup_map._col_ids_tuple, items)
+
+
+def encode_dependencies(engine, nodes):
+  """
+  Returns the dependencies of the given nodes, including the state of lookup maps among them and
+  of the relations involved, as a marshallable value for restore_dependencies(). Returns None if
+  any of it can't be encoded.
+  """
+  lookup_maps = {}
+  for node in nodes:
+    col = engine.tables[node.table_id].all_columns.get(node.col_id)
+    if isinstance(col, lookup.LookupMapColumn):
+      lookup_maps[node] = _encode_lookup_map(col)
+      if lookup_maps[node] is None:
+        return None
+
+  encoder = _RelationEncoder(engine, lookup_maps)
+  edges = []
+  try:
+    for node in nodes:
+      for edge in engine.dep_graph.get_dependencies(node):
+        edges.append((tuple(node), tuple(edge.in_node), encoder.encode(edge.relation)))
+  except _Unencodable as e:
+    log.debug("dep_snapshot: can't encode dependencies of %s: %s" % (node, e))
+    return None
+
+  return {
+    'lookup_maps': [lookup_maps[node] for node in sorted(lookup_maps)],
+    'relations': encoder.entries,
+    'edges': edges,
+  }
+
+
+def restore_dependencies(engine, data):
+  """
+  Restores dependencies encoded by encode_dependencies() (or included in a snapshot). The state of
+  the lookup maps and lookup relations involved gets replaced, and the edges get added to the
+  dependency graph. Note that newly-created lookup maps are left in engine.recompute_map.
+  """
+  # pylint: disable=protected-access
+  for (table_id, col_ids, items) in data['lookup_maps']:
+    row_key_map = engine.tables[table_id]._get_lookup_map(col_ids)._row_key_map
+    row_key_map.clear()
+    for row_id, key in items:
+      row_key_map.insert(row_id, key)
+
+  relations = []
+  for entry in data['relations']:
+    kind = entry[0]
+    if kind == 'I':
+      rel = engine.tables[entry[1]]._identity_relation
+    elif kind == 'R':
+      rel = engine.tables[entry[1]].get_column(entry[2])._relation
+    elif kind == 'C':
+      rel = relations[entry[1]].compose(relations[entry[2]])
+    else:
+      (_, table_id, col_ids, referring_node, items) = entry
+      lookup_map = engine.tables[table_id]._get_lookup_map(col_ids)
+      rel = lookup_map._get_relation(depend.Node(*referring_node))
+      rel._row_key_map.clear()
+      for row_id, keys in items:
+        for key in keys:
+          rel._add_lookup(row_id, key)
+    relations.append(rel)
+
+  for (out_node, in_node, rel_index) in data['edges']:
+    engine.dep_graph.add_edge(depend.Node(*out_node), depend.Node(*in_node), relations[rel_index])
+
+
+def make_snapshot(engine):
+  """
+  Returns a snapshot of the engine's dependency graph and lookup maps, as a string which
+  load_snapshot() can restore after loading the same data into a new engine. Returns None if the
+  engine isn't up-to-date, since the snapshot must describe the stored formula values.
+  """
+  # pylint: disable=protected-access
+  if engine.recompute_map or engine._unused_lookups:
+    return None
+
+  # Lookup maps whose keys can all be serialized.
+  lookup_maps = {}
+  # Values of private formula columns, which don't get stored with the document.
+  private_values = []
+  # Formula columns which may be covered by the snapshot.
+  candidates = []
+  for table_id in sorted(engine.tables):
+    table = engine.tables[table_id]
+    row_ids = list(table.row_ids)
+    for col_id in sorted(table.all_columns):
+      col = table.all_columns[col_id]
+      if isinstance(col, lookup.LookupMapColumn):
+        state = _encode_lookup_map(col)
+        if state is not None:
+          lookup_maps[col.node] = state
+        continue
+      if not col.is_formula() or (column.is_virtual_column(col_id) and not col.is_private()):
+        continue
+      if _is_volatile(engine, table_id, col_id):
+        continue
+      # Values that don't survive being stored unchanged (such as errors, or records in an Any
+      # column) must be recomputed on open. Plain values are exactly the marshallable ones.
+      values = map(col.raw_get, row_ids)
+      if _marshal_or_none(values) is None:
+        continue
+      if col.is_private():
+        private_values.append((table_id, col_id, row_ids, values))
+      candidates.append(col.node)
+
+  # A formula column is covered by the snapshot if all relations it depends on can be encoded.
+  encoder = _RelationEncoder(engine, lookup_maps)
+  covered = []
+  edges = []
+  for node in sorted(lookup_maps) + candidates:
+    mark = len(encoder.entries)
+    try:
+      node_edges = [(tuple(edge.in_node), encoder.encode(edge.relation))
+                    for edge in engine.dep_graph.get_dependencies(node)]
+    except _Unencodable as e:
+      log.debug("dep_snapshot: not covering %s: %s" % (node, e))
+      encoder.rollback(mark)
+      continue
+    covered.append(tuple(node))
+    edges.extend((tuple(node), in_node, rel_index) for (in_node, rel_index) in node_edges)
+
+  covered_set = set(covered)
+  return marshal.dumps({
+    'version': SNAPSHOT_VERSION,
+    'key': get_data_key(engine),
+    'lookup_maps': [lookup_maps[node] for node in sorted(lookup_maps)],
+    'private_values': [v for v in private_values if (v[0], v[1]) in covered_set],
+    'relations': encoder.entries,
+    'edges': edges,
+    'covered': covered,
+  })
+
+
+def load_snapshot(engine, snapshot):
+  """
+  Restores a snapshot produced by make_snapshot(). Should be called after all tables have been
+  loaded, and before Engine.load_done(). Returns True if the snapshot got used, or False if it
+  doesn't match the loaded data (in which case everything gets recomputed as usual).
+  """
+  # pylint: disable=protected-access
+  try:
+    data = marshal.loads(snapshot)
+  except (ValueError, EOFError, TypeError):
+    return False
+  if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+    return False
+  if data['key'] != get_data_key(engine):
+    return False
+
+  for (table_id, col_id, row_ids, values) in data['private_values']:
+    col = engine.tables[table_id].get_column(col_id)
+    for row_id, value in zip(row_ids, values):
+      col.set(row_id, value)
+
+  restore_dependencies(engine, data)
+
+  for covered_node in data['covered']:
+    node = depend.Node(*covered_node)
+    engine.recompute_map.pop(node, None)
+    engine.dep_graph.forget_dirty(node)
+
+  # Whatever isn't covered gets recomputed, and may come out different from the stored values (e.g.
+  # errors, or volatile formulas), so the covered formulas that depend on it need recomputing too.
+  engine.dep_graph.invalidate_many([(node, rows, False) for (node, rows)
+                                    in engine.recompute_map.items()], engine.recompute_map)
+  return True
@@ -18,8 +18,10 @@ in use, while property access determines which Nodes (or columns) depend on one
 # for this (with computed values properly persisted) could allow some cool use cases, like columns
 # that recompute manually rather than automatically.
 
+import heapq
 from collections import namedtuple
-from sortedcontainers import SortedSet
+
+from rowset import RowSet
 
 class Node(namedtuple('Node', ('table_id', 'col_id'))):
   """
@@ -59,6 +61,12 @@ class _AllRows(object):
 
 ALL_ROWS = _AllRows()
 
+# When invalidation makes at least DENSE_MIN_ROWS rows of a formula column dirty, and they cover at
+# least DENSE_FRACTION of its table, the whole column gets recomputed instead (see
+# Graph.invalidate_many).
+DENSE_MIN_ROWS = 10000
+DENSE_FRACTION = 0.9
+
 class Graph(object):
   """
   Represents the dependency graph for all data in a grist document.
@@ -73,6 +81,10 @@ class Graph(object):
     # Map from node to the set of edges having it as the out_node (i.e. edges to dependencies).
     self._out_node_map = {}
 
+    # Nodes marked for recomputing in full only because most of their rows were dirty, whose
+    # dependents (unlike for ALL_ROWS in general) were only invalidated for the actual dirty rows.
+    self._dense_nodes = set()
+
   def dump_graph(self):
     """
     Print out the graph to stdout, for debugging.
@@ -91,6 +103,18 @@ class Graph(object):
     self._in_node_map.setdefault(edge.in_node, set()).add(edge)
     self._out_node_map.setdefault(edge.out_node, set()).add(edge)
 
+  def iter_edges(self):
+    """
+    Iterates through all the edges of the graph.
+    """
+    return iter(self._all_edges)
+
+  def get_dependencies(self, out_node):
+    """
+    Returns the set of edges which affect the given out_node, i.e. all of its dependencies.
+    """
+    return self._out_node_map.get(out_node, ())
+
   def clear_dependencies(self, out_node):
     """
     Removes all edges which affect the given out_node, i.e. all of its dependencies.
@@ -101,6 +125,13 @@ class Graph(object):
       self._in_node_map.get(edge.in_node, set()).remove(edge)
       edge.relation.reset_all()
 
+  def forget_dirty(self, node):
+    """
+    Should be called when the given node gets removed from recompute_map (e.g. once recomputed),
+    to forget what invalidate_many() remembers about how it got there.
+    """
+    self._dense_nodes.discard(node)
+
   def reset_dependencies(self, node, dirty_rows):
     """
     For edges the given node depends on, reset the given output rows. This is called just before
@@ -121,7 +152,8 @@ class Graph(object):
     self._in_node_map.pop(node, None)
     return True
 
-  def invalidate_deps(self, dirty_node, dirty_rows, recompute_map, include_self=True):
+  def invalidate_deps(self, dirty_node, dirty_rows, recompute_map, include_self=True,
+                      get_row_count=None):
     """
     Invalidates the given rows in the given node, and all of its dependents, i.e. all the nodes
     that recursively depend on dirty_node. If include_self is False, then skips the given node
@@ -130,26 +162,115 @@ class Graph(object):
 
     If dirty_rows is ALL_ROWS, the whole column is affected, and dependencies get recomputed from
     scratch. ALL_ROWS propagates to all dependent columns, so those also get recomputed in full.
+
+    See invalidate_many() for get_row_count.
     """
-    if include_self:
-      if recompute_map.get(dirty_node) == ALL_ROWS:
-        return
-      if dirty_rows == ALL_ROWS:
-        recompute_map[dirty_node] = ALL_ROWS
-        # If all rows are being recomputed, clear the dependencies of the affected column. (We add
-        # dependencies in the course of recomputing, but we can only start from an empty set of
-        # dependencies if we are about to recompute all rows.)
-        self.clear_dependencies(dirty_node)
+    self.invalidate_many([(dirty_node, dirty_rows, include_self)], recompute_map, get_row_count)
+
+  def invalidate_many(self, dirty_list, recompute_map, get_row_count=None):
+    """
+    Same as calling invalidate_deps() for each (dirty_node, dirty_rows, include_self) triple in
+    dirty_list, but faster when many nodes or rows are involved. The affected part of the graph is
+    visited in dependency order, so that each node collects its dirty rows from all the nodes it
+    depends on before passing them on to its own dependents (rather than once per path).
+
+    If get_row_count is given, it's called with a table_id to get the number of rows in that table
+    (or None if unknown). A dependent whose dirty rows come to cover nearly all of its table (see
+    DENSE_MIN_ROWS and DENSE_FRACTION) then gets marked with ALL_ROWS in recompute_map, to be
+    recomputed in full rather than keep a huge set of rows. Its own dependents still only get the
+    rows actually affected, since they may be in other tables where those are a small part.
+    """
+    # Maps nodes to the dirty rows (or ALL_ROWS) they still need to pass on to their dependents.
+    pending = {}
+
+    def add_rows(node, rows, include_self, allow_dense):
+      if include_self:
+        out_rows = recompute_map.get(node)
+        if out_rows == ALL_ROWS:
+          # Dependents of a node that's dirty in full are normally dirty in full too, except when it
+          # was only expanded to ALL_ROWS for being dense; then they still need the dirty rows.
+          if node not in self._dense_nodes:
+            return False
+        elif rows != ALL_ROWS:
+          if out_rows is None:
+            out_rows = recompute_map[node] = RowSet()
+          prev_count = len(out_rows)
+          out_rows.update(rows)
+          # Don't bother passing on rows if we didn't actually update anything.
+          if len(out_rows) <= prev_count:
+            return False
+          if allow_dense and is_dense(node, len(out_rows)):
+            # Unlike for ALL_ROWS below, the dependencies are kept, so that rows which get dirty
+            # later still reach this node, to be passed on to its dependents.
+            recompute_map[node] = ALL_ROWS
+            self._dense_nodes.add(node)
+        if rows == ALL_ROWS:
+          recompute_map[node] = ALL_ROWS
+          self._dense_nodes.discard(node)
+          # If all rows are being recomputed, clear the dependencies of the affected column. (We
+          # add dependencies in the course of recomputing, but we can only start from an empty set
+          # of dependencies if we are about to recompute all rows.)
+          self.clear_dependencies(node)
+
+      node_pending = pending.get(node)
+      if rows == ALL_ROWS or node_pending == ALL_ROWS:
+        pending[node] = ALL_ROWS
+      elif node_pending is None:
+        pending[node] = RowSet(rows)
       else:
-        out_rows = recompute_map.setdefault(dirty_node, SortedSet())
-        prev_count = len(out_rows)
-        out_rows.update(dirty_rows)
-        # Don't bother recursing into dependencies if we didn't actually update anything.
-        if len(out_rows) <= prev_count:
-          return
-
-    # Iterate through a copy of _in_node_map, because recursive clear_dependencies may modify it.
-    for edge in list(self._in_node_map.get(dirty_node, ())):
-      affected_rows = (ALL_ROWS if dirty_rows == ALL_ROWS else
-                       edge.relation.get_affected_rows(dirty_rows))
-      self.invalidate_deps(edge.out_node, affected_rows, recompute_map, include_self=True)
+        node_pending.update(rows)
+      return node_pending is None
+
+    def is_dense(node, count):
+      if get_row_count is None or count < DENSE_MIN_ROWS:
+        return False
+      row_count = get_row_count(node.table_id)
+      return row_count is not None and count >= row_count * DENSE_FRACTION
+
+    for (dirty_node, dirty_rows, include_self) in dirty_list:
+      add_rows(dirty_node, dirty_rows, include_self, allow_dense=False)
+    if not pending:
+      return
+
+    # Visit the nodes in dependency order, as far as there are no cycles. A node that gets more
+    # dirty rows after it's visited (which is only possible with cycles) is simply visited again.
+    rank = {node: i for (i, node) in enumerate(self._get_dependents_order(pending))}
+    queue = [(rank[node], node) for node in pending]
+    heapq.heapify(queue)
+    while queue:
+      node = heapq.heappop(queue)[1]
+      dirty_rows = pending.pop(node, None)
+      if dirty_rows is None:
+        continue
+      # Iterate through a copy of _in_node_map, because clear_dependencies may modify it.
+      for edge in list(self._in_node_map.get(node, ())):
+        affected_rows = (ALL_ROWS if dirty_rows == ALL_ROWS else
+                         edge.relation.get_affected_rows(dirty_rows))
+        if add_rows(edge.out_node, affected_rows, True, allow_dense=True):
+          heapq.heappush(queue, (rank[edge.out_node], edge.out_node))
+
+  def _get_dependents_order(self, nodes):
+    """
+    Returns a list of the given nodes and all nodes that depend on them, such that a node comes
+    before its dependents (unless they form a cycle).
+    """
+    visited = set()
+    postorder = []
+    for start_node in nodes:
+      if start_node in visited:
+        continue
+      visited.add(start_node)
+      # Iterative depth-first search, to avoid deep recursion on long chains of dependencies.
+      stack = [(start_node, iter(list(self._in_node_map.get(start_node, ()))))]
+      while stack:
+        node, edges = stack[-1]
+        for edge in edges:
+          if edge.out_node not in visited:
+            visited.add(edge.out_node)
+            stack.append((edge.out_node, iter(list(self._in_node_map.get(edge.out_node, ())))))
+            break
+        else:
+          stack.pop()
+          postorder.append(node)
+    postorder.reverse()
+    return postorder
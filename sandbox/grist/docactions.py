@@ -188,6 +188,10 @@ class DocActions(object):
     undo_col_info = {k: v for k, v in schema.col_to_dict(old, include_id=False).iteritems()
                      if k in col_info}
 
+    # The values of a data column turned into a formula get overwritten, so undo must restore them.
+    if new.isFormula and not old.isFormula:
+      self._engine.out_actions.summary.keep_undo_for_column(table_id, col_id)
+
     # Remove the column from the schema, then re-add it, to force creation of a new column object.
     schema_table_info.columns.pop(col_id)
     self._engine.rebuild_usercode()
@@ -5,28 +5,35 @@ dependency tracking.
 """
 import contextlib
 import itertools
+import operator
 import re
 import rlcompleter
 import sys
 import time
 import traceback
 from collections import namedtuple, OrderedDict, Hashable
-from sortedcontainers import SortedSet
 
 import acl
 import actions
 import action_obj
 from autocomplete_context import AutocompleteContext
+import codebuilder
 from codebuilder import DOLLAR_REGEX
+import dep_snapshot
 import depend
 import docactions
 import docmodel
 import gencode
+import group_aggregate
 import logger
 import match_counter
 import objtypes
 from objtypes import strict_equal
+import parallel_recompute
+import profiler
+from rowset import RowSet
 import schema
+import summary
 import table as table_module
 import useractions
 import column
@@ -58,6 +65,18 @@ class OrderError(Exception):
 # An item of work to be done by Engine._update
 WorkItem = namedtuple('WorkItem', ('node', 'row_ids', 'locks'))
 
+# Sentinel for a cell value that has not been computed.
+_NO_VALUE = object()
+
+# Matches identifiers in formulas, to find the tables which formulas mention.
+_IDENTIFIER_RE = re.compile(r'\w+')
+
+# Metadata tables whose changes modify the schema.
+_SCHEMA_META_TABLES = frozenset(['_grist_Tables', '_grist_Tables_column'])
+
+# The maximum number of Records that a ComputeFrame keeps for reuse (see Engine.make_record()).
+_MAX_FRAME_RECORDS = 1000
+
 # Returns an AddTable action which can be used to reproduce the given docmodel table
 def _get_table_actions(table):
   schema_cols = [schema.make_column(c.colId, c.type, formula=c.formula, isFormula=c.isFormula)
@@ -129,10 +148,17 @@ class Engine(object):
     ComputeFrames, because during computation we may access other out-of-date nodes, and need to
     recompute those first.
       compute_frame.current_row_id gets set to each record ID as we go through them.
+
+    A frame also caches what's repeated for each record: the last relation with which each node
+    was used (to skip checking for a dependency edge that's already recorded), and the Record
+    objects made for references while computing the current record (see make_record()).
     """
     def __init__(self, node):
       self.node = node
       self.current_row_id = None
+      self.used_relations = {}
+      self.edge_set = None
+      self.records = {}
 
 
   def __init__(self):
@@ -196,12 +222,43 @@ class Engine(object):
     # The list of columns that got deleted while applying an action.
     self._gone_columns = []
 
-    # The set of potentially unused LookupMapColumns.
+    # The set of potentially unused LookupMapColumns (and GroupAggregateColumns).
     self._unused_lookups = set()
 
-    # Create the formula tracer that can be overridden to trace formula evaluations. It is called
-    # with the Column and Record object for the formula about to be evaluated. It's used in tests.
-    self.formula_tracer = lambda col, record: None
+    # The formula tracer may be set to trace formula evaluations. It is called with the Column and
+    # Record object for the formula about to be evaluated. It's used in tests.
+    self.formula_tracer = None
+
+    # Maps formula text to codebuilder.BatchFormula, or to None for formulas that can't be
+    # evaluated in batch.
+    self._batch_formulas = {}
+
+    # Maps formula text to codebuilder.GroupAggregate, or to None for formulas that aren't simple
+    # aggregations over $group.
+    self._group_aggregates = {}
+
+    # The set of user tables whose loading was deferred using defer_table(). Such a table gets
+    # loaded, by calling deferred_table_loader(table_id) to get its TableData, the first time it's
+    # needed by a formula, a fetch, or a user action.
+    self._deferred_tables = set()
+    self.deferred_table_loader = None
+
+    # The active profiler.Profiler, when profiling is on (see start_profiling()).
+    self._profiler = None
+
+    # The number of worker processes to use for recomputing independent groups of tables in
+    # parallel (see parallel_recompute.py). With 0 or 1, everything gets recomputed serially.
+    self.recompute_workers = 0
+
+    # If set, undo actions aren't generated for the values of formula columns that change in
+    # recomputes, since applying the undo of the rest recomputes them anyway. This makes undo
+    # actions for large recalculations much smaller, but non-deterministic formulas (e.g. using
+    # NOW()) may produce different values on undo than before.
+    self.lazy_formula_undo = False
+
+    # Maps column objects to the sets of distinct values among their first rows, as used by
+    # find_col_from_values(). Cleared whenever any values may have changed.
+    self._col_value_sketches = {}
 
     # Create the object that knows how to interpret UserActions.
     self.doc_actions = docactions.DocActions(self)
@@ -254,6 +311,7 @@ class Engine(object):
     each user-defined table. The argument is an actions.TableData object.
     """
     table = self.tables[data.table_id]
+    self._col_value_sketches.clear()
 
     # Clear all columns, whether or not they are present in the data.
     for column in table.all_columns.itervalues():
@@ -266,12 +324,121 @@ class Engine(object):
     # Add the records.
     self.add_records(data.table_id, data.row_ids, columns)
 
+  def get_table_links(self):
+    """
+    Returns a dict mapping each table_id to the set of other tables whose data its formulas may
+    use directly, judging by the schema: tables mentioned in its formulas, the targets of its
+    Ref and RefList columns, and the source table of a summary table.
+    """
+    links = {}
+    for table_id, schema_table in self.schema.iteritems():
+      linked = links[table_id] = set()
+      for col in schema_table.columns.itervalues():
+        if col.formula:
+          linked.update(_IDENTIFIER_RE.findall(col.formula))
+        type_name, _, target_table_id = col.type.partition(':')
+        if type_name in ('Ref', 'RefList'):
+          linked.add(target_table_id)
+      source_table_id = summary.decode_summary_table_name(table_id)
+      if source_table_id:
+        linked.add(source_table_id)
+      linked.intersection_update(self.schema)
+      linked.discard(table_id)
+    return links
+
+  def get_back_references(self):
+    """
+    Returns a dict mapping table_ids to the sets of other tables with Ref or RefList columns
+    pointing to them. Those tables' references need updating when target records get removed.
+    """
+    back_refs = {table_id: set() for table_id in self.schema}
+    for table_id, schema_table in self.schema.iteritems():
+      for col in schema_table.columns.itervalues():
+        type_name, _, target_table_id = col.type.partition(':')
+        if type_name in ('Ref', 'RefList') and target_table_id in back_refs:
+          back_refs[target_table_id].add(table_id)
+    for table_id, referring in back_refs.iteritems():
+      referring.discard(table_id)
+    return back_refs
+
+  def get_unreferenced_tables(self):
+    """
+    Returns the sorted list of user tables which no formula may depend on: tables without formulas
+    of their own, which aren't mentioned in any formula, and which can't be reached by following
+    references or summaries from tables that have formulas, nor refer to tables that can. The
+    loading of such tables may be deferred with defer_table().
+    """
+    links = self.get_table_links()
+    back_refs = self.get_back_references()
+    needed = [table_id for (table_id, schema_table) in self.schema.iteritems()
+              if any(c.formula for c in schema_table.columns.itervalues())
+              or summary.decode_summary_table_name(table_id)]
+    reachable = set()
+    while needed:
+      table_id = needed.pop()
+      if table_id not in reachable:
+        reachable.add(table_id)
+        needed.extend(links[table_id])
+        # Tables referring to a loaded one must be loaded too, since removing records in it
+        # updates their references (see Table._back_references).
+        needed.extend(back_refs[table_id])
+
+    return sorted(t for t in self.schema if not t.startswith('_grist_') and t not in reachable)
+
+  def defer_table(self, table_id):
+    """
+    May be called instead of load_table() for a user table, to load its data only when it's first
+    needed. Requires deferred_table_loader to be set.
+    """
+    if self.deferred_table_loader is None:
+      raise ValueError("Can't defer loading of %s without a deferred_table_loader" % table_id)
+    if table_id not in self.tables:
+      raise ValueError("Can't defer loading of unknown table %s" % table_id)
+    self._deferred_tables.add(table_id)
+
+  def _load_deferred_tables(self, table_ids):
+    """
+    Loads those of the given tables whose loading was deferred, along with any deferred tables
+    which refer to them.
+    """
+    table_ids = self._deferred_tables.intersection(table_ids)
+    if not table_ids:
+      return
+    back_refs = self.get_back_references()
+    pending = list(table_ids)
+    while pending:
+      for table_id in back_refs.get(pending.pop(), ()):
+        if table_id in self._deferred_tables and table_id not in table_ids:
+          table_ids.add(table_id)
+          pending.append(table_id)
+
+    for table_id in sorted(table_ids):
+      self._deferred_tables.discard(table_id)
+      log.info("Loading deferred table %s" % table_id)
+      self.load_table(self.deferred_table_loader(table_id))
+
   def load_done(self):
     """
     Finalizes the loading of data into this Engine.
     """
     self._bring_all_up_to_date()
 
+  def fetch_dependency_snapshot(self):
+    """
+    Returns a snapshot (as a string) of the dependency graph and lookup maps, which may be saved
+    alongside the document and passed to load_dependency_snapshot() when it's next opened.
+    Returns None if no snapshot is currently available. See dep_snapshot.py.
+    """
+    return dep_snapshot.make_snapshot(self)
+
+  def load_dependency_snapshot(self, snapshot):
+    """
+    May be called after all load_table() calls and before load_done(), with a snapshot saved from
+    fetch_dependency_snapshot(), to avoid recomputing formulas whose dependencies it describes.
+    Returns whether the snapshot got used; it's ignored if it doesn't match the loaded data.
+    """
+    return dep_snapshot.load_snapshot(self, snapshot)
+
   def add_records(self, table_id, row_ids, column_values):
     """
     Helper to add records to the given table, with row_ids and column_values having the same
@@ -301,28 +468,64 @@ class Engine(object):
     # Invalidate new records to cause the formula columns to get recomputed.
     self.invalidate_records(table_id, row_ids)
 
-  def fetch_table(self, table_id, formulas=True, private=False, query=None):
+  def fetch_table(self, table_id, formulas=True, private=False, query=None, col_ids=None,
+                  start_row_id=None, limit=None):
     """
-    Returns TableData object representing all data in this table.
+    Returns TableData object representing all data in this table. The result may be limited to:
+      - rows matching `query`, a dict mapping col_ids to lists of acceptable values;
+      - the columns listed in `col_ids`;
+      - at most `limit` rows, starting with `start_row_id`. A large table may be fetched in chunks
+        by starting each chunk after the last row of the previous one.
     """
+    if table_id in self._deferred_tables:
+      self._load_deferred_tables([table_id])
     table = self.tables[table_id]
     column_values = {}
 
-    query_cols = []
-    if query:
-      query_cols = [(table.get_column(col_id), values) for (col_id, values) in query.iteritems()]
-    row_ids = [r for r in table.row_ids
-               if all((c.raw_get(r) in values) for (c, values) in query_cols)]
+    row_ids = self._query_row_ids(table, query, start_row_id or 0)
+    if limit is not None:
+      row_ids = itertools.islice(row_ids, limit)
+    row_ids = list(row_ids)
 
+    if col_ids is not None:
+      col_ids = set(col_ids)
     for c in table.all_columns.itervalues():
       # pylint: disable=too-many-boolean-expressions
       if ((formulas or not c.is_formula())
           and (private or not c.is_private())
+          and (col_ids is None or c.col_id in col_ids)
           and c.col_id != "id" and not column.is_virtual_column(c.col_id)):
         column_values[c.col_id] = map(c.raw_get, row_ids)
 
     return actions.TableData(table_id, row_ids, column_values)
 
+  def _query_row_ids(self, table, query, start_row_id):
+    """
+    Returns an iterable over the row_ids of the table, starting with start_row_id, whose values
+    match the query (as for fetch_table). Uses a column's index to find matches where available.
+    """
+    query_cols = []
+    for col_id, values in (query or {}).iteritems():
+      try:
+        values = set(values)
+      except TypeError:
+        pass
+      query_cols.append((table.get_column(col_id), values))
+
+    row_ids = None
+    for i, (col, values) in enumerate(query_cols):
+      matches = col.lookup_raw_values(values)
+      if matches is not None:
+        row_ids = sorted(r for r in matches if r >= start_row_id)
+        del query_cols[i]
+        break
+    if row_ids is None:
+      row_ids = table.row_ids.iter_from(start_row_id)
+
+    if not query_cols:
+      return row_ids
+    return (r for r in row_ids if all((c.raw_get(r) in values) for (c, values) in query_cols))
+
   def fetch_table_schema(self):
     return self.gencode.get_user_text()
 
@@ -349,6 +552,7 @@ class Engine(object):
     """
     Returns a list of action objects which recreate the document database when applied.
     """
+    self._load_deferred_tables(list(self._deferred_tables))
     schema_actions = schema.schema_create_actions()
     table_actions = [_get_table_actions(table) for table in self.docmodel.tables.all]
     record_actions = [self._get_record_actions(table_id) for (table_id,t) in self.tables.iteritems()
@@ -379,6 +583,9 @@ class Engine(object):
     if not sample:
       return []
 
+    self._load_deferred_tables([opt_table_id] if opt_table_id in self.tables
+                               else list(self._deferred_tables))
+
     search_cols = (self.docmodel.get_table_rec(opt_table_id).columns
                    if opt_table_id in self.tables else self.docmodel.columns.all)
 
@@ -390,7 +597,11 @@ class Engine(object):
           not c.type.startswith('Ref')):
         table = self.tables[c.tableId]
         col = table.get_column(c.colId)
-        matches = m.count_unique(col.raw_get(r) for r in itertools.islice(table.row_ids, 1000))
+        sketch = self._col_value_sketches.get(col)
+        if sketch is None:
+          sketch = self._col_value_sketches[col] = match_counter.distinct_values(
+            col.raw_get(r) for r in itertools.islice(table.row_ids, 1000))
+        matches = m.count_distinct(sketch)
         if matches > 0:
           matched_cols.append((matches, c.id))
 
@@ -460,6 +671,24 @@ class Engine(object):
     finally:
       self._compute_stack.pop()
 
+  def make_record(self, table, row_id, relation):
+    """
+    Returns a Record for the given row of the given table, obtained via the given relation. While a
+    formula is being computed, a Record made for the same row and relation gets reused, since
+    formulas that follow references tend to make the same ones over and over.
+    """
+    if not self._compute_stack:
+      return table.Record(table, row_id, relation)
+    records = self._compute_stack[-1].records
+    key = (relation, row_id)
+    record = records.get(key)
+    if record is None:
+      if len(records) >= _MAX_FRAME_RECORDS:
+        # The cache is reset for each record computed, but keep it bounded regardless.
+        records.clear()
+      record = records[key] = table.Record(table, row_id, relation)
+    return record
+
   def get_current_frame(self):
     """
     Returns the compute frame currently being computed, or None if there isn't one.
@@ -469,16 +698,25 @@ class Engine(object):
   def _use_node(self, node, relation, row_ids=[]):
     # This is used whenever a formula accesses any part of any record. It's hot code, and
     # it's worth optimizing.
+    if self._deferred_tables and node.table_id in self._deferred_tables:
+      self._load_deferred_tables([node.table_id])
 
-    if self._compute_stack and self._compute_stack[-1].node:
+    frame = self._compute_stack[-1] if self._compute_stack else None
+    if frame and frame.node:
       # Add an edge to indicate that the node being computed depends on the node passed in.
       # Note that during evaluation, we only *add* dependencies. We *remove* them by clearing them
       # whenever ALL rows for a node are invalidated (on schema changes and reloads).
-      current_node = self._compute_stack[-1].node
-      edge = (current_node, node, relation)
-      if edge not in self._recompute_edge_set:
-        self.dep_graph.add_edge(*edge)
-        self._recompute_edge_set.add(edge)
+      # The frame remembers the last relation used with each node, which saves building and
+      # looking up the edge when a formula uses the same node the same way for every record.
+      if frame.edge_set is not self._recompute_edge_set:
+        frame.used_relations.clear()
+        frame.edge_set = self._recompute_edge_set
+      if frame.used_relations.get(node) is not relation:
+        frame.used_relations[node] = relation
+        edge = (frame.node, node, relation)
+        if edge not in self._recompute_edge_set:
+          self.dep_graph.add_edge(*edge)
+          self._recompute_edge_set.add(edge)
 
     # This check is not essential here, but is an optimization that saves cycles.
     if self.recompute_map.get(node) is None:
@@ -508,7 +746,11 @@ class Engine(object):
       col = table.get_column(node.col_id)
       # If there are changes, save them in out_actions.
       if changes and not col.is_private():
-        self.out_actions.summary.add_changes(node.table_id, node.col_id, changes)
+        # Changes are recomputable if the column was a formula column before this bundle; if it
+        # was converted from data, ActionSummary knows to keep undo actions for it.
+        self.out_actions.summary.add_changes(
+          node.table_id, node.col_id, changes,
+          recomputable=(self.lazy_formula_undo and col.is_formula()))
 
     self._pre_update()  # empty lists/sets/maps
 
@@ -548,8 +790,13 @@ class Engine(object):
       while work_items:
         node, row_ids, locks = work_items.pop()
         try:
-          self._recompute_step(node, require_rows=row_ids)
+          if self._profiler:
+            self._profiled_recompute_step(node, row_ids)
+          else:
+            self._recompute_step(node, require_rows=row_ids)
         except OrderError as e:
+          if self._profiler:
+            self._profiler.record_reorder(node)
           # Need to schedule re-ordered evaluation
           assert node == e.requiring_node
           assert (not row_ids) or (e.requiring_row_id in row_ids)
@@ -586,8 +833,11 @@ class Engine(object):
   def _bring_all_up_to_date(self):
     # Bring all nodes up to date. We iterate in sorted order of the keys so that the order is
     # deterministic (which is helpful for tests in particular).
+    self._col_value_sketches.clear()
     self._pre_update()
     try:
+      if self.recompute_workers > 1:
+        parallel_recompute.recompute_in_workers(self, self.recompute_workers)
       # Figure out remaining work to do, maintaining classic Grist ordering.
       nodes = sorted(self.recompute_map.keys(), reverse=True)
       work_items = [WorkItem(node, None, []) for node in nodes]
@@ -600,6 +850,19 @@ class Engine(object):
       self._unused_lookups.clear()
       self._post_update()
 
+  def _recompute_tables(self, table_ids):
+    """
+    Brings the formulas of the given tables up to date, leaving other dirty nodes alone. It's only
+    useful for a group of tables whose formulas don't depend on anything else.
+    """
+    while True:
+      nodes = sorted((n for n in self.recompute_map if n.table_id in table_ids), reverse=True)
+      if not nodes:
+        break
+      self._update_loop([WorkItem(node, None, []) for node in nodes], ignore_other_changes=True)
+      if self._recompute_done_counter == 0:
+        raise Exception('data engine not making progress updating formulas')
+
   def _bring_lookups_up_to_date(self, triggering_doc_action):
     # Just bring the lookup nodes up to date. This is part of a somewhat hacky solution in
     # apply_doc_action: lookup nodes don't know exactly what depends on them until they are
@@ -661,6 +924,28 @@ class Engine(object):
       # processed (e.g. don't get applied to DocStorage), so it's important to reverse them.
       self._undo_to_checkpoint(checkpoint)
 
+  def start_profiling(self):
+    """
+    Starts collecting statistics about formula evaluation for each column, discarding any collected
+    so far. See profiler.py.
+    """
+    self._profiler = profiler.Profiler()
+
+  def stop_profiling(self):
+    """
+    Stops collecting statistics about formula evaluation, and returns the final report.
+    """
+    report = self.get_profile()
+    self._profiler = None
+    return report
+
+  def get_profile(self, limit=None):
+    """
+    Returns the statistics collected since start_profiling(), as a list of dicts, one per column,
+    with the columns taking the most time first. Returns an empty list if profiling is off.
+    """
+    return self._profiler.get_report(limit) if self._profiler else []
+
   def _recompute(self, node, row_ids=None):
     """
     Make sure cells of a node are up to date, recomputing as necessary.  Can optionally
@@ -678,6 +963,20 @@ class Engine(object):
       self._update_loop([WorkItem(node, row_ids, [])], ignore_other_changes=True)
 
 
+  def _profiled_recompute_step(self, node, require_rows):
+    """
+    Same as _recompute_step(), but reports the time spent and the cells evaluated and changed to
+    the active profiler.
+    """
+    cells_done = len(self._recompute_done_map.get(node, ()))
+    changed = len(self._changes_map.get(node, ()))
+    self._profiler.start_step(node, cells_done)
+    try:
+      self._recompute_step(node, require_rows=require_rows)
+    finally:
+      self._profiler.end_step(len(self._recompute_done_map.get(node, ())),
+                              len(self._changes_map.get(node, ())) - changed)
+
   def _recompute_step(self, node, allow_evaluation=True, require_rows=None): # pylint: disable=too-many-statements
     """
     Recomputes a node (i.e. column), evaluating the appropriate formula for the given rows
@@ -710,11 +1009,12 @@ class Engine(object):
       # used for lookups, so that we can reset stored lookup
       # information for rows that are about to get reevaluated.
       self.dep_graph.reset_dependencies(node, dirty_rows)
-      self._recompute_done_map[node] = set()
+      self._recompute_done_map[node] = RowSet()
 
     exclude = self._recompute_done_map[node]
     if dirty_rows == depend.ALL_ROWS:
-      dirty_rows = SortedSet(r for r in table.row_ids if r not in exclude)
+      dirty_rows = RowSet(table.row_ids)
+      dirty_rows.difference_update(exclude)
       self.recompute_map[node] = dirty_rows
     require_rows = sorted(require_rows or [])
 
@@ -726,6 +1026,17 @@ class Engine(object):
     cleaned = []    # this lists row_ids that can be removed from dirty_rows once we are no
                     # longer iterating on it.
     with self.open_compute_frame(formula_node) as frame:
+      # For simple formulas, compute all the dirty rows in one batch. Any rows it couldn't handle
+      # (e.g. if the formula raises an exception) are evaluated one cell at a time below.
+      batch_values = None
+      if allow_evaluation and formula_node:
+        if isinstance(col, group_aggregate.GroupAggregateColumn):
+          # This doesn't evaluate user formulas, so is safe regardless of the evaluation order.
+          batch_values = self._group_aggregate_update(table, col, dirty_rows, exclude)
+        elif not require_rows and not self._locked_cells:
+          batch_values = (self._group_aggregate_recompute(table, col, dirty_rows, exclude) or
+                          self._batch_recompute(table, col, dirty_rows, exclude))
+
       try:
         require_count = len(require_rows)
         for i, row_id in enumerate(itertools.chain(require_rows, dirty_rows)):
@@ -755,7 +1066,9 @@ class Engine(object):
             # We figure out if we've hit a cycle here.  If so, we just let _recompute_on_cell
             # know, so it can set the cell value appropriately and do some other bookkeeping.
             cycle = required and (node, row_id) in self._locked_cells
-            value = self._recompute_one_cell(frame, table, col, row_id, cycle=cycle, node=node)
+            value = batch_values.pop(row_id, _NO_VALUE) if batch_values else _NO_VALUE
+            if value is _NO_VALUE:
+              value = self._recompute_one_cell(frame, table, col, row_id, cycle=cycle, node=node)
           except OrderError as e:
             if not required:
               # We're out of order, but for a cell we were evaluating opportunistically.
@@ -803,11 +1116,150 @@ class Engine(object):
           dirty_rows = None
 
       finally:
-        for row_id in cleaned:
+        if cleaned:
           # this modifies self.recompute_map[node], to which dirty_rows is a reference
-          dirty_rows.discard(row_id)
+          dirty_rows.difference_update(cleaned)
         if not dirty_rows:
           self.recompute_map.pop(node)
+          self.dep_graph.forget_dirty(node)
+
+  def _get_batch_formula(self, table, col):
+    """
+    Returns the codebuilder.BatchFormula for the given formula column, or None if its formula
+    isn't simple enough to be evaluated in batch.
+    """
+    schema_table = self.schema.get(table.table_id)
+    schema_col = schema_table and schema_table.columns.get(col.col_id)
+    if not schema_col or not schema_col.isFormula:
+      return None
+    formula = schema_col.formula
+    if formula not in self._batch_formulas:
+      self._batch_formulas[formula] = codebuilder.make_batch_formula(formula)
+    return self._batch_formulas[formula]
+
+  def _batch_recompute(self, table, col, dirty_rows, exclude):
+    """
+    Evaluates the formula of a formula column for all of dirty_rows (except those in exclude) in
+    one pass, if the formula is a simple expression over fields of the same record, such as
+    `$A * $B`. Column values go in as lists, and no Record objects, undo checkpoints, or
+    dependency checks are needed per cell.
+
+    Returns a dict mapping row_id to computed value, which only includes rows for which
+    evaluation succeeded: values with errors or of wrong type, and exceptions raised by the
+    formula, are left for the usual per-cell evaluation to handle. Returns None if the formula
+    isn't suitable, or if any of the fields it uses are not up-to-date.
+    """
+    batch_formula = self._get_batch_formula(table, col)
+    if not batch_formula:
+      return None
+
+    dep_cols = []
+    for col_id in batch_formula.col_ids:
+      dep_col = table.all_columns.get(col_id)
+      # Dirty dependencies would need to be computed first, which the per-cell evaluation knows
+      # how to arrange.
+      if dep_col is None or dep_col.node in self.recompute_map:
+        return None
+      dep_cols.append(dep_col)
+
+    row_ids = [r for r in dirty_rows if r in table.row_ids and r not in exclude]
+    arg_lists = []
+    for dep_col in dep_cols:
+      values = dep_col.get_plain_cell_values(row_ids, _NO_VALUE)
+      if values is None:
+        return None
+      arg_lists.append(values)
+
+    # Create the same dependencies that evaluating the formula for each record would create.
+    for dep_col in dep_cols:
+      self._use_node(dep_col.node, table._identity_relation)
+
+    func = batch_formula.func
+    results = {}
+    all_args = itertools.izip(*arg_lists) if arg_lists else itertools.repeat(())
+    for row_id, args in itertools.izip(row_ids, all_args):
+      if _NO_VALUE in args:
+        continue
+      try:
+        results[row_id] = func(*args)
+      except Exception:   # pylint: disable=broad-except
+        continue
+      if self.formula_tracer:
+        self.formula_tracer(col, table.Record(table, row_id, table._identity_relation))
+    return results
+
+  def _group_aggregate_recompute(self, table, col, dirty_rows, exclude):
+    """
+    For a summary table formula that's a simple aggregation over $group, like `SUM($group.Amount)`
+    or `len($group)`, gets the values for all of dirty_rows (except those in exclude) from the
+    running totals maintained by a GroupAggregateColumn on the source table, rather than by
+    iterating through the records of each group.
+
+    Returns a dict mapping row_id to value, which only includes rows whose values are known (see
+    group_aggregate.py); others are left for the usual per-cell evaluation. Returns None if the
+    formula isn't suitable. May raise OrderError if the totals aren't up-to-date.
+    """
+    source_table = table._summary_source_table
+    if not source_table:
+      return None
+    schema_table = self.schema.get(table.table_id)
+    schema_col = schema_table and schema_table.columns.get(col.col_id)
+    group_col = schema_table and schema_table.columns.get('group')
+    if not (schema_col and schema_col.isFormula and group_col and
+            group_col.formula == 'table.getSummarySourceGroup(rec)'):
+      return None
+
+    formula = schema_col.formula
+    if formula not in self._group_aggregates:
+      self._group_aggregates[formula] = codebuilder.parse_group_aggregate(formula)
+    aggregate = self._group_aggregates[formula]
+    if not aggregate or (aggregate.col_id and not source_table.has_column(aggregate.col_id)):
+      return None
+
+    row_ids = [r for r in dirty_rows if r in table.row_ids and r not in exclude]
+    if not row_ids:
+      return None
+
+    aggregate_col = source_table._get_group_aggregate(table, aggregate.col_id,
+                                                      ordered=aggregate.func in ('MIN', 'MAX'))
+    try:
+      # This creates the dependency on the totals, and brings them up-to-date.
+      self._use_node(aggregate_col.node, aggregate_col.get_relation(col.node))
+    except OrderError as e:
+      # The totals need to be computed first; _update_loop will get back to us after that.
+      self._cell_required_error = None
+      e.requiring_node = col.node
+      e.requiring_row_id = row_ids[0]
+      raise e
+
+    results = {}
+    for row_id in row_ids:
+      value = aggregate_col.get_result(aggregate.func, row_id)
+      if value is not None:
+        results[row_id] = value
+        if self.formula_tracer:
+          self.formula_tracer(col, table.Record(table, row_id, table._identity_relation))
+    return results
+
+  def _group_aggregate_update(self, table, col, dirty_rows, exclude):
+    """
+    Brings the running totals of a GroupAggregateColumn up-to-date for all of dirty_rows (except
+    those in exclude) in one pass. Returns a dict mapping each processed row_id to None (the value
+    of such a column), or None if the source columns are not up-to-date, in which case the rows
+    get processed one cell at a time.
+    """
+    input_cols = col.get_input_columns()
+    if not input_cols or any(c.node in self.recompute_map for c in input_cols):
+      return None
+
+    row_ids = [r for r in dirty_rows if r in table.row_ids and r not in exclude]
+    for input_col in input_cols:
+      self._use_node(input_col.node, table._identity_relation)
+    col.update_rows(row_ids)
+    if self.formula_tracer:
+      for row_id in row_ids:
+        self.formula_tracer(col, table.Record(table, row_id, table._identity_relation))
+    return dict.fromkeys(row_ids)
 
   def _recompute_one_cell(self, frame, table, col, row_id, cycle=False, node=None):
     """
@@ -819,6 +1271,7 @@ class Engine(object):
     """
     if frame:
       frame.current_row_id = row_id
+      frame.records.clear()
 
     # Baffling, but keeping a reference to current generated "usercode" module protects against a
     # seeming garbage-collection bug: if during formula evaluation the module gets regenerated
@@ -835,7 +1288,8 @@ class Engine(object):
       result = col.method(record, table.user_table)
       if self._cell_required_error:
         raise self._cell_required_error  # pylint: disable=raising-bad-type
-      self.formula_tracer(col, record)
+      if self.formula_tracer:
+        self.formula_tracer(col, record)
       return result
     except:  # pylint: disable=bare-except
       # Since col.method runs untrusted user code, we use a bare except to catch all
@@ -858,7 +1312,8 @@ class Engine(object):
         self._cell_required_error = None
         raise order_error  # pylint: disable=raising-bad-type
 
-      self.formula_tracer(col, record)
+      if self.formula_tracer:
+        self.formula_tracer(col, record)
 
       include_details = (node not in self._is_node_exception_reported) if node else True
       return objtypes.RaisedException(regular_error, include_details)
@@ -874,7 +1329,7 @@ class Engine(object):
     extra_actions = []
     for col_id, values in column_values.iteritems():
       col_obj = table.get_column(col_id)
-      values = [col_obj.convert(val) for val in values]
+      values = col_obj.convert_list(values)
 
       # If there are values for any PositionNumber columns, ensure PositionNumbers are ordered as
       # intended but are all unique, which may require updating other positions.
@@ -917,28 +1372,29 @@ class Engine(object):
     table_id, row_ids, column_values = action
     table = self.tables[action.table_id]
 
-    # Collect for each column the Column object and a list of new values.
-    cols = [(table.get_column(col_id), values) for (col_id, values) in column_values.iteritems()]
-
     # In comparisons below, we rely here on Python's "==" operator to check for equality. After a
     # type conversion, it may compare the new type to the old, e.g. 1 == 1.0 == True. It's
     # important that such equality is acceptable also to JS and to DocStorage. So far, it seems
     # just right.
 
-    # Find columns for which any value actually changed.
-    cols = [(col_obj, values) for (col_obj, values) in cols
-            if any(values[i] != col_obj.raw_get(row_id) for (i, row_id) in enumerate(row_ids))]
-
-    # Now find the indices of rows for which any value actually changed from what's in its Column.
-    row_subset = [i for i, row_id in enumerate(row_ids)
-                  if any(values[i] != col_obj.raw_get(row_id) for (col_obj, values) in cols)]
-
-    # Create and return a new action with just the selected subset of rows.
+    # In one pass over each column, find the indices of values that actually changed from what's
+    # in the Column, and keep only columns with any changes.
+    cols = {}
+    changed_indices = set()
+    for col_id, values in column_values.iteritems():
+      old_values = map(table.get_column(col_id).raw_get, row_ids)
+      indices = list(itertools.compress(xrange(len(row_ids)),
+                                        itertools.imap(operator.ne, values, old_values)))
+      if indices:
+        cols[col_id] = values
+        changed_indices.update(indices)
+
+    # Create and return a new action with just the rows for which any value changed.
+    row_subset = sorted(changed_indices)
     return actions.BulkUpdateRecord(
       action.table_id,
       [row_ids[i] for i in row_subset],
-      {col_obj.col_id: [values[i] for i in row_subset]
-       for (col_obj, values) in cols}
+      {col_id: [values[i] for i in row_subset] for (col_id, values) in cols.iteritems()}
     )
 
   def eval_user_code(self, src):
@@ -960,17 +1416,31 @@ class Engine(object):
     table = self.tables[table_id]
     columns = (table.all_columns.values()
                if col_ids is None else [table.get_column(c) for c in col_ids])
-    for column in columns:
-      # If data_cols_to_recompute includes this column, compute its default formula. This
-      # flag is set on AddRecord and BulkAddRecord, when a default formula needs to be computed.
-      self.invalidate_column(column, row_ids, column.col_id in data_cols_to_recompute)
+    # If data_cols_to_recompute includes a column, compute its default formula. This flag is set on
+    # AddRecord and BulkAddRecord, when a default formula needs to be computed.
+    self.dep_graph.invalidate_many(
+      [(col.node, row_ids, self._should_recompute_column(col, col.col_id in data_cols_to_recompute))
+       for col in columns],
+      self.recompute_map, get_row_count=self._get_row_count)
 
   def invalidate_column(self, col_obj, row_ids=depend.ALL_ROWS, recompute_data_col=False):
+    self.dep_graph.invalidate_deps(col_obj.node, row_ids, self.recompute_map,
+                                   include_self=self._should_recompute_column(col_obj,
+                                                                              recompute_data_col),
+                                   get_row_count=self._get_row_count)
+
+  def _should_recompute_column(self, col_obj, recompute_data_col):
     # Normally, only formula columns use include_self (to recompute themselves). However, if
     # recompute_data_col is set, default formulas will also be computed.
-    include_self = col_obj.is_formula() or (col_obj.has_formula() and recompute_data_col)
-    self.dep_graph.invalidate_deps(col_obj.node, row_ids, self.recompute_map,
-                                   include_self=include_self)
+    return col_obj.is_formula() or (col_obj.has_formula() and recompute_data_col)
+
+  def _get_row_count(self, table_id):
+    """
+    Returns the approximate number of rows in the given table (the highest row_id, which counts
+    deleted rows too), or None if the table doesn't exist.
+    """
+    table = self.tables.get(table_id)
+    return table.row_ids.max() if table else None
 
   def rebuild_usercode(self):
     """
@@ -988,8 +1458,20 @@ class Engine(object):
       if isinstance(user_table, table_module.UserTable):
         self.tables[table_id] = (old_tables.get(table_id) or table_module.Table(table_id, self))
 
-    # Now update the table model for each table, and tie it to its UserTable object.
+    # The usercode module is updated in place, so tables whose code didn't change keep the same
+    # UserTable, and don't need updating, unless they are summary tables whose source table
+    # changed (or got added or removed).
+    changed_table_ids = {table_id for (table_id, table) in self.tables.iteritems()
+                         if table.user_table is not getattr(self.gencode.usercode, table_id)}
+    changed_table_ids.update(old_tables.viewkeys() - self.tables.viewkeys())
+    changed_table_ids.update(
+      table_id for table_id in self.tables
+      if summary.decode_summary_table_name(table_id) in changed_table_ids)
+
+    # Now update the table model for each changed table, and tie it to its UserTable object.
     for table_id, table in self.tables.iteritems():
+      if table_id not in changed_table_ids:
+        continue
       user_table = getattr(self.gencode.usercode, table_id)
       self._update_table_model(table, user_table)
       user_table._set_table_impl(table)
@@ -1011,6 +1493,10 @@ class Engine(object):
     # Update the context used for autocompletions.
     self._autocomplete_context = AutocompleteContext(self.gencode.usercode.__dict__)
 
+    # Formulas may now depend on tables whose loading was deferred (e.g. a new summary table).
+    if self._deferred_tables:
+      self._load_deferred_tables(self._deferred_tables - set(self.get_unreferenced_tables()))
+
 
   def _update_table_model(self, table, user_table):
     """
@@ -1057,6 +1543,7 @@ class Engine(object):
     self.invalidate_column(col_obj)
     # Remove reference to the column from the recompute_map.
     self.recompute_map.pop(col_obj.node, None)
+    self.dep_graph.forget_dirty(col_obj.node)
     # Mark the column to be destroyed at the end of applying this docaction.
     self._gone_columns.append(col_obj)
 
@@ -1141,8 +1628,29 @@ class Engine(object):
     A UserAction is a tuple whose first element is the name of the action.
     """
     log.debug("applying user_action %s" % (user_action,))
+    if self._deferred_tables:
+      self._load_deferred_tables(self._get_tables_touched(user_action))
     return getattr(self.user_actions, user_action.__class__.__name__)(*user_action)
 
+  def _get_tables_touched(self, user_action):
+    """
+    Returns the deferred tables which the given user action may read or modify: those named in
+    its arguments (including in nested actions), or all of them if it modifies the schema through
+    metadata.
+    """
+    touched = set()
+    pending = [user_action]
+    while pending:
+      for value in pending.pop():
+        if isinstance(value, basestring):
+          if value in _SCHEMA_META_TABLES:
+            return self._deferred_tables
+          if value in self._deferred_tables:
+            touched.add(value)
+        elif isinstance(value, (list, tuple)):
+          pending.append(value)
+    return touched
+
   def apply_doc_action(self, doc_action):
     """
     Applies a doc action, which is a step of a user action. It is represented by an Action object
@@ -1150,6 +1658,9 @@ class Engine(object):
     """
     #log.warn("Engine.apply_doc_action %s" % (doc_action,))
     self._gone_columns = []
+    self._col_value_sketches.clear()
+    if self._deferred_tables:
+      self._load_deferred_tables([doc_action[0]])
 
     action_name = doc_action.__class__.__name__
     saved_schema = None
@@ -0,0 +1,137 @@
+"""
+An on-disk cache of the work of turning formulas into code, which persists across sandbox restarts.
+
+Generating the usercode module involves parsing every formula (see
+codebuilder.transform_formula()). For a document with thousands of formulas, that's a large part
+of the time it takes to open it, and the result is nearly always the same as the last time the
+document was opened.
+
+FormulaCache keeps the transforms of formulas, keyed by formula text, in a single JSON file that's
+loaded when the cache is created, and saved when new formulas get added. Only transforms of kind
+'patches' get cached; the others are cheap to produce or rare.
+
+The cache directory may be shared by documents, and so may be writable by formula code of any of
+them. For that reason, it holds no code: the usercode module is compiled every time, the file is
+read as JSON rather than unmarshalled, and cached patches are only accepted if each one inserts
+one of the few snippets that transform_formula() produces, at a place in the formula that
+matches, and the resulting formula compiles. A tampered entry is ignored and the formula gets
+parsed again.
+
+The cache is versioned by codebuilder.TRANSFORM_VERSION, and whatever doesn't match (or can't be
+read) is ignored. The file is replaced atomically, so that several sandboxes may share a cache
+directory.
+"""
+import json
+import os
+import re
+import tempfile
+
+import codebuilder
+
+import logger
+log = logger.Logger(__name__, logger.INFO)
+
+# Identifies the format and the versions of what's stored, to ignore files from other versions.
+CACHE_VERSION = [2, codebuilder.TRANSFORM_VERSION]
+
+# The maximum number of formula transforms to keep; beyond that, only the ones used get saved.
+MAX_FORMULAS = 100000
+
+_FORMULAS_FILE = "formulas.json"
+
+# The (old_text, new_text) pairs of all the patches that transform_formula() creates.
+_VALID_PATCH_TEXTS = frozenset([
+  (u'$', u'rec.'),
+  (u'', u'lambda: ('),
+  (u'', u')'),
+  (u'', u'return '),
+  (u'', u'\npass'),
+])
+
+_line_start_re = re.compile(r'^', re.M)
+
+
+class FormulaCache(object):
+  """
+  Caches formula transforms in the given directory, which gets created if needed.
+  """
+  def __init__(self, cache_dir):
+    self._dir = cache_dir
+    self._formulas = self._read_formulas()
+    self._used_formulas = set()
+    self._formulas_changed = False
+
+  def get_formula_transform(self, formula, default_value):
+    """
+    Returns the result of codebuilder.transform_formula() for the given formula, from the cache if
+    available.
+    """
+    if isinstance(formula, str):
+      formula = formula.decode('utf8')
+    patches = self._formulas.get(formula)
+    if patches is not None:
+      if _is_valid_transform(formula, patches):
+        self._used_formulas.add(formula)
+        return ('patches', patches)
+      del self._formulas[formula]
+
+    transform = codebuilder.transform_formula(formula, default_value)
+    if transform[0] == 'patches':
+      self._formulas[formula] = transform[1]
+      self._used_formulas.add(formula)
+      self._formulas_changed = True
+    return transform
+
+  def save(self):
+    """
+    Saves any newly-added formula transforms.
+    """
+    if not self._formulas_changed:
+      return
+    if len(self._formulas) > MAX_FORMULAS:
+      self._formulas = {k: self._formulas[k] for k in self._used_formulas}
+    self._write_file(_FORMULAS_FILE, {
+      "version": CACHE_VERSION,
+      "formulas": [[formula, patches] for (formula, patches) in self._formulas.iteritems()],
+    })
+    self._formulas_changed = False
+
+  def _read_formulas(self):
+    try:
+      with open(os.path.join(self._dir, _FORMULAS_FILE), 'rb') as f:
+        data = json.load(f)
+      if data["version"] != CACHE_VERSION:
+        return {}
+      return {formula: [tuple(p) for p in patches] for (formula, patches) in data["formulas"]}
+    except (IOError, OSError, ValueError, TypeError, KeyError):
+      return {}
+
+  def _write_file(self, file_name, data):
+    try:
+      if not os.path.isdir(self._dir):
+        os.makedirs(self._dir)
+      fd, tmp_path = tempfile.mkstemp(dir=self._dir, prefix=".tmp-")
+      with os.fdopen(fd, 'wb') as f:
+        json.dump(data, f)
+      os.rename(tmp_path, os.path.join(self._dir, file_name))
+    except (IOError, OSError, ValueError) as e:
+      log.warn("formula_cache: can't write %s: %s" % (file_name, e))
+
+
+def _is_valid_transform(formula, patches):
+  """
+  Checks that patches read from the cache could have come from transform_formula() for formula:
+  each one must insert a known snippet where the formula has the text it replaces, and the
+  resulting formula body must compile.
+  """
+  try:
+    for (start, end, old_text, new_text) in patches:
+      if not (type(start) is int and type(end) is int and   # pylint: disable=unidiomatic-typecheck
+              0 <= start <= end <= len(formula) and
+              (old_text, new_text) in _VALID_PATCH_TEXTS and formula[start:end] == old_text):
+        return False
+    body = codebuilder.build_formula_body(formula, ('patches', patches)).get_text()
+    compile(u"def _formula(rec, table):\n" + _line_start_re.sub(u"  ", body), "<cache>", "exec")
+  except (TypeError, ValueError, SyntaxError):
+    return False
+  return True
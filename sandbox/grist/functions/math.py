@@ -9,6 +9,7 @@ import uuid
 
 from functions.info import ISNUMBER, ISLOGICAL
 from functions.unimplemented import unimplemented
+from records import ColumnView
 import roman
 
 # Iterates through elements of iterable arguments, or through individual args when not iterable.
@@ -34,6 +35,24 @@ def _chain_numeric_a(*values_or_iterables):
     yield int(v) if ISLOGICAL(v) else v if ISNUMBER(v) else 0
 
 
+# Returns the list of values produced by _chain_numeric(), or by _chain_numeric_a() if
+# logical_as_int is set. ColumnView arguments (e.g. `Table.lookupRecords(...).Amount`) are read
+# straight from the column's typed storage when possible, skipping the per-cell checks.
+def _list_numeric(values_or_iterables, logical_as_int=False):
+  chain = _chain_numeric_a if logical_as_int else _chain_numeric
+  result = []
+  for v in values_or_iterables:
+    stored = v._get_stored_values() if isinstance(v, ColumnView) else None
+    if stored is None:
+      result.extend(chain(v))
+    elif not stored or not ISLOGICAL(stored[0]):
+      # Typed storage holds values of a single type, so checking the first one is enough.
+      result.extend(stored)
+    elif logical_as_int:
+      result.extend(map(int, stored))
+  return result
+
+
 def _round_toward_zero(value):
   return _math.floor(value) if value >= 0 else _math.ceil(value)
 
@@ -755,7 +774,7 @@ def SUM(value1, *more_values):
   >>> SUM([True, "3", 4], True)
   6
   """
-  return sum(_chain_numeric_a(value1, *more_values))
+  return sum(_list_numeric((value1,) + more_values, logical_as_int=True))
 
 
 @unimplemented
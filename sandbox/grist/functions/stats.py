@@ -1,27 +1,12 @@
 # pylint: disable=redefined-builtin, line-too-long, unused-argument
 
-from math import _chain, _chain_numeric, _chain_numeric_a
+from math import _chain, _list_numeric
 from info import ISNUMBER, ISLOGICAL
 from date import DATE       # pylint: disable=unused-import
 from unimplemented import unimplemented
 
-def _average(iterable):
-  total, count = 0.0, 0
-  for value in iterable:
-    total += value
-    count += 1
-  return total / count
-
-def _default_if_empty(iterable, default):
-  """
-  Yields all values from iterable, except when it is empty, yields just the single default value.
-  """
-  empty = True
-  for value in iterable:
-    empty = False
-    yield value
-  if empty:
-    yield default
+def _average(values):
+  return sum(values, 0.0) / len(values)
 
 
 @unimplemented
@@ -48,7 +33,7 @@ def AVERAGE(value, *more_values):
     ...
   ZeroDivisionError: float division by zero
   """
-  return _average(_chain_numeric(value, *more_values))
+  return _average(_list_numeric((value,) + more_values))
 
 
 def AVERAGEA(value, *more_values):
@@ -68,7 +53,7 @@ def AVERAGEA(value, *more_values):
   >>> AVERAGEA(False, True)
   0.5
   """
-  return _average(_chain_numeric_a(value, *more_values))
+  return _average(_list_numeric((value,) + more_values, logical_as_int=True))
 
 # Note that Google Sheets offers a similar function, called AVERAGE.WEIGHTED
 # (https://support.google.com/docs/answer/9084098?hl=en)
@@ -141,7 +126,7 @@ def COUNT(value, *more_values):
   >>> COUNT(False, True)
   0
   """
-  return sum(1 for v in _chain_numeric(value, *more_values))
+  return len(_list_numeric((value,) + more_values))
 
 
 def COUNTA(value, *more_values):
@@ -284,7 +269,7 @@ def MAX(value, *more_values):
   >>> MAX("Hello", "123", DATE(2015, 1, 1))
   0
   """
-  return max(_default_if_empty(_chain_numeric(value, *more_values), 0))
+  return max(_list_numeric((value,) + more_values) or [0])
 
 
 def MAXA(value, *more_values):
@@ -306,7 +291,7 @@ def MAXA(value, *more_values):
   >>> MAXA("Hello", "123", DATE(2015, 1, 1))
   0
   """
-  return max(_default_if_empty(_chain_numeric_a(value, *more_values), 0))
+  return max(_list_numeric((value,) + more_values, logical_as_int=True) or [0])
 
 
 def MEDIAN(value, *more_values):
@@ -335,9 +320,10 @@ def MEDIAN(value, *more_values):
     ...
   ValueError: MEDIAN requires at least one number
   """
-  values = sorted(_chain_numeric(value, *more_values))
+  values = _list_numeric((value,) + more_values)
   if not values:
     raise ValueError("MEDIAN requires at least one number")
+  values.sort()
   count = len(values)
   if count % 2 == 0:
     return (values[count / 2 - 1] + values[count / 2]) / 2.0
@@ -364,7 +350,7 @@ def MIN(value, *more_values):
   >>> MIN("Hello", "123", DATE(2015, 1, 1))
   0
   """
-  return min(_default_if_empty(_chain_numeric(value, *more_values), 0))
+  return min(_list_numeric((value,) + more_values) or [0])
 
 def MINA(value, *more_values):
   """
@@ -385,7 +371,7 @@ def MINA(value, *more_values):
   >>> MINA("Hello", "123", DATE(2015, 1, 1))
   0
   """
-  return min(_default_if_empty(_chain_numeric_a(value, *more_values), 0))
+  return min(_list_numeric((value,) + more_values, logical_as_int=True) or [0])
 
 
 @unimplemented
@@ -551,7 +537,7 @@ def STDEV(value, *more_values):
     ...
   ZeroDivisionError: float division by zero
   """
-  return _stddev(list(_chain_numeric(value, *more_values)), 1)
+  return _stddev(_list_numeric((value,) + more_values), 1)
 
 def STDEVA(value, *more_values):
   """
@@ -570,7 +556,7 @@ def STDEVA(value, *more_values):
     ...
   ZeroDivisionError: float division by zero
   """
-  return _stddev(list(_chain_numeric_a(value, *more_values)), 1)
+  return _stddev(_list_numeric((value,) + more_values, logical_as_int=True), 1)
 
 def STDEVP(value, *more_values):
   """
@@ -587,7 +573,7 @@ def STDEVP(value, *more_values):
   >>> STDEVP([5])
   0.0
   """
-  return _stddev(list(_chain_numeric(value, *more_values)), 0)
+  return _stddev(_list_numeric((value,) + more_values), 0)
 
 def STDEVPA(value, *more_values):
   """
@@ -604,7 +590,7 @@ def STDEVPA(value, *more_values):
   >>> STDEVPA([5])
   0.0
   """
-  return _stddev(list(_chain_numeric_a(value, *more_values)), 0)
+  return _stddev(_list_numeric((value,) + more_values, logical_as_int=True), 0)
 
 @unimplemented
 def STEYX(data_y, data_x):
@@ -17,7 +17,7 @@ The schema for grist data is:
 """
 import re
 import imp
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 import codebuilder
 from column import is_visible_column
@@ -65,10 +65,19 @@ class GenCode(object):
   make_module(), it will use the previously cached values for lookups, and replace the contents
   of the cache with current values. If ever we need to generate code for unrelated schemas, to
   benefit from the cache, a separate GenCode object should be used for each schema.
+
+  If disk_cache is set to a formula_cache.FormulaCache, it's used to save the work of parsing
+  formulas across restarts of the sandbox.
+
+  The code of each table is also cached, along with a snapshot of the schema it was generated
+  from. Once the usercode module exists, make_module() updates it in place, re-executing only the
+  code of tables that changed, so that the UserTable objects of other tables stay the same.
   """
   def __init__(self):
+    self.disk_cache = None
     self._formula_cache = {}
     self._new_formula_cache = {}
+    self._table_code = {}
     self._full_builder = None
     self._user_builder = None
     self._usercode = None
@@ -85,7 +94,12 @@ class GenCode(object):
     body = self._formula_cache.get(key)
     if body is None:
       default = get_type_default(col_info.type)
-      body = codebuilder.make_formula_body(col_info.formula, default, (table_id, col_info.colId))
+      if self.disk_cache:
+        transform = self.disk_cache.get_formula_transform(col_info.formula, default)
+        body = codebuilder.build_formula_body(col_info.formula, transform,
+                                              (table_id, col_info.colId))
+      else:
+        body = codebuilder.make_formula_body(col_info.formula, default, (table_id, col_info.colId))
     self._new_formula_cache[key] = body
 
     decorator = ''
@@ -156,20 +170,68 @@ class GenCode(object):
                  "from functions import *       # global uppercase functions\n" +
                  "import datetime, math, re     # modules commonly needed in formulas\n"]
     userparts = fullparts[:]
+    table_code = OrderedDict()
     for table_info in schema.itervalues():
+      code = self._get_table_code(table_info, summary_tables.get(table_info.tableId, []))
+      table_code[table_info.tableId] = code
       fullparts.append("\n\n")
-      fullparts.append(self._make_table_model(table_info, summary_tables.get(table_info.tableId)))
-      if not _is_special_table(table_info.tableId):
+      fullparts.append(code.full_model)
+      if code.user_model:
         userparts.append("\n\n")
-        userparts.append(self._make_table_model(table_info, summary_tables.get(table_info.tableId),
-          filter_for_user=True))
+        userparts.append(code.user_model)
 
     # Once all formulas are generated, replace the formula cache with the newly-populated version.
     self._formula_cache = self._new_formula_cache
     self._new_formula_cache = {}
     self._full_builder = textbuilder.Combiner(fullparts)
     self._user_builder = textbuilder.Combiner(userparts)
-    self._usercode = exec_module_text(self._full_builder.get_text())
+    if self._usercode:
+      self._update_module(table_code)
+    else:
+      self._usercode = exec_module_text(self._full_builder.get_text())
+    if self.disk_cache:
+      self.disk_cache.save()
+    self._table_code = table_code
+
+  def _get_table_code(self, table_info, summary_tables):
+    """
+    Returns a _TableCode for the given table, reusing the previously generated one if the schema
+    of the table and of its summary tables hasn't changed.
+    """
+    table_id = table_info.tableId
+    schema_key = (_snapshot_table(table_info), tuple(_snapshot_table(s) for s in summary_tables))
+    prev = self._table_code.get(table_id)
+    if prev and prev.schema_key == schema_key:
+      self._new_formula_cache.update(prev.formulas)
+      return prev
+
+    # Collect the formulas of this table separately, to carry them over when the code is reused.
+    all_formulas = self._new_formula_cache
+    self._new_formula_cache = formulas = {}
+    try:
+      full_model = self._make_table_model(table_info, summary_tables)
+      user_model = (None if _is_special_table(table_id) else
+                    self._make_table_model(table_info, summary_tables, filter_for_user=True))
+    finally:
+      self._new_formula_cache = all_formulas
+    all_formulas.update(formulas)
+    return _TableCode(schema_key, formulas, full_model, user_model)
+
+  def _update_module(self, table_code):
+    """
+    Updates the existing usercode module to match the given dict of _TableCode objects, by
+    re-executing the code of tables whose code changed, and removing tables that are gone.
+    """
+    # pylint: disable=exec-used
+    mod_dict = self._usercode.__dict__
+    for table_id, code in table_code.iteritems():
+      prev = self._table_code.get(table_id)
+      text = code.full_model.get_text()
+      if prev is None or prev.full_model.get_text() != text:
+        exec compile(text, '<string>', 'exec') in mod_dict
+    for table_id in self._table_code:
+      if table_id not in table_code:
+        mod_dict.pop(table_id, None)
 
   def get_user_text(self):
     """Returns the text of the user-facing part of the generated code."""
@@ -184,6 +246,16 @@ class GenCode(object):
     return codebuilder.parse_grist_names(self._full_builder)
 
 
+# The generated code of one table. The schema_key is a snapshot of the schema of the table and its
+# summary tables, and formulas are the entries of GenCode's formula cache used by the table.
+_TableCode = namedtuple('_TableCode', ('schema_key', 'formulas', 'full_model', 'user_model'))
+
+
+def _snapshot_table(table_info):
+  # The schema gets modified in place, so we need a copy to tell later whether it changed.
+  return (table_info.tableId, tuple(table_info.columns.iteritems()))
+
+
 def _is_special_table(table_id):
   return table_id.startswith("_grist_") or bool(summary.decode_summary_table_name(table_id))
 
@@ -12,4 +12,4 @@ from table import UserTable
 from records import Record, RecordSet
 
 DOCS = [(__name__, (Record, RecordSet, UserTable)),
-        ('lookup', (UserTable.lookupOne, UserTable.lookupRecords))]
+        ('lookup', (UserTable.lookupOne, UserTable.lookupRecords, UserTable.lookupRange))]
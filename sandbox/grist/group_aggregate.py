@@ -0,0 +1,358 @@
+"""
+Incremental maintenance of aggregate formulas in summary tables.
+
+A formula like `SUM($group.Amount)` in a summary table would normally iterate through all the
+source records of the group whenever any one of them changes. Instead, for formulas recognized by
+codebuilder.parse_group_aggregate(), the engine uses a GroupAggregateColumn on the source table,
+which keeps running totals for each group, and adjusts them by the old and new contribution of
+each changed source record. This makes a single edit O(1) rather than O(group size).
+
+Results are only produced when they are sure to match evaluating the formula in full. Groups that
+contain values which the aggregation would need to treat specially (errors, alttext, non-finite
+numbers) produce no result, and the engine falls back to evaluating the formula as usual.
+
+Sums of floats depend on the order of addition, so like a full evaluation (which adds the values
+of $group in order of row_id), they are accumulated in row_id order. This sum can only be
+extended in O(1) while records get added at the end of a group; any other change to a group with
+floats makes its next result re-add the group's values, which is still O(group size) but avoids
+evaluating the formula.
+"""
+import itertools
+import math
+
+from sortedcontainers import SortedList
+
+import column
+import relation
+import usertypes
+
+# Marks a value that can't be aggregated incrementally.
+_UNSAFE = object()
+
+
+def _is_finite(value):
+  return not (math.isinf(value) or math.isnan(value))
+
+
+class _GroupState(object):
+  """
+  The running totals for the source records of one summary group.
+  """
+  __slots__ = ('count', 'unsafe_count', 'other_count', 'number_count', 'bool_sum', 'int_sum',
+               'float_count', 'values', 'sum_fold', 'avg_fold', 'fold_row_id', 'sorted_numbers')
+
+  def __init__(self, ordered):
+    self.count = 0              # Number of records.
+    self.unsafe_count = 0       # Number of values that can't be aggregated incrementally.
+    self.other_count = 0        # Number of non-numeric values (e.g. strings or None).
+    self.number_count = 0       # Number of numeric values other than bools.
+    self.bool_sum = 0           # Number of True values.
+    self.int_sum = 0            # Exact sum of ints and longs.
+    self.float_count = 0        # Number of floats.
+    self.values = {}            # Maps row_id to its value.
+    # Sums as SUM() and AVERAGE() compute them, adding values in row_id order up to fold_row_id.
+    # If fold_row_id is None, they are out of date.
+    self.sum_fold = 0
+    self.avg_fold = 0.0
+    self.fold_row_id = 0
+    self.sorted_numbers = SortedList() if ordered else None
+
+  def update(self, row_id, value, sign):
+    """
+    Adds (for sign of 1) or removes (for sign of -1) the value of the given record from the totals.
+    """
+    self.count += sign
+    if sign > 0:
+      self.values[row_id] = value
+      if self.fold_row_id is not None and row_id > self.fold_row_id:
+        self._fold(row_id, value)
+      else:
+        self.fold_row_id = None
+    else:
+      del self.values[row_id]
+      self.fold_row_id = None
+
+    value_type = type(value)
+    if value_type is bool:
+      self.bool_sum += sign * value
+    elif value_type is int or value_type is long:
+      self.number_count += sign
+      self.int_sum += sign * value
+      self._update_sorted(value, sign)
+    elif value_type is float:
+      if not _is_finite(value):
+        self.unsafe_count += sign
+        return
+      self.number_count += sign
+      self.float_count += sign
+      self._update_sorted(value, sign)
+    elif value is _UNSAFE:
+      self.unsafe_count += sign
+    else:
+      self.other_count += sign
+
+  def _update_sorted(self, value, sign):
+    if self.sorted_numbers is not None:
+      if sign > 0:
+        self.sorted_numbers.add(value)
+      else:
+        self.sorted_numbers.remove(value)
+
+  def _fold(self, row_id, value):
+    # Same as the additions in SUM() and AVERAGE() (see functions.math._chain_numeric_a).
+    value_type = type(value)
+    if value_type is bool:
+      self.sum_fold += int(value)
+    elif value_type is int or value_type is long or value_type is float:
+      self.sum_fold += value
+      self.avg_fold += value
+    else:
+      self.sum_fold += 0
+    self.fold_row_id = row_id
+
+  def _get_folds(self):
+    """
+    Returns the (sum_fold, avg_fold) pair, re-adding all values if they are out of date.
+    """
+    if self.fold_row_id is None:
+      self.sum_fold = 0
+      self.avg_fold = 0.0
+      self.fold_row_id = 0
+      for row_id in sorted(self.values):
+        self._fold(row_id, self.values[row_id])
+    return (self.sum_fold, self.avg_fold)
+
+  def _sum(self):
+    if not self.float_count:
+      return int(self.int_sum + self.bool_sum)
+    return self._get_folds()[0]
+
+  def get_result(self, func):
+    """
+    Returns the result of the aggregation function `func` (as from codebuilder.GroupAggregate)
+    for this group, or None if it can't be determined without evaluating the formula in full.
+    """
+    if func == 'len':
+      return self.count
+    if self.unsafe_count:
+      return None
+    if func == 'SUM':
+      return self._sum()
+    if func == 'sum':
+      # Python's sum() fails on non-numeric values, and should get to report that itself.
+      return None if self.other_count else self._sum()
+    if func == 'COUNT':
+      return self.number_count
+    if func == 'AVERAGE':
+      # An empty average raises ZeroDivisionError, which we let the formula itself produce.
+      return self._get_folds()[1] / self.number_count if self.number_count else None
+    if func == 'MIN':
+      return self.sorted_numbers[0] if self.sorted_numbers else 0
+    if func == 'MAX':
+      return self.sorted_numbers[-1] if self.sorted_numbers else 0
+    return None
+
+
+class GroupAggregateColumn(column.BaseColumn):
+  """
+  A GroupAggregateColumn lives in the source table of a summary table, and maintains running
+  totals of one source column (or just the record counts if value_col_id is None) for each group
+  of the summary table. It's a special column like LookupMapColumn: it acts as a formula column
+  that depends on the source column and on the summary helper column that assigns records to
+  groups, and its "formula" updates the totals whenever one of those changes for a record.
+
+  If `ordered` is set, it also maintains sorted numeric values for each group, to support MIN and
+  MAX.
+  """
+  def __init__(self, table, col_id, summary_table, value_col_id, ordered):
+    # Note that self._recalc_rec_method is passed in as the formula's "method".
+    col_info = column.ColInfo(usertypes.Any(), is_formula=True, method=self._recalc_rec_method)
+    super(GroupAggregateColumn, self).__init__(table, col_id, col_info)
+
+    self._engine = table._engine
+    self._group_col_id = summary_table._summary_helper_col_id
+    self._value_col_id = value_col_id
+    self._ordered = ordered
+
+    # Maps source row_id to the (group_row_id, value) pair it contributes to the totals.
+    self._row_contributions = {}
+    # Maps group row_id (in the summary table) to its _GroupState.
+    self._groups = {}
+
+    # Map of referring Node (a formula column in the summary table) to its _GroupRelation.
+    self._group_relations = {}
+
+    self._engine.invalidate_column(self)
+
+  def _recalc_rec_method(self, rec, table):   # pylint: disable=unused-argument
+    """
+    Recomputes the contribution of a source record to the totals. It's called whenever the record
+    changes its value or group, and takes O(1) time (or O(log(group size)) if ordered).
+    """
+    row_id = rec._row_id
+    source_table = rec._table
+    # Use raw values: we only need the group's row_id, and errors shouldn't raise exceptions here.
+    group_col = source_table._use_column(self._group_col_id, rec._source_relation, [row_id])
+    group = group_col.raw_get(row_id)
+
+    value = None
+    if self._value_col_id is not None:
+      if source_table.has_column(self._value_col_id):
+        value_col = source_table._use_column(self._value_col_id, rec._source_relation, [row_id])
+        values = value_col.get_plain_cell_values([row_id], _UNSAFE)
+        value = values[0] if values else _UNSAFE
+      else:
+        # Depend on the addition of new columns, in case the missing one gets added.
+        self._engine._use_node(source_table._new_columns_node, rec._source_relation)
+        value = _UNSAFE
+
+    affected_groups = set()
+    self._update_row(row_id, group, value, affected_groups)
+    if affected_groups:
+      self._invalidate_groups(affected_groups)
+
+  def get_input_columns(self):
+    """
+    Returns the list of source columns used by this column, or None if any are missing.
+    """
+    source_table = self._engine.tables[self.table_id]
+    col_ids = [self._group_col_id]
+    if self._value_col_id is not None:
+      col_ids.append(self._value_col_id)
+    if not all(source_table.has_column(col_id) for col_id in col_ids):
+      return None
+    return [source_table.get_column(col_id) for col_id in col_ids]
+
+  def update_rows(self, row_ids):
+    """
+    Recomputes the contributions of many source records at once, with the same effect as calling
+    _recalc_rec_method() for each, but working from column values directly. The caller is
+    responsible for making sure the input columns are up-to-date, and for creating dependencies.
+    """
+    input_cols = self.get_input_columns()
+    groups = itertools.imap(input_cols[0].raw_get, row_ids)
+    if len(input_cols) > 1:
+      values = input_cols[1].get_plain_cell_values(row_ids, _UNSAFE)
+      if values is None:
+        values = itertools.repeat(_UNSAFE)
+    else:
+      values = itertools.repeat(None)
+
+    affected_groups = set()
+    for row_id, group, value in itertools.izip(row_ids, groups, values):
+      self._update_row(row_id, group, value, affected_groups)
+    if affected_groups:
+      self._invalidate_groups(affected_groups)
+
+  def _update_row(self, row_id, group, value, affected_groups):
+    """
+    Replaces the contribution of a source record to the totals with the given group (a raw value of
+    the summary helper column) and value. Adds any groups affected to the affected_groups set.
+    """
+    if type(group) is not int or not group:  # pylint: disable=unidiomatic-typecheck
+      group = None
+
+    old_group = self._remove_contribution(row_id)
+    if group is not None:
+      self._row_contributions[row_id] = (group, value)
+      self._get_group_state(group).update(row_id, value, 1)
+
+    # When a record changes group, or appears in one for the first time, the new group is affected
+    # too. (The old group was already invalidated via _GroupRelation.)
+    if group != old_group:
+      if old_group is not None:
+        affected_groups.add(old_group)
+      if group is not None:
+        affected_groups.add(group)
+
+  def _remove_contribution(self, row_id):
+    """
+    Removes the contribution of the given source record from the totals, and returns the group it
+    was contributing to.
+    """
+    group, value = self._row_contributions.pop(row_id, (None, None))
+    if group is not None:
+      state = self._groups[group]
+      state.update(row_id, value, -1)
+      if not state.count:
+        del self._groups[group]
+    return group
+
+  def _get_group_state(self, group):
+    state = self._groups.get(group)
+    if state is None:
+      state = self._groups[group] = _GroupState(self._ordered)
+    return state
+
+  def unset(self, row_id):
+    # This is called on record removal, and is necessary to deal with removed records.
+    group = self._remove_contribution(row_id)
+    if group is not None:
+      self._invalidate_groups({group})
+
+  def _invalidate_groups(self, groups):
+    for node in self._group_relations:
+      self._engine.invalidate_records(node.table_id, groups, col_ids=(node.col_id,))
+
+  def get_group_of_row(self, row_id):
+    """
+    Returns the group which the given source record currently contributes to, or None.
+    """
+    return self._row_contributions.get(row_id, (None, None))[0]
+
+  def get_relation(self, referring_node):
+    """
+    Returns the _GroupRelation to use for dependencies of the given summary formula node on this
+    column. Using it registers the node to be invalidated when its groups' totals change.
+    """
+    rel = self._group_relations.get(referring_node)
+    if not rel:
+      rel = self._group_relations[referring_node] = _GroupRelation(self, referring_node)
+    return rel
+
+  def _delete_relation(self, referring_node):
+    self._group_relations.pop(referring_node, None)
+    if not self._group_relations:
+      self._engine.mark_lookupmap_for_cleanup(self)
+
+  def get_result(self, func, group):
+    """
+    Returns the result of the aggregation function `func` over the given group, or None if the
+    formula needs to be evaluated in full. The column should be brought up-to-date first.
+    """
+    state = self._groups.get(group)
+    return (state or _GroupState(self._ordered)).get_result(func)
+
+  # Override various column methods, since GroupAggregateColumn doesn't store any values. To
+  # outside code, it looks like a column of None's.
+  def raw_get(self, value):
+    return None
+  def convert(self, value):
+    return None
+  def convert_list(self, values):
+    return [None] * len(values)
+  def get_cell_value(self, row_id):
+    return None
+  def set(self, row_id, value):
+    pass
+
+
+class _GroupRelation(relation.Relation):
+  """
+  Relates rows of a summary table to the source records in their groups, as currently known to
+  a GroupAggregateColumn. Changes to source records affect the groups they belong to.
+  """
+  def __init__(self, aggregate_col, referring_node):
+    super(_GroupRelation, self).__init__(referring_node.table_id, aggregate_col.table_id)
+    self._aggregate_col = aggregate_col
+    self._referring_node = referring_node
+
+  def __str__(self):
+    return "_GroupRelation(%s->%s)" % (self._referring_node, self.target_table)
+
+  def get_affected_rows(self, target_row_ids):
+    get_group = self._aggregate_col.get_group_of_row
+    return {group for group in (get_group(r) for r in target_row_ids) if group is not None}
+
+  def reset_all(self):
+    self._aggregate_col._delete_relation(self._referring_node)
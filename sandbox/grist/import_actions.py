@@ -9,6 +9,10 @@ log = logger.Logger(__name__, logger.INFO)
 # Prefix for transform columns created during imports.
 _import_transform_col_prefix = 'gristHelper_Import_'
 
+# Maximum number of rows added to the destination table by a single BulkAddRecord, so that
+# importing a large file doesn't produce one huge action.
+_import_batch_size = 10000
+
 def _gen_colids(transform_rule):
   """
   For a transform_rule with colIds = None,
@@ -302,7 +306,12 @@ class ImportActions(object):
       new_table = self._useractions.AddTable(dest_table_id, col_specs)
       dest_table_id = new_table['table_id']
 
-    self._useractions.BulkAddRecord(dest_table_id, [None] * len(row_ids), column_data)
+    num_rows = len(row_ids)
+    for start in xrange(0, num_rows, _import_batch_size):
+      end = min(start + _import_batch_size, num_rows)
+      self._useractions.BulkAddRecord(dest_table_id, [None] * (end - start),
+                                      {col_id: values[start:end]
+                                       for col_id, values in column_data.iteritems()})
 
     log.debug("Finishing TransformAndFinishImport")
 
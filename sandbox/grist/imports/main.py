@@ -3,6 +3,9 @@ API, and calls its selected method passing argument received from
 PluginManager.sandboxImporter(). It returns an object formatted so
 that it can be used by Grist.
 
+With --chunk-rows, the result of parse_file is written out as a series of marshalled objects
+rather than one, so that neither process needs to hold a marshalled copy of all the data. See
+iter_chunks() for the format.
 """
 import sys
 import argparse
@@ -19,6 +22,38 @@ sys.path.append('/thirdparty')
 def marshal_data(export_list):
   return marshal.dumps(export_list, 2)
 
+def _split_columns(columns, chunk_rows):
+  """
+  Yields lists of slices of the given parallel columns, with at most chunk_rows values in each.
+  """
+  num_rows = max(len(col) for col in columns) if columns else 0
+  for start in xrange(0, num_rows, chunk_rows):
+    yield [col[start:start + chunk_rows] for col in columns]
+
+def iter_chunks(parsed_data, chunk_rows):
+  """
+  Given the result of parse_file, i.e. a pair of (parse_options, tables), yields objects to write
+  out one after another in place of it:
+    - first, (parse_options, tables) with "table_data" omitted from each table;
+    - then, (table_index, columns) for each chunk of up to chunk_rows rows of a table, with
+      "columns" listing the values of the chunk in the same order as the table's "table_data";
+    - finally, None, to mark the end.
+  A table's "table_data" is normally a list of columns. It may also be an iterable of such lists
+  for successive batches of rows, which allows a plugin to produce the data in parts.
+  """
+  parse_options, tables = parsed_data
+  yield (parse_options, [{k: v for k, v in table.iteritems() if k != "table_data"}
+                         for table in tables])
+  for index, table in enumerate(tables):
+    table_data = table.pop("table_data")
+    batches = [table_data] if isinstance(table_data, list) else table_data
+    for batch in batches:
+      for columns in _split_columns(batch, chunk_rows):
+        yield (index, columns)
+    # Let go of each table's data once it's been written out.
+    del table_data, batches
+  yield None
+
 def main():
 
   parser = argparse.ArgumentParser()
@@ -32,6 +67,8 @@ def main():
                       help="Location of the module.")
   parser.add_argument('--action-options',
                       help="Options to pass to the action. See API documentation.")
+  parser.add_argument('--chunk-rows', type=int,
+                      help="Write the result of parse_file in chunks of this many rows.")
   parser.add_argument('action', help='Action to call',
                       choices=['can_parse', 'parse_file'])
   parser.add_argument('input', help='File to convert')
@@ -50,6 +87,15 @@ def main():
   if args.action_options:
     options = json.loads(args.action_options)
   parsed_data = getattr(import_plugin, args.action)(args.input, **options)
+  if args.chunk_rows and args.action == 'parse_file':
+    total_bytes = 0
+    for chunk in iter_chunks(parsed_data, args.chunk_rows):
+      marshalled_data = marshal_data(chunk)
+      total_bytes += len(marshalled_data)
+      if not args.debug:
+        sys.stdout.write(marshalled_data)
+    log.info("Marshalled data has %d bytes", total_bytes)
+    return
   marshalled_data = marshal_data(parsed_data)
   log.info("Marshalled data has %d bytes", len(marshalled_data))
   if not args.debug:
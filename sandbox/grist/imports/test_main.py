@@ -0,0 +1,44 @@
+import marshal
+import unittest
+
+from imports import main
+
+
+class TestImportMain(unittest.TestCase):
+  def test_iter_chunks(self):
+    tables = [
+      {"table_name": "A", "column_metadata": [{"id": "x"}, {"id": "y"}],
+       "table_data": [[1, 2, 3, 4, 5], ["a", "b", "c", "d", "e"]]},
+      {"table_name": "B", "column_metadata": [{"id": "z"}], "table_data": [[]]},
+    ]
+    chunks = list(main.iter_chunks(({"delimiter": ","}, tables), 2))
+    self.assertEqual(chunks, [
+      ({"delimiter": ","}, [{"table_name": "A", "column_metadata": [{"id": "x"}, {"id": "y"}]},
+                            {"table_name": "B", "column_metadata": [{"id": "z"}]}]),
+      (0, [[1, 2], ["a", "b"]]),
+      (0, [[3, 4], ["c", "d"]]),
+      (0, [[5], ["e"]]),
+      None,
+    ])
+
+    # Chunks written one after another can be read back one at a time.
+    data = "".join(main.marshal_data(chunk) for chunk in chunks)
+    self.assertEqual(marshal.loads(data), chunks[0])
+
+  def test_iter_chunks_from_batches(self):
+    # A plugin may produce a table's data as an iterable of batches of rows.
+    def gen_batches():
+      yield [[1, 2, 3], ["a", "b", "c"]]
+      yield [[4], ["d"]]
+    tables = [{"table_name": "A", "table_data": gen_batches()}]
+    self.assertEqual(list(main.iter_chunks(({}, tables), 2)), [
+      ({}, [{"table_name": "A"}]),
+      (0, [[1, 2], ["a", "b"]]),
+      (0, [[3], ["c"]]),
+      (0, [[4], ["d"]]),
+      None,
+    ])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,5 +1,12 @@
+import bisect
+from collections import namedtuple
+import datetime
+
+from sortedcontainers import SortedList
+
 import column
 import depend
+import moment
 import records
 import relation
 import twowaymap
@@ -95,10 +102,13 @@ class LookupMapColumn(column.BaseColumn):
     """
     rel = self._lookup_relations.get(referring_node)
     if not rel:
-      rel = _LookupRelation(self, referring_node)
+      rel = self._make_relation(referring_node)
       self._lookup_relations[referring_node] = rel
     return rel
 
+  def _make_relation(self, referring_node):
+    return _LookupRelation(self, referring_node)
+
   def _delete_relation(self, referring_node):
     self._lookup_relations.pop(referring_node, None)
     if not self._lookup_relations:
@@ -115,6 +125,8 @@ class LookupMapColumn(column.BaseColumn):
     if current_frame:
       rel = self._get_relation(current_frame.node)
       rel._add_lookup(current_frame.current_row_id, key)
+      if self._engine._profiler:
+        self._engine._profiler.record_lookup(current_frame.node)
     else:
       rel = None
 
@@ -139,12 +151,172 @@ class LookupMapColumn(column.BaseColumn):
     return None
   def convert(self, value):
     return None
+  def convert_list(self, values):
+    return [None] * len(values)
   def get_cell_value(self, row_id):
     return None
   def set(self, row_id, value):
     pass
 
 
+def _range_sort_key(value):
+  """
+  Returns the key by which a value is ordered in a RangeLookupMapColumn, or None if the value
+  can't be ordered there. Numbers (including references) and dates are ordered together, by
+  numeric value (dates by their timestamp); strings come after all numbers.
+  """
+  value = _extract(value)
+  if isinstance(value, (int, long, float)):
+    return None if value != value else (0, value)    # NaN can't be ordered.
+  if isinstance(value, datetime.datetime):
+    return (0, moment.dt_to_ts(value))
+  if isinstance(value, datetime.date):
+    return (0, moment.date_to_ts(value))
+  if isinstance(value, basestring):
+    return (1, value)
+  return None
+
+
+# The parameters of one range lookup: the key tuple of the exact-match columns, and the sort keys
+# of the range bounds (start inclusive, end exclusive), and the prefix, each of which may be None.
+_RangeQuery = namedtuple('_RangeQuery', ('key', 'start', 'end', 'prefix'))
+
+
+def _get_lower_bound(query):
+  """
+  Returns the smallest sort key that a query may include, or None if there is no lower bound.
+  """
+  if query.prefix is None:
+    return query.start
+  prefix_start = (1, query.prefix)
+  return prefix_start if query.start is None else max(query.start, prefix_start)
+
+
+def _is_below_upper_bound(query, sort_key):
+  """
+  Returns whether a sort key that's at least the query's lower bound is included in the query.
+  Since strings with a given prefix are contiguous in sorted order, once this is false for some
+  sort key, it's false for all greater ones.
+  """
+  return ((query.end is None or sort_key < query.end) and
+          (query.prefix is None or sort_key[1].startswith(query.prefix)))
+
+
+class RangeLookupMapColumn(LookupMapColumn):
+  """
+  A RangeLookupMapColumn is a LookupMapColumn which, in addition to the exact-match lookup
+  columns, keeps the rows for each key ordered by the value of one more column (the "range
+  column"). This supports lookups of rows whose value in the range column is within a range, or
+  starts with a prefix, and returns them sorted by that value.
+
+  Compared to relational database, it's analogous to an ordered (e.g. B-tree) index.
+  """
+
+  def __init__(self, table, col_id, col_ids_tuple, range_col_id):
+    super(RangeLookupMapColumn, self).__init__(table, col_id, col_ids_tuple)
+    self._range_col_id = range_col_id
+
+    # Maps rowIds of the target table to (key, sort_key) pairs, for rows that are in the index.
+    self._row_key_map = {}
+
+    # Maps each key to a SortedList of (sort_key, row_id) pairs.
+    self._sorted_rows = {}
+
+  def _recalc_rec_method(self, rec, table):
+    # As in LookupMapColumn, getting the values creates the correct dependencies, and must happen
+    # before changing the index, in case the values need to be computed first.
+    key = tuple(_extract(rec._get_col(_col_id)) for _col_id in self._col_ids_tuple)
+    sort_key = _range_sort_key(rec._get_col(self._range_col_id))
+
+    old_entry = self._remove_row(rec._row_id)
+    new_entry = None
+    if sort_key is not None:
+      try:
+        sorted_rows = self._sorted_rows.get(key)
+      except TypeError:
+        # If key is not hashable, leave the row out of the index.
+        pass
+      else:
+        if sorted_rows is None:
+          sorted_rows = self._sorted_rows[key] = SortedList()
+        sorted_rows.add((sort_key, rec._row_id))
+        new_entry = self._row_key_map[rec._row_id] = (key, sort_key)
+
+    self._invalidate_affected({old_entry, new_entry})
+
+  def unset(self, row_id):
+    self._invalidate_affected({self._remove_row(row_id)})
+
+  def _remove_row(self, row_id):
+    """
+    Removes the given row from the index, and returns its former (key, sort_key), or None.
+    """
+    entry = self._row_key_map.pop(row_id, None)
+    if entry is not None:
+      key, sort_key = entry
+      sorted_rows = self._sorted_rows[key]
+      sorted_rows.remove((sort_key, row_id))
+      if not sorted_rows:
+        del self._sorted_rows[key]
+    return entry
+
+  def _make_relation(self, referring_node):
+    return _RangeLookupRelation(self, referring_node)
+
+  def do_lookup(self, key, start=None, end=None, prefix=None):
+    """
+    Looks up the rows with the given key whose value in the range column is at least start (if
+    given), less than end (if given), and starts with prefix (if given). Returns a tuple with the
+    list of matching row ids sorted by that value, and the Relation object for those records.
+    """
+    query = _RangeQuery(tuple(_extract(val) for val in key),
+                        _get_bound_key(start), _get_bound_key(end),
+                        None if prefix is None else _get_prefix(prefix))
+    current_frame = self._engine.get_current_frame()
+    if current_frame:
+      rel = self._get_relation(current_frame.node)
+      rel._add_lookup(current_frame.current_row_id, query)
+      if self._engine._profiler:
+        self._engine._profiler.record_lookup(current_frame.node)
+    else:
+      rel = None
+
+    # Since the rows to return aren't known until the index is up-to-date, the whole index gets
+    # brought up-to-date (which also creates a dependency on it).
+    self._engine._use_node(self.node, rel)
+    return self._find_rows(query), rel
+
+  def _find_rows(self, query):
+    sorted_rows = self._sorted_rows.get(query.key)
+    if not sorted_rows:
+      return []
+    lower_bound = _get_lower_bound(query)
+    row_ids = []
+    for (sort_key, row_id) in sorted_rows.irange(None if lower_bound is None else (lower_bound,)):
+      if not _is_below_upper_bound(query, sort_key):
+        break
+      row_ids.append(row_id)
+    return row_ids
+
+  def _get_key(self, target_row_id):
+    return self._row_key_map.get(target_row_id)
+
+
+def _get_bound_key(value):
+  if value is None:
+    return None
+  sort_key = _range_sort_key(value)
+  if sort_key is None:
+    raise TypeError("Unsupported range bound %r" % (value,))
+  return sort_key
+
+
+def _get_prefix(value):
+  if not isinstance(value, basestring):
+    raise TypeError("Unsupported prefix %r" % (value,))
+  return value
+
+
 #----------------------------------------------------------------------
 
 class _LookupRelation(relation.Relation):
@@ -214,3 +386,36 @@ class _LookupRelation(relation.Relation):
     # lookup map can get cleaned up.
     self._row_key_map.clear()
     self._lookup_map._delete_relation(self._referring_node)
+
+
+class _RangeLookupRelation(_LookupRelation):
+  """
+  The _LookupRelation of a RangeLookupMapColumn. It maps referring rows to the _RangeQuery tuples
+  they looked up, and the keys of target rows are (key, sort_key) pairs, which affect the referring
+  rows whose queries include them.
+  """
+  def __str__(self):
+    return "_RangeLookupRelation(%s->%s)" % (self._referring_node, self.target_table)
+
+  def get_affected_rows_by_keys(self, keys):
+    # Collect the sorted sort keys for each key, so that each distinct query can check with a
+    # binary search whether it includes any of them.
+    sort_keys_by_key = {}
+    for entry in keys:
+      if entry is not None:
+        sort_keys_by_key.setdefault(entry[0], []).append(entry[1])
+    if not sort_keys_by_key:
+      return set()
+    for sort_keys in sort_keys_by_key.itervalues():
+      sort_keys.sort()
+
+    affected_rows = set()
+    for query in self._row_key_map.right_all():
+      sort_keys = sort_keys_by_key.get(query.key)
+      if not sort_keys:
+        continue
+      lower_bound = _get_lower_bound(query)
+      i = 0 if lower_bound is None else bisect.bisect_left(sort_keys, lower_bound)
+      if i < len(sort_keys) and _is_below_upper_bound(query, sort_keys[i]):
+        affected_rows.update(self._row_key_map.lookup_right(query))
+    return affected_rows
@@ -8,13 +8,18 @@ sys.path.append('thirdparty')
 
 import marshal
 import functools
+import os
 
 from acl_formula import parse_acl_formula
 import actions
+import columnar
 import sandbox
 import engine
+import formula_cache
 import migrations
 import schema
+import sqlite_reader
+import table_file
 import useractions
 import objtypes
 
@@ -35,9 +40,18 @@ def table_data_from_db(table_name, table_data_repr):
     return actions.TableData(table_name, [], {})
   table_data_parsed = marshal.loads(table_data_repr)
   id_col = table_data_parsed.pop("id")
+  if columnar.is_encoded_column(id_col):
+    id_col = columnar.decode_column(id_col)
   return actions.TableData(table_name, id_col,
                            actions.decode_bulk_values(table_data_parsed, _decode_db_value))
 
+def table_data_from_file(table_name, path):
+  # Reads table data which Node wrote to a file, in the format described in table_file.py. Unlike
+  # data from the database, its cells are encoded as in doc actions, so use the default decoder.
+  bulk_values = table_file.read_table_file(path)
+  id_col = bulk_values.pop("id")
+  return actions.TableData(table_name, id_col, bulk_values)
+
 def _decode_db_value(value):
   # Decode database values received from SQLite's allMarshal() call. These are encoded by
   # marshalling certain types and storing as BLOBs (received in Python as binary strings, as
@@ -56,15 +70,29 @@ def _decode_db_value(value):
 
 def main():
   eng = engine.Engine()
+  # Optionally recompute independent parts of documents in parallel (see parallel_recompute.py).
+  eng.recompute_workers = int(os.environ.get('GRIST_RECOMPUTE_WORKERS') or 0)
+  # Optionally skip undo actions for recomputed formula values (see Engine.lazy_formula_undo).
+  eng.lazy_formula_undo = bool(os.environ.get('GRIST_LAZY_FORMULA_UNDO'))
+  # Optionally keep parsed formulas on disk (see formula_cache.py).
+  if os.environ.get('GRIST_FORMULA_CACHE_DIR'):
+    eng.gencode.disk_cache = formula_cache.FormulaCache(os.environ['GRIST_FORMULA_CACHE_DIR'])
 
   @export
-  def apply_user_actions(action_reprs):
+  def apply_user_actions(action_reprs, compact=False):
     action_group = eng.apply_user_actions([useractions.from_repr(u) for u in action_reprs])
-    return eng.acl_split(action_group).to_json_obj()
+    return eng.acl_split(action_group).to_json_obj(compact)
 
   @export
-  def fetch_table(table_id, formulas=True, query=None):
-    return actions.get_action_repr(eng.fetch_table(table_id, formulas=formulas, query=query))
+  def fetch_table(table_id, formulas=True, query=None, col_ids=None, start_row_id=None,
+                  limit=None, encode_columns=False):
+    table_data = eng.fetch_table(table_id, formulas=formulas, query=query, col_ids=col_ids,
+                                 start_row_id=start_row_id, limit=limit)
+    if encode_columns:
+      # Send columns in the binary format described in columnar.py.
+      return ['TableData', table_data.table_id, columnar.encode_column(table_data.row_ids),
+              columnar.encode_bulk_values(table_data.columns)]
+    return actions.get_action_repr(table_data)
 
   @export
   def fetch_table_schema():
@@ -97,6 +125,26 @@ def main():
   def load_table(table_name, table_data):
     return eng.load_table(table_data_from_db(table_name, table_data))
 
+  @export
+  def load_table_from_file(table_name, path):
+    return eng.load_table(table_data_from_file(table_name, path))
+
+  @export
+  def load_doc_from_sqlite(path):
+    return sqlite_reader.load_doc(eng, path)
+
+  @export
+  def get_unreferenced_tables():
+    return eng.get_unreferenced_tables()
+
+  @export
+  def defer_table(table_name):
+    return eng.defer_table(table_name)
+
+  def load_deferred_table(table_name):
+    return table_data_from_db(table_name, sandbox.call_external("fetch_table", table_name))
+  eng.deferred_table_loader = load_deferred_table
+
   @export
   def create_migrations(all_tables, metadata_only=False):
     doc_actions = migrations.create_migrations(
@@ -111,9 +159,15 @@ def main():
   def get_formula_error(table_id, col_id, row_id):
     return objtypes.encode_object(eng.get_formula_error(table_id, col_id, row_id))
 
+  export(eng.start_profiling)
+  export(eng.stop_profiling)
+  export(eng.get_profile)
+
   export(parse_acl_formula)
   export(eng.load_empty)
   export(eng.load_done)
+  export(eng.fetch_dependency_snapshot)
+  export(eng.load_dependency_snapshot)
 
   sandbox.run()
 
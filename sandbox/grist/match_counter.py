@@ -5,6 +5,25 @@ All elements of sample must be hashable.
 This is mainly in its own file in order to be able to test and time possible alternative
 implementations.
 """
+
+def distinct_values(iterable):
+  """
+  Returns a frozenset of the distinct hashable elements of iterable. It may be kept as a sketch of
+  a column's values, to count matches against repeatedly using MatchCounter.count_distinct().
+  """
+  values = list(iterable)
+  try:
+    return frozenset(values)
+  except TypeError:
+    return frozenset(v for v in values if _is_hashable(v))
+
+def _is_hashable(value):
+  try:
+    hash(value)
+    return True
+  except TypeError:
+    return False
+
 class MatchCounter(object):
   def __init__(self, sample):
     self.sample = set(sample)
@@ -29,3 +48,10 @@ class MatchCounter(object):
         pass
 
     return len(seen)
+
+  def count_distinct(self, distinct_values):
+    """
+    Returns the count of elements of distinct_values that are present in sample, for a set of
+    hashable values such as returned by distinct_values(). This is much faster than count_unique().
+    """
+    return len(self.sample.intersection(distinct_values))
@@ -47,7 +47,17 @@ def utc_to_ts_ms(dt):
 # Converts timestamp in seconds to datetime in the given timezone. If tzinfo is given, then zone
 # is ignored and may be None.
 def ts_to_dt(timestamp, zone, tzinfo=None):
-  return (EPOCH_UTC + timedelta(seconds=timestamp)).astimezone(tzinfo or zone.get_tzinfo(None))
+  if tzinfo is None:
+    return zone.ts_to_dt(timestamp)
+  if isinstance(tzinfo, TzInfo):
+    return tzinfo.zone.ts_to_dt(timestamp)
+  return (EPOCH_UTC + timedelta(seconds=timestamp)).astimezone(tzinfo)
+
+# Converts a list of timestamps in seconds to a list of datetimes in the given timezone. Falsy
+# timestamps (0 and None) are returned unchanged, as DateTime columns do for formulas.
+def ts_list_to_dt(timestamps, zone):
+  convert = zone.ts_to_dt
+  return [ts and convert(ts) for ts in timestamps]
 
 # Converts datetime to timestamp in seconds. Optional timezone may be given to serve as the
 # default if dt is unaware (has no associated timezone).
@@ -150,8 +160,8 @@ class TzInfo(_tzinfo):
 
   def fromutc(self, dt):
     # This produces a datetime with a specific offset, and sets tzinfo that favors that offset.
-    offset = self.zone.offset(utc_to_ts_ms(dt))
-    return (dt + offset).replace(tzinfo=self.zone.get_tzinfo(offset))
+    (offset, tzinfo) = self.zone.offset_info(utc_to_ts_ms(dt))
+    return (dt + offset).replace(tzinfo=tzinfo)
 
   def __repr__(self):
     """
@@ -182,14 +192,19 @@ class Zone(object):
     # datetime to absolute timestamp.
     self.offset_untils = [until - offset * 60000 for (until, offset) in
                           itertools.izip(self.untils, self.offsets)]
+    # The offsets as timedeltas east of UTC, to avoid creating them each time they are needed.
+    self._offset_deltas = [timedelta(minutes=-offset) for offset in self.offsets]
     # Cache of TzInfo objects for this Zone, used by get_tzinfo(). There could be multiple TzInfo
     # objects, one for each possible offset, but their behavior only differs for ambiguous time.
     self._tzinfo = {}
+    # The range of ms timestamps [start, end) of the last offset looked up by offset_info(), with
+    # the offset and its TzInfo. Nearby timestamps (which is common) skip the lookup.
+    self._last_range = (0, 0, None, None)
 
   def dt_offset(self, dt, favor_offset=None):
     """Returns the timedelta for timezone offset east of UTC at the given datetime."""
     i = self._index_dt(dt, favor_offset)
-    return timedelta(minutes = -self.offsets[i])
+    return self._offset_deltas[i]
 
   def dt_tzname(self, dt, favor_offset=None):
     """Returns the timezone abbreviation (e.g. EST or EDT) at the given datetime."""
@@ -199,7 +214,32 @@ class Zone(object):
   def offset(self, timestamp_ms):
     """Returns the timedelta for timezone offset east of UTC at the given ms timestamp."""
     i = self._index(timestamp_ms)
-    return timedelta(minutes = -self.offsets[i])
+    return self._offset_deltas[i]
+
+  def offset_info(self, timestamp_ms):
+    """
+    Returns the pair (offset, tzinfo) for the given ms timestamp, where offset is as returned by
+    offset(), and tzinfo is the TzInfo that favors that offset.
+    """
+    (start, end, offset, tzinfo) = self._last_range
+    if start <= timestamp_ms < end:
+      return (offset, tzinfo)
+    i = self._index(timestamp_ms)
+    offset = self._offset_deltas[i]
+    tzinfo = self.get_tzinfo(offset)
+    start = self.untils[i - 1] if i > 0 else float('-inf')
+    end = self.untils[i] if i < len(self.untils) else float('inf')
+    self._last_range = (start, end, offset, tzinfo)
+    return (offset, tzinfo)
+
+  def ts_to_dt(self, timestamp):
+    """
+    Returns the datetime in this timezone for the given timestamp in seconds. Same as
+    moment.ts_to_dt(timestamp, zone), but without going through datetime.astimezone().
+    """
+    delta = timedelta(seconds=timestamp)
+    (offset, tzinfo) = self.offset_info(delta.total_seconds() * 1000)
+    return (EPOCH + delta + offset).replace(tzinfo=tzinfo)
 
   def abbr(self, timestamp_ms):
     """Returns the timezone abbreviation (e.g. EST or EDT) at the given ms timestamp."""
@@ -221,7 +261,7 @@ class Zone(object):
     if i < len(self.offset_untils) and timestamp >= self.untils[i] - self.offsets[i + 1] * 60000:
       # We have an ambiguous time and can use self.offsets[i] or self.offsets[i + 1]. If
       # favor_offset matches the later offset, use that. Otherwise, prefer the earlier one.
-      if timedelta(minutes=-self.offsets[i + 1]) == favor_offset:
+      if self._offset_deltas[i + 1] == favor_offset:
         return i + 1
     return i
 
@@ -207,7 +207,7 @@ def decode_object(value):
     if code == 'R':
       return RecordStub(args[0], args[1])
     elif code == 'D':
-      return moment.ts_to_dt(args[0], moment.Zone(args[1]))
+      return moment.ts_to_dt(args[0], moment.get_zone(args[1]))
     elif code == 'd':
       return moment.ts_to_date(args[0])
     elif code == 'E':
@@ -0,0 +1,318 @@
+"""
+Recomputation of independent parts of a document in parallel worker processes.
+
+When a large recalculation is needed (e.g. on opening a document, or after a change to a formula
+used throughout), the dirty formulas often fall into groups of tables that have nothing to do with
+each other: no formula in one group uses data from another. Such groups may be recomputed
+independently, and recompute_in_workers() does so in forked copies of the engine, in parallel.
+
+Each worker brings its groups up to date, and sends back to the parent the values that changed,
+along with the resulting dependencies (as encoded by dep_snapshot.encode_dependencies()). The
+parent applies those as if it had done the work itself: the values get recorded in the engine's
+_changes_map, to produce the usual calc actions, and the dependencies get restored, so that later
+changes propagate as usual.
+
+Only groups that are known to be self-contained get handled this way. Groups involving metadata,
+summary tables, or tables whose loading was deferred stay with the parent, as does any group for
+which the worker notices something out of the ordinary: side-effects on other tables or on the
+actions being built up, dependencies outside the group, or values that can't be sent back
+faithfully (such as records in an Any column). Whatever isn't handled by a worker simply remains
+in engine.recompute_map, to be recomputed serially as usual.
+
+Note that this relies on os.fork(), so it's not available in sandboxes which don't support it.
+"""
+import cPickle
+import marshal
+import os
+import signal
+
+import dep_snapshot
+import depend
+import objtypes
+import summary
+
+import logger
+log = logger.Logger(__name__, logger.INFO)
+
+# Groups of tables with fewer dirty cells than this aren't worth the overhead of a worker.
+MIN_COMPONENT_CELLS = 10000
+
+_PLAIN_TYPES = (type(None), bool, int, long, float, str, unicode)
+
+
+class _Unsendable(Exception):
+  """
+  Raised internally for a result which can't be sent back to the parent faithfully.
+  """
+  pass
+
+
+def get_components(engine):
+  """
+  Returns a list of (table_ids, is_safe) pairs, one for each group of tables that are linked by
+  the schema (see Engine.get_table_links()) or by the dependency graph. A group is safe to
+  recompute in a worker if it involves no metadata, summary or deferred tables.
+  """
+  # pylint: disable=protected-access
+  parents = {table_id: table_id for table_id in engine.tables}
+  def find(table_id):
+    while parents[table_id] != table_id:
+      parents[table_id] = parents[parents[table_id]]
+      table_id = parents[table_id]
+    return table_id
+  def union(table_id1, table_id2):
+    if table_id1 in parents and table_id2 in parents:
+      parents[find(table_id1)] = find(table_id2)
+
+  for table_id, linked in engine.get_table_links().iteritems():
+    for other_table_id in linked:
+      union(table_id, other_table_id)
+  for edge in engine.dep_graph.iter_edges():
+    union(edge.out_node.table_id, edge.in_node.table_id)
+  meta_tables = [t for t in engine.tables if t.startswith('_grist_')]
+  for table_id in meta_tables[1:]:
+    union(table_id, meta_tables[0])
+
+  groups = {}
+  for table_id in engine.tables:
+    groups.setdefault(find(table_id), set()).add(table_id)
+
+  components = []
+  for table_ids in groups.itervalues():
+    is_safe = not any(t.startswith('_grist_') or summary.decode_summary_table_name(t) or
+                      t in engine._deferred_tables for t in table_ids)
+    components.append((table_ids, is_safe))
+  return components
+
+
+def _count_dirty_cells(engine, table_ids):
+  count = 0
+  for node, rows in engine.recompute_map.iteritems():
+    if node.table_id in table_ids:
+      count += (engine.tables[node.table_id].row_ids.max() if rows == depend.ALL_ROWS
+                else len(rows))
+  return count
+
+
+def recompute_in_workers(engine, max_workers):
+  """
+  Recomputes the dirty formulas of independent groups of tables in up to max_workers forked
+  processes, and applies the results to engine. Should be called at the start of an update (after
+  Engine._pre_update()). Whatever doesn't get recomputed is left in engine.recompute_map.
+  """
+  if max_workers < 2 or not hasattr(os, 'fork') or not engine.recompute_map:
+    return
+
+  work = []
+  for table_ids, is_safe in get_components(engine):
+    if is_safe:
+      cell_count = _count_dirty_cells(engine, table_ids)
+      if cell_count >= MIN_COMPONENT_CELLS:
+        work.append((cell_count, sorted(table_ids)))
+  if len(work) < 2:
+    return
+
+  # Assign groups to workers, largest first, each to the least loaded worker.
+  work.sort(reverse=True)
+  assignments = [[0, []] for _ in xrange(min(max_workers, len(work)))]
+  for cell_count, table_ids in work:
+    assignment = min(assignments)
+    assignment[0] += cell_count
+    assignment[1].append(table_ids)
+
+  workers = []
+  try:
+    for _, components in assignments:
+      read_fd, write_fd = os.pipe()
+      try:
+        pid = os.fork()
+      except OSError:
+        os.close(read_fd)
+        os.close(write_fd)
+        raise
+      if pid == 0:
+        os.close(read_fd)
+        _run_worker(engine, components, write_fd)
+      os.close(write_fd)
+      workers.append((pid, read_fd, components))
+  except OSError as e:
+    # E.g. if we are out of processes or file descriptors. The workers already started still get
+    # collected below; the groups of those that couldn't be started get recomputed serially.
+    log.warn("parallel_recompute: can't start worker: %s" % e)
+
+  for pid, read_fd, components in workers:
+    data = _read_worker_output(pid, read_fd)
+    try:
+      results = marshal.loads(data)
+    except (ValueError, EOFError, TypeError):
+      log.warn("parallel_recompute: worker %s failed" % pid)
+      continue
+    for table_ids, result in zip(components, results):
+      if result is not None:
+        _apply_result(engine, set(table_ids), result)
+
+
+def _read_worker_output(pid, read_fd):
+  """
+  Returns all that the given worker process writes to read_fd (or an empty string if that fails),
+  and waits for the process to exit.
+  """
+  try:
+    with os.fdopen(read_fd, 'rb') as pipe:
+      return pipe.read()
+  except (IOError, OSError) as e:
+    log.warn("parallel_recompute: can't read from worker %s: %s" % (pid, e))
+    try:
+      # Don't leave the worker blocked on writing to the pipe.
+      os.kill(pid, signal.SIGKILL)
+    except OSError:
+      pass
+    return ''
+  finally:
+    os.waitpid(pid, 0)
+
+
+def _run_worker(engine, components, write_fd):
+  """
+  Runs in a forked process: recomputes each group of tables, writes the list of results (with
+  None for groups that failed) to write_fd, and exits.
+  """
+  try:
+    results = []
+    for table_ids in components:
+      try:
+        results.append(_recompute_component(engine, set(table_ids)))
+      except Exception as e:   # pylint: disable=broad-except
+        log.info("parallel_recompute: recomputing %s failed: %s" % (table_ids, e))
+        results.append(None)
+    data = marshal.dumps(results)
+    with os.fdopen(write_fd, 'wb') as pipe:
+      pipe.write(data)
+  finally:
+    # Exit without any of the cleanup that the parent process is responsible for.
+    os._exit(0)   # pylint: disable=protected-access
+
+
+def _get_outside_state(engine, table_ids):
+  """
+  Returns what a worker must leave unchanged outside the given tables.
+  """
+  out_actions = engine.out_actions
+  return ({node: (rows if rows == depend.ALL_ROWS else list(rows))
+           for (node, rows) in engine.recompute_map.iteritems() if node.table_id not in table_ids},
+          len(out_actions.calc), len(out_actions.stored), len(out_actions.undo))
+
+
+def _is_marshallable(value):
+  try:
+    marshal.dumps(value)
+    return True
+  except ValueError:
+    return False
+
+
+def _encode_value(value):
+  """
+  Returns a marshallable encoding of a formula value, for _decode_value(), or raises _Unsendable.
+  """
+  # pylint: disable=unidiomatic-typecheck
+  if type(value) in _PLAIN_TYPES:
+    return ('V', value)
+  if type(value) in (list, tuple) and _is_marshallable(value):
+    return ('V', value)
+  if type(value) is objtypes.RecordList:
+    # pylint: disable=protected-access
+    encoded = ('L', list(value), value._group_by, value._sort_by)
+    if _is_marshallable(encoded):
+      return encoded
+  if isinstance(value, objtypes.RaisedException):
+    try:
+      error = cPickle.dumps(value.error, 2)
+      cPickle.loads(error)
+    except Exception:   # pylint: disable=broad-except
+      pass
+    else:
+      return ('E', error)
+  raise _Unsendable(repr(value))
+
+
+def _decode_value(encoded):
+  kind = encoded[0]
+  if kind == 'V':
+    return encoded[1]
+  if kind == 'L':
+    return objtypes.RecordList(encoded[1], group_by=encoded[2], sort_by=encoded[3])
+  return objtypes.RaisedException(cPickle.loads(encoded[1]))
+
+
+def _recompute_component(engine, table_ids):
+  """
+  Recomputes the dirty formulas of the given tables, and returns the result for _apply_result(),
+  or None if the work can't be taken over by the parent.
+  """
+  # pylint: disable=protected-access
+  engine._pre_update()
+  outside_state = _get_outside_state(engine, table_ids)
+  engine._recompute_tables(table_ids)
+  if _get_outside_state(engine, table_ids) != outside_state:
+    log.info("parallel_recompute: %s affected other tables" % (sorted(table_ids),))
+    return None
+
+  # Clean up lookup maps that are no longer used, as _bring_all_up_to_date() would.
+  for lookup_map in list(engine._unused_lookups):
+    if lookup_map.table_id in table_ids and engine.dep_graph.remove_node_if_unused(lookup_map.node):
+      engine.delete_column(lookup_map)
+
+  changes = []
+  for node, node_changes in engine._changes_map.iteritems():
+    if node.table_id not in table_ids:
+      return None
+    col = engine.tables[node.table_id].get_column(node.col_id)
+    row_ids = sorted({row_id for (row_id, _, _) in node_changes})
+    try:
+      values = [_encode_value(col.raw_get(row_id)) for row_id in row_ids]
+    except _Unsendable as e:
+      log.info("parallel_recompute: can't send value of %s: %s" % (node, e))
+      return None
+    changes.append((tuple(node), row_ids, values))
+
+  nodes = [col.node for table_id in sorted(table_ids)
+           for col in engine.tables[table_id].all_columns.itervalues() if col.is_formula()]
+  deps = dep_snapshot.encode_dependencies(engine, nodes)
+  if deps is None:
+    return None
+  if any(in_node[0] not in table_ids for (_, in_node, _) in deps['edges']):
+    log.info("parallel_recompute: %s depends on other tables" % (sorted(table_ids),))
+    return None
+  return {'changes': changes, 'deps': deps}
+
+
+def _apply_result(engine, table_ids, result):
+  """
+  Applies the result of _recompute_component() to the engine, as if it had recomputed the given
+  tables itself.
+  """
+  # pylint: disable=protected-access
+  try:
+    changes = [(depend.Node(*node), row_ids, map(_decode_value, values))
+               for (node, row_ids, values) in result['changes']]
+  except Exception as e:   # pylint: disable=broad-except
+    log.warn("parallel_recompute: can't decode values for %s: %s" % (sorted(table_ids), e))
+    return
+
+  for node, row_ids, values in changes:
+    col = engine.tables[node.table_id].get_column(node.col_id)
+    node_changes = None
+    for row_id, value in zip(row_ids, values):
+      previous = col.raw_get(row_id)
+      if not objtypes.strict_equal(value, previous):
+        if node_changes is None:
+          node_changes = engine._changes_map.setdefault(node, [])
+        node_changes.append((row_id, previous, value))
+        col.set(row_id, value)
+
+  dep_snapshot.restore_dependencies(engine, result['deps'])
+  for node in list(engine.recompute_map):
+    if node.table_id in table_ids:
+      del engine.recompute_map[node]
+      engine.dep_graph.forget_dirty(node)
@@ -0,0 +1,91 @@
+"""
+Profiling of formula evaluation, to find out which columns dominate recompute time.
+
+When profiling is on (see Engine.start_profiling()), the engine reports to a Profiler each step of
+recomputing a node (i.e. a column), along with lookups done by formulas and reorderings of the
+evaluation caused by cells that weren't yet up-to-date. The Profiler keeps statistics for each
+node, and produces a report ranking nodes by the time spent evaluating them.
+
+Time is attributed to the node whose cells are being evaluated, excluding time spent recomputing
+other nodes on the way (e.g. when a formula needs a dirty cell of another column).
+"""
+import time
+
+
+class NodeStats(object):
+  """
+  Statistics collected for one node.
+  """
+  __slots__ = ('cells', 'time', 'reorders', 'lookups', 'changed')
+
+  def __init__(self):
+    self.cells = 0        # Number of cells evaluated.
+    self.time = 0.0       # Total wall time spent evaluating cells, in seconds.
+    self.reorders = 0     # Number of times evaluation got reordered for a cell of this node.
+    self.lookups = 0      # Number of lookups done by the node's formula.
+    self.changed = 0      # Number of cells whose value changed.
+
+
+class Profiler(object):
+  """
+  Collects NodeStats for all nodes recomputed while it's active.
+  """
+  def __init__(self):
+    self._stats = {}
+    # Stack of [node, start_time, cells_done, child_time] lists for steps in progress.
+    self._steps = []
+
+  def _get_stats(self, node):
+    stats = self._stats.get(node)
+    if stats is None:
+      stats = self._stats[node] = NodeStats()
+    return stats
+
+  def start_step(self, node, cells_done):
+    """
+    Called at the start of a step of recomputing a node, with the number of its cells done so far.
+    """
+    self._steps.append([node, time.time(), cells_done, 0.0])
+
+  def end_step(self, cells_done, changed):
+    """
+    Called at the end of the step started last, with the number of cells of its node done so far,
+    and the number of cells whose value changed in the step.
+    """
+    node, start_time, start_cells_done, child_time = self._steps.pop()
+    elapsed = time.time() - start_time
+    stats = self._get_stats(node)
+    stats.time += elapsed - child_time
+    stats.cells += max(cells_done - start_cells_done, 0)
+    stats.changed += changed
+    if self._steps:
+      self._steps[-1][3] += elapsed
+
+  def record_reorder(self, node):
+    """
+    Called when evaluation of the given node had to be postponed to compute a cell it needs.
+    """
+    self._get_stats(node).reorders += 1
+
+  def record_lookup(self, node):
+    """
+    Called for each lookup done while evaluating a formula of the given node.
+    """
+    self._get_stats(node).lookups += 1
+
+  def get_report(self, limit=None):
+    """
+    Returns a list of dicts with the statistics of each node, sorted by decreasing total time, and
+    limited to the first `limit` entries if limit is given.
+    """
+    ranked = sorted(self._stats.iteritems(), key=lambda item: (-item[1].time, item[0]))
+    return [{
+      "tableId": node.table_id,
+      "colId": node.col_id,
+      "cells": stats.cells,
+      "totalTime": stats.time,
+      "meanTime": stats.time / stats.cells if stats.cells else 0.0,
+      "reorders": stats.reorders,
+      "lookups": stats.lookups,
+      "changed": stats.changed,
+    } for (node, stats) in ranked[:limit]]
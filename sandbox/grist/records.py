@@ -189,8 +189,12 @@ class ColumnView(object):
     return len(self._row_ids)
 
   def __iter__(self):
-    for row_id in self._row_ids:
-      yield adjust_record(self._source_relation, self._column.get_cell_value(row_id))
+    return self._column.iter_cell_values_via(self._row_ids, self._source_relation)
+
+  def _get_stored_values(self):
+    # Returns the list of values in this view read straight from the column's typed storage, or
+    # None if that's not possible. See BaseColumn.get_stored_cell_values().
+    return self._column.get_stored_cell_values(self._row_ids)
 
   def __eq__(self, other):
     return (isinstance(other, ColumnView) and
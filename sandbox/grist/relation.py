@@ -42,9 +42,21 @@ class Relation(object):
     pass
 
   def compose(self, other_relation):
+    """
+    Returns the ComposedRelation of this relation followed by other_relation. Compositions are
+    interned: composing the same relations always returns the same object, however the
+    compositions are grouped, so that each distinct chain of relations produces a single edge in
+    the dependency graph.
+    """
     r = self._target_relations.get(other_relation)
     if r is None:
-      r = self._target_relations[other_relation] = ComposedRelation(self, other_relation)
+      if isinstance(other_relation, ComposedRelation):
+        # Compositions are kept in the canonical form ((A + B) + C), so A + (B + C) is the same
+        # object. This doesn't affect reset_rows(), which only concerns the first relation.
+        r = self.compose(other_relation.source_relation).compose(other_relation.target_relation)
+      else:
+        r = ComposedRelation(self, other_relation)
+      self._target_relations[other_relation] = r
     return r
 
 class IdentityRelation(Relation):
@@ -78,9 +90,19 @@ class ComposedRelation(Relation):
     self.source_relation = referring_side
     self.target_relation = target_side
 
+    # The chain of non-composed relations, in the order in which to map rows (i.e. starting with
+    # the last one), so that long chains are followed in a loop rather than by recursion.
+    self._chain = (getattr(target_side, '_chain', [target_side]) +
+                   getattr(referring_side, '_chain', [referring_side]))
+
   def get_affected_rows(self, input_rows):
-    return self.source_relation.get_affected_rows(
-      self.target_relation.get_affected_rows(input_rows))
+    rows = input_rows
+    for rel in self._chain:
+      rows = rel.get_affected_rows(rows)
+      if not rows:
+        # Nothing further along the chain can be affected.
+        return set()
+    return rows
 
   def reset_rows(self, referring_rows):
     # In the example from the doc-string, this says that certain Students are being recomputed, so
@@ -0,0 +1,138 @@
+"""
+RowSet is a compact set of row_ids, used to keep track of dirty rows while recomputing formulas.
+
+Row ids are positive ints that tend to be dense and clustered (e.g. all rows of a table, or those
+added by a bulk action). RowSet stores them as a bitmap: a dict mapping chunk numbers to ints whose
+bits mark which row_ids of the chunk are present. Compared to a set or a SortedSet of ints, this
+takes a small fraction of the memory, makes union and difference with another RowSet operate a
+chunk at a time, and allows iteration in sorted order without maintaining a sorted list.
+"""
+# Each chunk covers 2**_CHUNK_SHIFT row_ids, so that chunk bitmaps stay plain (not long) ints.
+_CHUNK_SHIFT = 5
+_CHUNK_MASK = (1 << _CHUNK_SHIFT) - 1
+
+# For each byte value, the tuple of positions of its set bits.
+_BYTE_BITS = [tuple(i for i in xrange(8) if byte & (1 << i)) for byte in xrange(256)]
+
+
+def _count_bits(bits):
+  return bin(bits).count('1')
+
+
+class RowSet(object):
+  """
+  A set of non-negative ints (row_ids), which iterates in sorted order. Supports the subset of set
+  operations that the engine needs.
+  """
+  __slots__ = ('_chunks', '_len')
+
+  def __init__(self, row_ids=()):
+    self._chunks = {}
+    self._len = 0
+    if row_ids:
+      self.update(row_ids)
+
+  def __len__(self):
+    return self._len
+
+  def __nonzero__(self):
+    return self._len > 0
+
+  def __contains__(self, row_id):
+    return bool(self._chunks.get(row_id >> _CHUNK_SHIFT, 0) & (1 << (row_id & _CHUNK_MASK)))
+
+  def __iter__(self):
+    chunks = self._chunks
+    for chunk in sorted(chunks):
+      # The chunk may get removed if the set is modified while iterating.
+      bits = chunks.get(chunk, 0)
+      base = chunk << _CHUNK_SHIFT
+      while bits:
+        for i in _BYTE_BITS[bits & 0xFF]:
+          yield base + i
+        bits >>= 8
+        base += 8
+
+  def __eq__(self, other):
+    if isinstance(other, RowSet):
+      return self._len == other._len and self._chunks == other._chunks
+    if isinstance(other, (set, frozenset)):
+      return self._len == len(other) and all(r in self for r in other)
+    return NotImplemented
+
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    return result if result is NotImplemented else not result
+
+  __hash__ = None
+
+  def __repr__(self):
+    return "RowSet(%r)" % (list(self),)
+
+  def add(self, row_id):
+    chunk = row_id >> _CHUNK_SHIFT
+    bit = 1 << (row_id & _CHUNK_MASK)
+    bits = self._chunks.get(chunk, 0)
+    if not bits & bit:
+      self._chunks[chunk] = bits | bit
+      self._len += 1
+
+  def discard(self, row_id):
+    chunk = row_id >> _CHUNK_SHIFT
+    bit = 1 << (row_id & _CHUNK_MASK)
+    bits = self._chunks.get(chunk, 0)
+    if bits & bit:
+      bits ^= bit
+      if bits:
+        self._chunks[chunk] = bits
+      else:
+        del self._chunks[chunk]
+      self._len -= 1
+
+  def update(self, row_ids):
+    """
+    Adds all the given row_ids, which may be another RowSet or any iterable of ints.
+    """
+    chunks = self._chunks
+    if isinstance(row_ids, RowSet):
+      for chunk, other_bits in row_ids._chunks.iteritems():
+        bits = chunks.get(chunk, 0)
+        new_bits = bits | other_bits
+        if new_bits != bits:
+          chunks[chunk] = new_bits
+          self._len += _count_bits(new_bits) - _count_bits(bits)
+      return
+
+    count = 0
+    get_bits = chunks.get
+    for row_id in row_ids:
+      chunk = row_id >> _CHUNK_SHIFT
+      bit = 1 << (row_id & _CHUNK_MASK)
+      bits = get_bits(chunk, 0)
+      if not bits & bit:
+        chunks[chunk] = bits | bit
+        count += 1
+    self._len += count
+
+  def difference_update(self, row_ids):
+    """
+    Removes all the given row_ids, which may be another RowSet or any iterable of ints.
+    """
+    chunks = self._chunks
+    if not isinstance(row_ids, RowSet):
+      row_ids = RowSet(row_ids)
+    for chunk, other_bits in row_ids._chunks.iteritems():
+      bits = chunks.get(chunk, 0)
+      new_bits = bits & ~other_bits
+      if new_bits != bits:
+        if new_bits:
+          chunks[chunk] = new_bits
+        else:
+          del chunks[chunk]
+        self._len -= _count_bits(bits) - _count_bits(new_bits)
+
+  def copy(self):
+    result = RowSet()
+    result._chunks = self._chunks.copy()
+    result._len = self._len
+    return result
@@ -12,9 +12,13 @@ Usage:
 import os
 import marshal
 import signal
+import struct
 import sys
 import traceback
 
+# The type code with which marshal starts a string.
+_MARSHAL_STRING_TYPE = 's'
+
 def log(msg):
   sys.stderr.write(str(msg) + "\n")
   sys.stderr.flush()
@@ -47,9 +51,11 @@ class Sandbox(object):
 
     # For large data, JS's Unmarshaller is very inefficient parsing it if it gets it piecewise.
     # It's much better to ensure the whole blob is sent as one write. We marshal the resulting
-    # buffer again so that the reader can quickly tell how many bytes to expect.
+    # buffer again so that the reader can quickly tell how many bytes to expect. That's done by
+    # writing the header of a marshalled string directly, to avoid copying large buffers.
     buf = marshal.dumps((msgCode, msgBody), 2)
-    marshal.dump(buf, self._external_output, 2)
+    self._external_output.write(_MARSHAL_STRING_TYPE + struct.pack('<i', len(buf)))
+    self._external_output.write(buf)
     self._external_output.flush()
 
   def call_external(self, name, *args):
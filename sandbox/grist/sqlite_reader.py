@@ -0,0 +1,106 @@
+"""
+Reads the data of a Grist document directly from its SQLite file.
+
+Normally, Node reads each table from SQLite, marshals it, and sends it to the sandbox, which
+unmarshals it and then decodes the marshalled blobs in it (see main.table_data_from_db()). When the
+sandbox is able to read the document file itself, load_doc() loads all tables into the engine
+straight from SQLite, saving a serialization round trip per table.
+
+Values are stored in SQLite as encoded by DocStorage: numbers and text as themselves, and other
+values marshalled into blobs. Text gets read as utf8-encoded binary strings, which is what the
+sandbox uses, so only blobs need decoding.
+"""
+from itertools import izip
+import marshal
+import sqlite3
+
+import actions
+import objtypes
+
+import logger
+log = logger.Logger(__name__, logger.INFO)
+
+# Number of rows to fetch from SQLite at once.
+FETCH_SIZE = 10000
+
+
+def quote_ident(ident):
+  return '"%s"' % ident.replace('"', '""')
+
+
+def decode_blob(value):
+  return objtypes.decode_object(marshal.loads(value))
+
+
+def _decode_column(values):
+  """
+  Decodes the blobs among the given list of values, in place.
+  """
+  # Most columns contain no blobs, in which case it's faster to find that out without a loop.
+  if buffer in set(map(type, values)):
+    for i, value in enumerate(values):
+      if type(value) is buffer:
+        values[i] = decode_blob(value)
+  return values
+
+
+class DocReader(object):
+  """
+  Reads tables from the SQLite file of a Grist document, which it opens for reading only.
+  """
+  def __init__(self, path):
+    self._conn = sqlite3.connect(path)
+    self._conn.text_factory = str
+    self._conn.execute("PRAGMA query_only = ON")
+
+  def close(self):
+    self._conn.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def get_table_ids(self):
+    """
+    Returns the set of all tables in the file.
+    """
+    cursor = self._conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    return {row[0] for row in cursor}
+
+  def read_table(self, table_id):
+    """
+    Returns the data of the given table as an actions.TableData object.
+    """
+    cursor = self._conn.execute("SELECT * FROM %s" % quote_ident(table_id))
+    col_ids = [desc[0] for desc in cursor.description]
+    columns = [[] for _ in col_ids]
+    while True:
+      rows = cursor.fetchmany(FETCH_SIZE)
+      if not rows:
+        break
+      # Transpose the chunk of rows, to extend each column with its values at C speed.
+      for values, chunk in izip(columns, izip(*rows)):
+        values.extend(chunk)
+
+    bulk_values = {col_id: _decode_column(values) for (col_id, values) in izip(col_ids, columns)}
+    row_ids = bulk_values.pop("id")
+    return actions.TableData(table_id, row_ids, bulk_values)
+
+
+def load_doc(engine, path):
+  """
+  Loads the metadata and all tables of the document at the given path into the engine, like the
+  load_meta_tables() and load_table() calls would. Tables missing from the file are left empty.
+  Returns the list of the loaded tables. The caller should still call engine.load_done().
+  """
+  with DocReader(path) as reader:
+    all_table_ids = engine.load_meta_tables(reader.read_table("_grist_Tables"),
+                                            reader.read_table("_grist_Tables_column"))
+    existing = reader.get_table_ids()
+    table_ids = [t for t in all_table_ids if t in existing]
+    for table_id in table_ids:
+      engine.load_table(reader.read_table(table_id))
+  log.info("Loaded %d tables from %s" % (len(table_ids), path))
+  return table_ids
@@ -4,6 +4,7 @@ import types
 import column
 import depend
 import docmodel
+import group_aggregate
 import lookup
 import records
 import relation as relation_module    # "relation" is used too much as a variable name below.
@@ -95,6 +96,25 @@ class UserTable(object):
     """
     return self.table.lookup_one_record(**field_value_pairs)
 
+  def lookupRange(self, col_id, start=None, end=None, prefix=None, **field_value_pairs):
+    """
+    Returns the Records from this table whose `col_id` field is at least `start` and less than
+    `end`, and which match the given field=value arguments. Either bound may be omitted. If
+    `prefix` is given, includes only the records whose `col_id` field starts with it. The records
+    are sorted by the `col_id` field.
+
+    For example:
+    ```
+    Orders.lookupRange("Date", $Start_Date, $End_Date)
+    Orders.lookupRange("Date", end=$Date, Customer=$Customer)
+    People.lookupRange("Last_Name", prefix="Mc")
+    ```
+
+    Unlike a formula like `[r for r in Orders.all if a <= r.Date < b]`, the lookup is fast, and
+    only gets re-evaluated when records within the range change.
+    """
+    return self.table.lookup_range(col_id, start, end, prefix, **field_value_pairs)
+
   def lookupOrAddDerived(self, **kwargs):
     return self.table.lookupOrAddDerived(**kwargs)
 
@@ -144,7 +164,13 @@ class Table(object):
       return row_id < self._id_column.size() and self._id_column.raw_get(row_id) > 0
 
     def __iter__(self):
-      for row_id in xrange(self._id_column.size()):
+      return self.iter_from(0)
+
+    def iter_from(self, start_row_id):
+      """
+      Iterates through the valid row IDs which are greater than or equal to start_row_id.
+      """
+      for row_id in xrange(max(start_row_id, 0), self._id_column.size()):
         if self._id_column.raw_get(row_id) > 0:
           yield row_id
 
@@ -175,9 +201,9 @@ class Table(object):
     # on this node, and triggers recomputation when columns are added or renamed.
     self._new_columns_node = depend.Node(self.table_id, None)
 
-    # Collection of special columns that this table maintains, which include LookupMapColumns
-    # and formula columns for maintaining summary tables. These persist across table rebuilds, and
-    # get cleaned up with delete_column().
+    # Collection of special columns that this table maintains, which include LookupMapColumns,
+    # GroupAggregateColumns, and formula columns for maintaining summary tables. These persist
+    # across table rebuilds, and get cleaned up with delete_column().
     self._special_cols = {}
 
     # Maintain Column objects both as a mapping from col_id and as an ordered list.
@@ -339,6 +365,19 @@ class Table(object):
   def lookup_one_record(self, **kwargs):
     return self.lookup_records(**kwargs).get_one()
 
+  def lookup_range(self, range_col_id, start, end, prefix, **kwargs):
+    """
+    Returns the records matching the given column=value arguments whose value in range_col_id is
+    within [start, end) and starts with prefix (where None means no restriction), sorted by that
+    value. It creates the necessary dependencies, and maintains an ordered index for the lookups.
+    """
+    col_ids = tuple(sorted(kwargs.iterkeys()))
+    key = tuple(kwargs[c] for c in col_ids)
+
+    range_map = self._get_range_lookup_map(range_col_id, col_ids)
+    row_ids, rel = range_map.do_lookup(key, start, end, prefix)
+    return self.RecordSet(self, row_ids, rel, group_by=kwargs, sort_by=range_col_id)
+
   def _get_lookup_map(self, col_ids_tuple):
     """
     Helper which returns the LookupMapColumn for the given combination of lookup columns. A
@@ -359,6 +398,37 @@ class Table(object):
       self.all_columns[lookup_col_id] = lmap
     return lmap
 
+  def _get_range_lookup_map(self, range_col_id, col_ids_tuple):
+    """
+    Helper which returns the RangeLookupMapColumn that orders by range_col_id the rows for each
+    combination of values of the given exact-match lookup columns.
+    """
+    lookup_col_id = "#lookup#range#%s#%s" % (range_col_id, ":".join(col_ids_tuple))
+    lmap = self._special_cols.get(lookup_col_id)
+    if not lmap:
+      for c in (range_col_id,) + col_ids_tuple:
+        if not self.has_column(c):
+          raise KeyError("Table %s has no column %s" % (self.table_id, c))
+      lmap = lookup.RangeLookupMapColumn(self, lookup_col_id, col_ids_tuple, range_col_id)
+      self._special_cols[lookup_col_id] = lmap
+      self.all_columns[lookup_col_id] = lmap
+    return lmap
+
+  def _get_group_aggregate(self, summary_table, value_col_id, ordered):
+    """
+    Helper which returns the GroupAggregateColumn maintaining totals of value_col_id (or just
+    record counts if None) for the groups of the given summary table of this table.
+    """
+    aggregate_col_id = "#aggregate#%s:%s%s" % (summary_table.table_id, value_col_id or "",
+                                               ":ordered" if ordered else "")
+    aggregate_col = self._special_cols.get(aggregate_col_id)
+    if not aggregate_col:
+      aggregate_col = group_aggregate.GroupAggregateColumn(self, aggregate_col_id, summary_table,
+                                                           value_col_id, ordered)
+      self._special_cols[aggregate_col_id] = aggregate_col
+      self.all_columns[aggregate_col_id] = aggregate_col
+    return aggregate_col
+
   def delete_column(self, col_obj):
     assert col_obj.table_id == self.table_id
     self._special_cols.pop(col_obj.col_id, None)
@@ -440,8 +510,7 @@ class Table(object):
 
   # Called when record.foo is accessed
   def _get_col_value(self, col_id, row_id, relation):
-    return records.adjust_record(relation,
-                          self._use_column(col_id, relation, [row_id]).get_cell_value(row_id))
+    return self._use_column(col_id, relation, [row_id]).get_cell_value_via(row_id, relation)
 
   def _attribute_error(self, col_id, relation):
     self._engine._use_node(self._new_columns_node, relation)
@@ -0,0 +1,98 @@
+"""
+Reading and writing of table files, through which table data may be handed to the sandbox at load
+time without sending it through the pipe.
+
+Sending a large table as a single marshalled message means that the whole payload is buffered on
+both sides of the pipe. Instead, the data may be written to a file which the sandbox maps into
+memory, decoding columns straight from the mapped pages.
+
+A table file consists of:
+  - MAGIC (8 bytes).
+  - The length of the header, as a little-endian 4-byte unsigned int.
+  - The header: a marshalled dict mapping col_ids (including "id") to columns, as in the data
+    passed to main.load_table(). Columns may be encoded as described in columnar.py, except that
+    their "data" and "offsets" are [start, length] pairs locating the bytes in the data section.
+  - The data section, which starts right after the header.
+
+Cell values (in columns which aren't encoded, and outliers of encoded ones) are encoded as in doc
+actions, i.e. with objtypes.encode_object(), not as DocStorage stores them in SQLite.
+"""
+import marshal
+import mmap
+import struct
+
+import columnar
+import objtypes
+
+MAGIC = "GRISTTF1"
+
+_HEADER_LEN = struct.Struct('<I')
+
+# Fields of encoded columns which are stored in the data section.
+_DATA_FIELDS = ("data", "offsets")
+
+# Chunks in the data section are aligned to this many bytes.
+_ALIGNMENT = 8
+
+
+def read_table_file(path, decoder=objtypes.decode_object):
+  """
+  Reads the table file at the given path, and returns a dict mapping col_ids (including "id") to
+  lists of values, with cell values decoded using decoder.
+  """
+  with open(path, 'rb') as f:
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    if mapped[:len(MAGIC)] != MAGIC:
+      raise ValueError("Not a table file: %s" % path)
+    start = len(MAGIC) + _HEADER_LEN.size
+    (header_len,) = _HEADER_LEN.unpack(mapped[len(MAGIC):start])
+    header = marshal.loads(mapped[start:start + header_len])
+    data_start = start + header_len
+
+    bulk_values = {}
+    for col_id, column in header.iteritems():
+      if columnar.is_encoded_column(column):
+        column = column.copy()
+        for field in _DATA_FIELDS:
+          if field in column:
+            (offset, length) = column[field]
+            if offset < 0 or data_start + offset + length > len(mapped):
+              raise ValueError("Table file %s is truncated" % path)
+            # A buffer refers to the mapped pages, so the bytes only get copied once decoded.
+            column[field] = buffer(mapped, data_start + offset, length)
+        bulk_values[col_id] = columnar.decode_column(column, decoder)
+      else:
+        bulk_values[col_id] = map(decoder, column)
+    return bulk_values
+  finally:
+    mapped.close()
+
+
+def write_table_file(path, bulk_values, encoder=objtypes.encode_object):
+  """
+  Writes a table file to the given path, for bulk_values that map col_ids (including "id") to
+  lists of values. Columns are encoded with columnar.encode_column() when possible.
+  """
+  header = {}
+  chunks = []
+  position = 0
+  for col_id, values in sorted(bulk_values.iteritems()):
+    column = columnar.encode_column(values, encoder)
+    if columnar.is_encoded_column(column):
+      for field in _DATA_FIELDS:
+        if field in column:
+          data = column[field]
+          padding = -len(data) % _ALIGNMENT
+          chunks.append(data + "\0" * padding)
+          column[field] = [position, len(data)]
+          position += len(data) + padding
+    header[col_id] = column
+
+  header_bytes = marshal.dumps(header, 2)
+  with open(path, 'wb') as f:
+    f.write(MAGIC)
+    f.write(_HEADER_LEN.pack(len(header_bytes)))
+    f.write(header_bytes)
+    for chunk in chunks:
+      f.write(chunk)
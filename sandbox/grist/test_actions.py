@@ -14,6 +14,41 @@ class TestActions(unittest.TestCase):
       actions.action_from_repr(["Foo", "bar"])
     self.assertTrue("Foo" in str(err.exception))
 
+  def test_compact_repr(self):
+    # Bulk actions with long runs of row_ids and values get encoded compactly.
+    row_ids = range(1, 101) + range(201, 301)
+    action = actions.BulkUpdateRecord("foo", row_ids, {"bar": [1.5] * 150 + [None] * 50})
+    doc_action = actions.get_action_repr(action, compact=True)
+    self.assertEqual(doc_action, ["BulkUpdateRecord", "foo",
+                                  {"type": "ranges", "starts": [1, 201], "counts": [100, 100]},
+                                  {"bar": {"type": "runs", "values": [1.5, None],
+                                           "counts": [150, 50]}}])
+    self.assertEqual(actions.action_from_repr(doc_action), action)
+
+    # Short or varied values are encoded as usual.
+    self.assertEqual(actions.get_action_repr(self.action_obj1, compact=True), self.doc_action1)
+    action = actions.BulkAddRecord("foo", [3, 1, 2], {"bar": [[1], None, "x"]})
+    self.assertEqual(actions.get_action_repr(action, compact=True),
+                     ["BulkAddRecord", "foo", [3, 1, 2], {"bar": [["L", 1], None, "x"]}])
+
+  def test_compact_repr_outliers(self):
+    # Compact actions with outliers survive a trip through Node, whose marshalling turns all dict
+    # keys into strings, as when undo actions get passed back to ApplyUndoActions.
+    def stringify_keys(data):
+      if isinstance(data, dict):
+        return {unicode(k): stringify_keys(v) for (k, v) in data.iteritems()}
+      if isinstance(data, list):
+        return [stringify_keys(v) for v in data]
+      return data
+
+    values = [i * 0.5 for i in xrange(50)]
+    values[7] = None
+    values[30] = "n/a"
+    action = actions.BulkUpdateRecord("foo", range(1, 51), {"bar": values})
+    doc_action = actions.get_action_repr(action, compact=True)
+    self.assertEqual(doc_action[3]["bar"]["outlier_indices"], [7, 30])
+    self.assertEqual(actions.action_from_repr(stringify_keys(doc_action)), action)
+
   def test_prune_actions(self):
     # prune_actions is in-place, so we make a new list every time.
     def alist():
@@ -0,0 +1,76 @@
+"""
+Tests that simple formulas evaluated in batch behave the same as those evaluated per cell.
+"""
+import objtypes
+import test_engine
+import testutil
+
+class TestBatchFormulas(test_engine.EngineTestCase):
+
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Items", [
+        [11, "A",       "Numeric", False, "", "", ""],
+        [12, "B",       "Numeric", False, "", "", ""],
+        [13, "Product", "Numeric", True, "$A * $B", "", ""],
+        [14, "Ratio",   "Numeric", True, "$A / $B", "", ""],
+        [15, "Big",     "Bool",    True, "$Product > 10", "", ""],
+      ]]
+    ],
+    "DATA": {
+      "Items": [
+        ["id", "A",   "B"],
+        [1,    2.0,   3.0],
+        [2,    4.0,   0.0],
+        [3,    "x",   2.0],
+        [4,    5.0,   5.0],
+      ]
+    }
+  })
+
+  def test_batch_formulas(self):
+    self.load_sample(self.sample)
+    self.assertTableData("Items", cols="subset", data=[
+      ["id", "Product", "Big"],
+      [1,    6.0,       False],
+      [2,    0.0,       False],
+      [3,    objtypes.RaisedException(TypeError()), objtypes.RaisedException(TypeError())],
+      [4,    25.0,      True],
+    ])
+
+    # Exceptions raised by the formula come out as for per-cell evaluation, with details.
+    error = self.engine.get_formula_error("Items", "Ratio", 2)
+    self.assertIsInstance(error, objtypes.RaisedException)
+    self.assertIsInstance(error.error, ZeroDivisionError)
+    self.assertRegexpMatches(error.details, r"ZeroDivisionError")
+    self.assertEqual(self.engine.tables["Items"].get_column("Ratio").raw_get(1), 2.0/3.0)
+
+    # Dependencies on fields used by batch-evaluated formulas get updated.
+    out_actions = self.update_record("Items", 3, A=7.0)
+    self.assertEqual(out_actions.calls, {"Items": {"Product": 1, "Ratio": 1, "Big": 1}})
+    self.assertTableData("Items", cols="subset", data=[
+      ["id", "Product", "Ratio", "Big"],
+      [1,    6.0,       2.0/3.0, False],
+      [2,    0.0,       objtypes.RaisedException(ZeroDivisionError()), False],
+      [3,    14.0,      3.5,     True],
+      [4,    25.0,      1.0,     True],
+    ])
+
+    self.update_records("Items", ["id", "B"], [[1, 10.0], [4, 1.0]])
+    self.assertTableData("Items", cols="subset", data=[
+      ["id", "Product", "Big"],
+      [1,    20.0,      True],
+      [2,    0.0,       False],
+      [3,    14.0,      True],
+      [4,    5.0,       False],
+    ])
+
+    # Changing the formula to one that can't be evaluated in batch still works.
+    self.modify_column("Items", "Product", formula="max($A, $B)")
+    self.assertTableData("Items", cols="subset", data=[
+      ["id", "Product", "Big"],
+      [1,    10.0,      False],
+      [2,    4.0,       False],
+      [3,    7.0,       False],
+      [4,    5.0,       False],
+    ])
@@ -181,3 +181,34 @@ return x or y
 
     # Check that missing arguments is OK
     self.assertEqual(make_body("ISERR()"), "return ISERR()")
+
+  def test_make_batch_formula(self):
+    batch = codebuilder.make_batch_formula("$A * $B")
+    self.assertEqual(batch.col_ids, ('A', 'B'))
+    self.assertEqual(batch.func(3, 4), 12)
+
+    batch = codebuilder.make_batch_formula("rec.A + $A / 2 if $B else None")
+    self.assertEqual(batch.col_ids, ('B', 'A'))
+    self.assertEqual(batch.func(True, 4.0), 6.0)
+    self.assertEqual(batch.func(False, 4.0), None)
+
+    batch = codebuilder.make_batch_formula(u"$Name + '!' # ✓")
+    self.assertEqual(batch.col_ids, ('Name',))
+    self.assertEqual(batch.func(u'x'), u'x!')
+
+    batch = codebuilder.make_batch_formula("17")
+    self.assertEqual(batch.col_ids, ())
+    self.assertEqual(batch.func(), 17)
+
+    # Anything involving calls, attributes of fields, other names, or statements is not eligible.
+    self.assertIsNone(codebuilder.make_batch_formula(""))
+    self.assertIsNone(codebuilder.make_batch_formula("len($A)"))
+    self.assertIsNone(codebuilder.make_batch_formula("$A.B"))
+    self.assertIsNone(codebuilder.make_batch_formula("$A + x"))
+    self.assertIsNone(codebuilder.make_batch_formula("[$A]"))
+    self.assertIsNone(codebuilder.make_batch_formula("x = $A\nreturn x"))
+    self.assertIsNone(codebuilder.make_batch_formula("$A +"))
+    self.assertIsNone(codebuilder.make_batch_formula("DOLLARA + 1"))
+
+    # A dollar sign inside a string literal must not be treated as a field reference.
+    self.assertIsNone(codebuilder.make_batch_formula("'$A' + $B"))
@@ -451,3 +451,23 @@ class TestColumnActions(test_engine.EngineTestCase):
       [3,     '[-16]'      ],
       [4,     '[]'         ],
     ])
+
+  def test_column_add_rebuilds_one_table(self):
+    # Schema changes to one table only rebuild the model of that table.
+    self.load_sample(self.sample)
+    self.apply_user_action(["AddTable", "Other", [{"id": "name", "type": "Text"}]])
+    other_user_table = self.engine.tables["Other"].user_table
+    meta_user_table = self.engine.tables["_grist_Tables_column"].user_table
+    address_user_table = self.engine.tables["Address"].user_table
+
+    self.apply_user_action(["AddColumn", "Address", "upper", {"formula": "$city.upper()"}])
+    self.assertIs(self.engine.tables["Other"].user_table, other_user_table)
+    self.assertIs(self.engine.tables["_grist_Tables_column"].user_table, meta_user_table)
+    self.assertIsNot(self.engine.tables["Address"].user_table, address_user_table)
+    self.assertTableData("Address", cols="subset", data=[
+      ["id",  "city",       "upper"],
+      [11,    "New York",   "NEW YORK"],
+      [12,    "Colombia",   "COLOMBIA"],
+      [13,    "New Haven",  "NEW HAVEN"],
+      [14,    "West Haven", "WEST HAVEN"],
+    ])
@@ -0,0 +1,143 @@
+import unittest
+
+import column_data
+import objtypes
+
+class TestColumnData(unittest.TestCase):
+  def assertData(self, data, expected):
+    self.assertEqual(len(data), len(expected))
+    self.assertEqual([data[i] for i in xrange(len(data))], expected)
+    self.assertEqual(list(data), expected)
+    # Check types too, since e.g. 1 == 1.0 == True.
+    self.assertEqual([type(v) for v in data], [type(v) for v in expected])
+
+  def test_list_data(self):
+    data = column_data.ListData('')
+    data.growto(3)
+    data[1] = 'a'
+    self.assertData(data, ['', 'a', ''])
+    with self.assertRaises(IndexError):
+      data[3] = 'b'
+    with self.assertRaises(IndexError):
+      data[3]   # pylint: disable=pointless-statement
+
+    other = column_data.ListData('')
+    other.copy_from(data)
+    data.clear()
+    self.assertData(data, [])
+    self.assertData(other, ['', 'a', ''])
+
+  def test_float_data(self):
+    data = column_data.FloatData(0.0)
+    data.growto(5)
+    self.assertData(data, [0.0, 0.0, 0.0, 0.0, 0.0])
+    self.assertEqual(data.count_outliers(), 0)
+
+    err = objtypes.RaisedException(ValueError())
+    data[1] = 1.5
+    data[2] = None
+    data[3] = "alttext"
+    data[4] = err
+    self.assertData(data, [0.0, 1.5, None, "alttext", err])
+    self.assertEqual(data.count_outliers(), 3)
+
+    # Values of other numeric types must come back with the same type.
+    data[1] = 17L
+    data[2] = True
+    data[3] = 2.5
+    self.assertData(data, [0.0, 17L, True, 2.5, err])
+    self.assertEqual(data.count_outliers(), 3)
+
+    with self.assertRaises(IndexError):
+      data[5] = 1.0
+    with self.assertRaises(IndexError):
+      data[5]   # pylint: disable=pointless-statement
+    self.assertEqual(len(data), 5)
+
+    # Negative indices work as for a list, including for outliers.
+    self.assertEqual([data[i] for i in xrange(-5, 0)], [0.0, 17L, True, 2.5, err])
+    data[-4] = "text"
+    data[-1] = 3.5
+    self.assertData(data, [0.0, "text", True, 2.5, 3.5])
+    self.assertEqual(data._outliers, {1: "text", 2: True})
+    with self.assertRaises(IndexError):
+      data[-6] = 1.0
+    with self.assertRaises(IndexError):
+      data[-6]   # pylint: disable=pointless-statement
+
+  def test_default_outlier(self):
+    # Date columns default to None, which can't be stored in the array. Growing should not add
+    # dict entries, and setting values should turn outliers back into array values.
+    data = column_data.FloatData(None)
+    data.growto(4)
+    self.assertData(data, [None, None, None, None])
+    self.assertEqual(data._outliers, {})
+    data[2] = 86400.0
+    data[3] = "bad date"
+    self.assertData(data, [None, None, 86400.0, "bad date"])
+    self.assertEqual(data._outliers, {3: "bad date"})
+    data[3] = None
+    self.assertEqual(data._outliers, {})
+    self.assertEqual(data.count_outliers(), 3)
+
+  def test_int_data(self):
+    data = column_data.IntData(0)
+    data.growto(4)
+    data[1] = 17
+    data[2] = 1 << 40       # Too large for a C int, kept as an outlier.
+    data[3] = False
+    self.assertData(data, [0, 17, 1 << 40, False])
+    self.assertEqual(data.count_outliers(), 2)
+    data[2] = -5
+    self.assertData(data, [0, 17, -5, False])
+    self.assertEqual(data.count_outliers(), 1)
+
+  def test_bool_data(self):
+    data = column_data.BoolData(False)
+    data.growto(4)
+    data[1] = True
+    data[2] = None
+    data[3] = 1
+    self.assertData(data, [False, True, None, 1])
+    self.assertEqual(data.count_outliers(), 2)
+
+  def test_get_stored_values(self):
+    data = column_data.FloatData(0.0)
+    data.growto(4)
+    data[1] = 1.5
+    data[3] = "alttext"
+    self.assertEqual(data.get_stored_values([0, 1, 2]), [0.0, 1.5, 0.0])
+    self.assertEqual(data.get_stored_values([]), [])
+    self.assertIsNone(data.get_stored_values([1, 3]))
+    self.assertIsNone(data.get_stored_values([1, 4]))
+
+    data = column_data.BoolData(False)
+    data.growto(2)
+    data[1] = True
+    self.assertEqual(data.get_stored_values([1, 0]), [True, False])
+    self.assertEqual(map(type, data.get_stored_values([1, 0])), [bool, bool])
+
+  def test_copy_from(self):
+    data = column_data.FloatData(None)
+    data.growto(3)
+    data[0] = 1.0
+    data[1] = "x"
+
+    # Copying between the same types copies the buffers, and doesn't share them.
+    other = column_data.FloatData(None)
+    other.copy_from(data)
+    self.assertData(other, [1.0, "x", None])
+    data[0] = 2.0
+    data[1] = 3.0
+    self.assertData(other, [1.0, "x", None])
+
+    # Copying from a list works too.
+    lst = column_data.ListData(None)
+    lst.growto(3)
+    lst[0] = 5.0
+    lst[2] = "y"
+    other.copy_from(lst)
+    self.assertData(other, [5.0, None, "y"])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,138 @@
+import json
+import marshal
+import unittest
+
+import actions
+import columnar
+import objtypes
+import test_engine
+import testutil
+
+
+class TestColumnar(unittest.TestCase):
+  def assertRoundTrip(self, values, expected_type):
+    encoded = columnar.encode_column(values)
+    self.assertTrue(columnar.is_encoded_column(encoded))
+    self.assertEqual(encoded["type"], expected_type)
+    # Encoded columns must survive marshalling, which is how they travel.
+    decoded = columnar.decode_column(marshal.loads(marshal.dumps(encoded, 2)))
+    self.assertEqual(decoded, values)
+    self.assertEqual(map(type, decoded), map(type, values))
+
+  def test_round_trip(self):
+    self.assertRoundTrip([float(i) / 3 for i in xrange(100)], "f8")
+    self.assertRoundTrip(range(-50, 50) + [2**31 - 1, -2**31], "i4")
+    self.assertRoundTrip([i % 3 == 0 for i in xrange(100)], "b1")
+    self.assertRoundTrip(["row %d" % i for i in xrange(100)] + ["", "caf\xc3\xa9", ""], "text")
+
+  def test_outliers(self):
+    values = [1.5] * 20
+    values[3] = None
+    values[7] = "n/a"
+    values[12] = 17
+    values[15] = objtypes.RaisedException(ValueError())
+    encoded = columnar.encode_column(values)
+    self.assertEqual(encoded["type"], "f8")
+    self.assertEqual(encoded["outlier_indices"], [3, 7, 12, 15])
+    self.assertEqual(encoded["outlier_values"][:3], [None, "n/a", 17])
+
+    decoded = columnar.decode_column(encoded)
+    self.assertEqual(decoded[:15], values[:15])
+    self.assertIsInstance(decoded[15], objtypes.RaisedException)
+    self.assertEqual(decoded[16:], values[16:])
+
+    values = ["foo"] * 20
+    values[0] = None
+    values[19] = 0
+    self.assertEqual(columnar.decode_column(columnar.encode_column(values)), values)
+
+    # Outliers survive a trip through JSON, e.g. via Node, which would turn dict keys to strings.
+    encoded = json.loads(json.dumps(columnar.encode_column(values)))
+    self.assertEqual(columnar.decode_column(encoded), values)
+
+  def test_not_encoded(self):
+    # Short columns, columns without a supported type, and too-large ints are left as lists of
+    # encoded values.
+    self.assertEqual(columnar.encode_column([1, 2, 3]), [1, 2, 3])
+    values = [None, u"x"] * 10
+    self.assertEqual(columnar.encode_column(values), values)
+    values = range(20) + [2**40]
+    self.assertEqual(columnar.encode_column(values), map(objtypes.encode_object, values))
+    values = [[1, 2]] * 20
+    self.assertEqual(columnar.encode_column(values), [['L', 1, 2]] * 20)
+
+  def test_compact(self):
+    values = [None] * 10 + ["a"] * 10 + [1.0, 1, True] * 2 + [[1, 2]] * 10
+    encoded = columnar.compact_column(values)
+    self.assertEqual(encoded, {"type": "runs",
+                               "values": [None, "a", 1.0, 1, True, 1.0, 1, True, ['L', 1, 2]],
+                               "counts": [10, 10, 1, 1, 1, 1, 1, 1, 10]})
+    decoded = columnar.decode_column(encoded)
+    self.assertEqual(decoded, values)
+    self.assertEqual(map(type, decoded), map(type, values))
+
+    # Without enough repetition, values are encoded as by encode_column().
+    values = [float(i) for i in xrange(20)]
+    self.assertEqual(columnar.compact_column(values)["type"], "f8")
+
+    row_ids = range(5, 25) + [30] + range(40, 60)
+    encoded = columnar.compact_row_ids(row_ids)
+    self.assertEqual(encoded, {"type": "ranges", "starts": [5, 30, 40], "counts": [20, 1, 20]})
+    self.assertEqual(columnar.decode_column(encoded), row_ids)
+    self.assertEqual(columnar.compact_row_ids(range(0, 40, 2)), range(0, 40, 2))
+    self.assertEqual(columnar.compact_row_ids([1, 2, 3]), [1, 2, 3])
+
+  def test_decode_bulk_values(self):
+    bulk_values = {"a": range(20), "b": [[1, 2], None]}
+    encoded = columnar.encode_bulk_values(bulk_values)
+    self.assertTrue(columnar.is_encoded_column(encoded["a"]))
+    self.assertFalse(columnar.is_encoded_column(encoded["b"]))
+    self.assertEqual(actions.decode_bulk_values(encoded), {"a": range(20), "b": [[1, 2], None]})
+
+    with self.assertRaisesRegexp(ValueError, "Unknown column encoding"):
+      actions.decode_bulk_values({"a": {"type": "f16", "data": ""}})
+
+
+class TestColumnarUserActions(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Items", [
+        [1, "name", "Text", False, "", "", ""],
+        [2, "price", "Numeric", False, "", "", ""],
+        [3, "total", "Numeric", True, "$price * 2", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Items": [
+        ["id", "name", "price"],
+      ],
+    }
+  })
+
+  def test_bulk_actions(self):
+    # Bulk user actions accept encoded columns, and produce the same results as with plain ones.
+    self.load_sample(self.sample)
+    row_ids = range(1, 21)
+    names = ["item%d" % i for i in row_ids]
+    prices = [float(i) for i in row_ids]
+    prices[4] = 5
+    self.apply_user_action(["BulkAddRecord", "Items", [None] * 20, {
+      "name": columnar.encode_column(names),
+      "price": columnar.encode_column(prices),
+    }])
+    self.assertTableData("Items", cols="subset", data=[["id", "name", "price", "total"]] + [
+      [r, n, p, p * 2] for (r, n, p) in zip(row_ids, names, prices)])
+
+    self.apply_user_action(["BulkUpdateRecord", "Items", row_ids, {
+      "price": columnar.encode_column([float(i) * 10 for i in row_ids]),
+    }])
+    self.assertTableData("Items", cols="subset", rows="subset", data=[
+      ["id", "price", "total"],
+      [1,     10.0,   20.0],
+      [5,     50.0,   100.0],
+      [20,    200.0,  400.0],
+    ])
+
+
+if __name__ == "__main__":
+  unittest.main()
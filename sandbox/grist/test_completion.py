@@ -103,16 +103,19 @@ class TestCompletion(test_engine.EngineTestCase):
     self.assertEqual(self.engine.autocomplete("Address.", "Students"), [
       'Address.all',
       ('Address.lookupOne', '(colName=<value>, ...)', True),
+      ('Address.lookupRange', '(colName, start, end, colName=<value>, ...)', True),
       ('Address.lookupRecords', '(colName=<value>, ...)', True),
     ])
 
     self.assertEqual(self.engine.autocomplete("Address.lookup", "Students"), [
       ('Address.lookupOne', '(colName=<value>, ...)', True),
+      ('Address.lookupRange', '(colName, start, end, colName=<value>, ...)', True),
       ('Address.lookupRecords', '(colName=<value>, ...)', True),
     ])
 
     self.assertEqual(self.engine.autocomplete("address.look", "Students"), [
       ('Address.lookupOne', '(colName=<value>, ...)', True),
+      ('Address.lookupRange', '(colName, start, end, colName=<value>, ...)', True),
       ('Address.lookupRecords', '(colName=<value>, ...)', True),
     ])
 
@@ -0,0 +1,175 @@
+"""
+Tests deferring the loading of tables which no formula depends on.
+"""
+import unittest
+
+import actions
+import testutil
+import test_engine
+
+
+class TestDeferredTables(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Customers", [
+        [10, "name",       "Text",           False, "", "", ""],
+        [11, "total",      "Numeric",        True,
+         "SUM(Orders.lookupRecords(customer=$id).amount)", "", ""],
+      ]],
+      [2, "Orders", [
+        [20, "customer",   "Ref:Customers",  False, "", "", ""],
+        [21, "amount",     "Numeric",        False, "", "", ""],
+      ]],
+      [3, "Archive", [
+        [30, "customer",   "Int",            False, "", "", ""],
+        [31, "amount",     "Numeric",        False, "", "", ""],
+      ]],
+      [4, "Notes", [
+        [40, "text",       "Text",           False, "", "", ""],
+      ]],
+      [5, "Refunds", [
+        [50, "customer",   "Ref:Customers",  False, "", "", ""],
+      ]],
+      [6, "NoteTags", [
+        [60, "note",       "Ref:Notes",      False, "", "", ""],
+        [61, "tags",       "RefList:Notes",  False, "", "", ""],
+        [62, "label",      "Text",           False, "", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Customers": [
+        ["id",  "name"],
+        [1,     "alice"],
+        [2,     "bob"],
+      ],
+      "Orders": [
+        ["id",  "customer", "amount"],
+        [1,     1,          15],
+        [2,     2,          5],
+      ],
+      "Archive": [
+        ["id",  "customer", "amount"],
+        [1,     1,          100],
+        [7,     2,          200],
+      ],
+      "Notes": [
+        ["id",  "text"],
+        [1,     "hello"],
+        [2,     "world"],
+      ],
+      "Refunds": [
+        ["id",  "customer"],
+        [7,     2],
+      ],
+      "NoteTags": [
+        ["id",  "note", "tags",   "label"],
+        [1,     2,      [1, 2],   "a"],
+      ],
+    }
+  })
+
+  def setUp(self):
+    super(TestDeferredTables, self).setUp()
+    self.loaded = []
+    def loader(table_id):
+      self.loaded.append(table_id)
+      return self.sample["DATA"][table_id]
+    self.engine.deferred_table_loader = loader
+
+    schema = self.sample["SCHEMA"]
+    self.engine.load_meta_tables(schema['_grist_Tables'], schema['_grist_Tables_column'])
+    # Refunds refers to a table that formulas use, so it can't be deferred; NoteTags only refers to
+    # a table which can.
+    self.assertEqual(self.engine.get_unreferenced_tables(), ["Archive", "NoteTags", "Notes"])
+    for table_id, data in self.sample["DATA"].iteritems():
+      if table_id in ("Archive", "NoteTags", "Notes"):
+        self.engine.defer_table(table_id)
+      else:
+        self.engine.load_table(data)
+    self.engine.load_done()
+
+  def test_load_on_fetch(self):
+    self.assertEqual(self.loaded, [])
+    self.assertTableData("Customers", cols="subset", data=[
+      ["id", "total"],
+      [1,    15],
+      [2,    5],
+    ])
+    self.assertEqual(self.engine.fetch_table("Archive"), self.sample["DATA"]["Archive"])
+    self.assertEqual(self.loaded, ["Archive"])
+
+  def test_load_on_formula(self):
+    self.add_column("Customers", "archived",
+                    formula="SUM(Archive.lookupRecords(customer=$id).amount)")
+    self.assertEqual(self.loaded, ["Archive"])
+    self.assertTableData("Customers", cols="subset", data=[
+      ["id", "total", "archived"],
+      [1,    15,      100],
+      [2,    5,       200],
+    ])
+    self.update_record("Archive", 7, customer=1)
+    self.assertTableData("Customers", cols="subset", data=[
+      ["id", "total", "archived"],
+      [1,    15,      300],
+      [2,    5,       0],
+    ])
+    self.assertEqual(self.loaded, ["Archive"])
+
+  def test_load_on_action(self):
+    # New records must get the correct row ids, which requires the table to be loaded.
+    self.add_record("Archive", customer=2, amount=50)
+    self.assertEqual(self.loaded, ["Archive"])
+    self.assertTableData("Archive", data=[
+      ["id", "customer", "amount"],
+      [1,    1,          100],
+      [7,    2,          200],
+      [8,    2,          50],
+    ])
+
+    # Creating a summary of a deferred table loads it, along with the tables referring to it.
+    self.apply_user_action(["CreateViewSection", 4, 0, 'record', [40]])
+    self.assertEqual(self.loaded, ["Archive", "NoteTags", "Notes"])
+    self.assertTableData("GristSummary_5_Notes", cols="subset", data=[
+      ["id", "text",  "count"],
+      [1,    "hello", 1],
+      [2,    "world", 1],
+    ])
+
+  def test_remove_referenced_record(self):
+    # References to removed records get cleared, including in tables that would otherwise be
+    # deferred, and in deferred tables, which get loaded for it.
+    out_actions = self.remove_record("Customers", 2)
+    self.assertEqual(sorted(map(actions.get_action_repr, out_actions.stored)), [
+      ["RemoveRecord", "Customers", 2],
+      ["UpdateRecord", "Orders", 2, {"customer": 0}],
+      ["UpdateRecord", "Refunds", 7, {"customer": 0}],
+    ])
+    self.assertEqual(self.loaded, [])
+
+    self.remove_record("Notes", 2)
+    self.assertEqual(self.loaded, ["NoteTags", "Notes"])
+    self.assertTableData("NoteTags", cols="subset", data=[
+      ["id", "note"],
+      [1,    0],
+    ])
+
+  def test_rename_referenced_table(self):
+    self.apply_user_action(["RenameTable", "Notes", "Remarks"])
+    self.assertEqual(self.loaded, ["NoteTags", "Notes"])
+    self.assertEqual(self.engine.tables["NoteTags"].get_column("note").type_obj.table_id,
+                     "Remarks")
+    self.remove_record("Remarks", 2)
+    self.assertTableData("NoteTags", cols="subset", data=[
+      ["id", "note"],
+      [1,    0],
+    ])
+
+  def test_remove_referenced_table(self):
+    self.apply_user_action(["RemoveTable", "Notes"])
+    self.assertEqual(self.loaded, ["NoteTags", "Notes"])
+    self.assertNotIn("Notes", self.engine.tables)
+    self.assertEqual(self.engine.fetch_table("NoteTags").row_ids, [1])
+
+
+if __name__ == "__main__":
+  unittest.main()
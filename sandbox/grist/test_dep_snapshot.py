@@ -0,0 +1,148 @@
+"""
+Tests restoring the dependency graph and lookup maps from a snapshot when loading a document.
+"""
+import unittest
+
+import actions
+import engine
+import testutil
+import test_engine
+
+
+class TestDepSnapshot(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Customers", [
+        [10, "name",       "Text",           False, "", "", ""],
+        [11, "orders",     "Any",            True,
+         "Orders.lookupRecords(customer=$id)", "", ""],
+        [12, "total",      "Numeric",        True, "SUM($orders.amount)", "", ""],
+      ]],
+      [2, "Orders", [
+        [20, "customer",   "Ref:Customers",  False, "", "", ""],
+        [21, "amount",     "Numeric",        False, "", "", ""],
+        [22, "year",       "Int",            False, "", "", ""],
+        [23, "label",      "Text",           True, "$customer.name.upper()", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Customers": [
+        ["id",  "name"],
+        [1,     "alice"],
+        [2,     "bob"],
+      ],
+      "Orders": [
+        ["id",  "customer", "amount", "year"],
+        [1,     1,          15,       2012],
+        [2,     1,          10,       2013],
+        [3,     2,          5,        2013],
+      ]
+    }
+  })
+
+  def setUp(self):
+    super(TestDepSnapshot, self).setUp()
+    self.load_sample(self.sample)
+    self.apply_user_action(["CreateViewSection", 2, 0, 'record', [22]])
+    self.add_column("GristSummary_6_Orders", "avg", formula="AVERAGE($group.amount)")
+
+  def reload_engine(self, snapshot):
+    """
+    Replaces self.engine with a new one, loaded with the data of the current one and the given
+    snapshot. Returns the result of load_dependency_snapshot().
+    """
+    old_engine = self.engine
+    def fetch(table_id):
+      # Pass the data through encoding, as it would be when stored in the document.
+      return actions.decode_objects(actions.encode_objects(old_engine.fetch_table(table_id)))
+
+    meta_tables = ('_grist_Tables', '_grist_Tables_column')
+    self.engine = engine.Engine()
+    self.engine.formula_tracer = old_engine.formula_tracer
+    self.engine.load_meta_tables(*[fetch(t) for t in meta_tables])
+    for table_id in sorted(old_engine.tables):
+      if table_id not in meta_tables:
+        self.engine.load_table(fetch(table_id))
+    used = self.engine.load_dependency_snapshot(snapshot)
+    self.call_counts.clear()
+    self.engine.load_done()
+    return used
+
+  def assertSameData(self, expected_engine):
+    for table_id in expected_engine.tables:
+      self.assertEqual(actions.encode_objects(self.engine.fetch_table(table_id)),
+                       actions.encode_objects(expected_engine.fetch_table(table_id)))
+
+  def test_snapshot(self):
+    original = self.engine
+    snapshot = self.engine.fetch_dependency_snapshot()
+    self.assertTrue(snapshot)
+
+    # With a snapshot, opening the document only evaluates the summary aggregates, which are
+    # maintained incrementally and aren't part of the snapshot, formulas whose values don't
+    # survive storage unchanged (record sets here), and formulas that depend on those.
+    self.assertTrue(self.reload_engine(snapshot))
+    self.assertEqual(self.call_counts, {
+      "Customers": {"orders": 2, "total": 2},
+      "GristSummary_6_Orders": {"count": 2, "amount": 2, "avg": 2, "group": 2},
+      "Orders": {"#aggregate#GristSummary_6_Orders:": 3,
+                 "#aggregate#GristSummary_6_Orders:amount": 3},
+    })
+    self.assertSameData(original)
+
+    # Changes still propagate through the restored dependencies and lookups.
+    for eng in (original, self.engine):
+      self.engine = eng
+      self.update_record("Orders", 2, amount=8)
+      self.update_record("Orders", 3, customer=1, year=2012)
+      self.update_record("Customers", 1, name="carol")
+      self.add_record("Orders", customer=2, amount=7, year=2014)
+    self.assertSameData(original)
+    self.assertTableData("Customers", cols="subset", data=[
+      ["id", "name",  "total"],
+      [1,    "carol", 28],
+      [2,    "bob",   7],
+    ])
+    self.assertTableData("GristSummary_6_Orders", cols="subset", data=[
+      ["id", "year", "count", "amount", "avg"],
+      [1,    2012,   2,       20,       10],
+      [2,    2013,   1,       8,        8],
+      [3,    2014,   1,       7,        7],
+    ])
+
+  def test_volatile_formulas(self):
+    # Formulas that may evaluate differently on open get recomputed, along with their dependents.
+    self.add_column("Orders", "stamp", formula="str(NOW())")
+    self.add_column("Orders", "stamp_copy", formula="$stamp")
+    self.add_column("Orders", "pick", formula="RANDBETWEEN(1, 1000000)")
+    self.add_column("Orders", "pick_copy", formula="$pick")
+    snapshot = self.engine.fetch_dependency_snapshot()
+    self.assertTrue(self.reload_engine(snapshot))
+    self.assertEqual(self.call_counts["Orders"], {
+      "#aggregate#GristSummary_6_Orders:": 3,
+      "#aggregate#GristSummary_6_Orders:amount": 3,
+      "stamp": 3, "stamp_copy": 3, "pick": 3, "pick_copy": 3,
+    })
+    columns = self.engine.fetch_table("Orders").columns
+    self.assertEqual(columns["stamp_copy"], columns["stamp"])
+    self.assertEqual(columns["pick_copy"], columns["pick"])
+
+  def test_mismatched_snapshot(self):
+    snapshot = self.engine.fetch_dependency_snapshot()
+    self.update_record("Orders", 1, amount=20)
+    self.assertFalse(self.reload_engine(snapshot))
+    self.assertEqual(self.call_counts["Customers"], {"orders": 2, "total": 2})
+    self.assertTableData("Customers", cols="subset", data=[
+      ["id", "name",  "total"],
+      [1,    "alice", 30],
+      [2,    "bob",   5],
+    ])
+    self.assertFalse(self.reload_engine("not a snapshot"))
+
+  def test_not_up_to_date(self):
+    self.engine.invalidate_records("Orders", [1])
+    self.assertIsNone(self.engine.fetch_dependency_snapshot())
+
+
+if __name__ == "__main__":
+  unittest.main()
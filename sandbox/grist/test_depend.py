@@ -0,0 +1,153 @@
+import unittest
+
+import depend
+from depend import ALL_ROWS, Node
+import relation
+import testutil
+import test_engine
+
+
+class _MapRelation(relation.Relation):
+  """
+  Relation which maps each target row to referring rows using a dict, and counts its uses.
+  """
+  def __init__(self, referring_table, target_table, row_map):
+    super(_MapRelation, self).__init__(referring_table, target_table)
+    self.row_map = row_map
+    self.calls = 0
+    self.resets = 0
+
+  def get_affected_rows(self, input_rows):
+    self.calls += 1
+    return {r for row_id in input_rows for r in self.row_map.get(row_id, ())}
+
+  def reset_all(self):
+    self.resets += 1
+
+
+class TestInvalidateDeps(unittest.TestCase):
+  def setUp(self):
+    # A diamond: Orders.total depends on Orders.amount directly and via Orders.tax, and
+    # Customers.total depends on Orders.total through a reference.
+    self.graph = depend.Graph()
+    self.amount = Node("Orders", "amount")
+    self.tax = Node("Orders", "tax")
+    self.total = Node("Orders", "total")
+    self.customer_total = Node("Customers", "total")
+    self.identity = relation.IdentityRelation("Orders")
+    self.ref = _MapRelation("Customers", "Orders", {1: [1], 2: [1], 3: [2], 4: [2]})
+    self.graph.add_edge(self.tax, self.amount, self.identity)
+    self.graph.add_edge(self.total, self.amount, self.identity)
+    self.graph.add_edge(self.total, self.tax, self.identity)
+    self.graph.add_edge(self.customer_total, self.total, self.ref)
+
+  def test_invalidate_once(self):
+    recompute_map = {}
+    self.graph.invalidate_deps(self.amount, [1, 3], recompute_map, include_self=False)
+    self.assertEqual(recompute_map, {self.tax: {1, 3}, self.total: {1, 3},
+                                     self.customer_total: {1, 2}})
+    # Orders.total is reached by two paths, but its dependents are only visited once.
+    self.assertEqual(self.ref.calls, 1)
+
+    # Rows that are already dirty don't get passed on again.
+    self.graph.invalidate_deps(self.amount, [3], recompute_map, include_self=False)
+    self.assertEqual(self.ref.calls, 1)
+    self.graph.invalidate_deps(self.amount, [2], recompute_map, include_self=False)
+    self.assertEqual(self.ref.calls, 2)
+    self.assertEqual(recompute_map[self.total], {1, 2, 3})
+
+  def test_invalidate_many(self):
+    # Invalidating several nodes at once has the same result as invalidating them one by one.
+    dirty_list = [(self.amount, [1], False), (self.tax, [4], True)]
+    recompute_map1 = {}
+    for (node, rows, include_self) in dirty_list:
+      self.graph.invalidate_deps(node, rows, recompute_map1, include_self=include_self)
+    recompute_map2 = {}
+    self.graph.invalidate_many(dirty_list, recompute_map2)
+    self.assertEqual(recompute_map1, recompute_map2)
+    self.assertEqual(recompute_map2, {self.tax: {1, 4}, self.total: {1, 4},
+                                      self.customer_total: {1, 2}})
+
+  def test_all_rows(self):
+    recompute_map = {}
+    self.graph.invalidate_deps(self.tax, ALL_ROWS, recompute_map)
+    self.assertEqual(recompute_map, {self.tax: ALL_ROWS, self.total: ALL_ROWS,
+                                     self.customer_total: ALL_ROWS})
+    self.assertEqual(self.ref.calls, 0)
+    self.assertEqual(self.ref.resets, 1)
+    self.assertEqual(list(self.graph.iter_edges()), [])
+
+  def test_dense(self):
+    orig = (depend.DENSE_MIN_ROWS, depend.DENSE_FRACTION)
+    try:
+      depend.DENSE_MIN_ROWS, depend.DENSE_FRACTION = 2, 0.75
+      row_counts = {"Orders": 4, "Customers": 10}
+
+      # Few rows stay as they are.
+      recompute_map = {}
+      self.graph.invalidate_deps(self.amount, [3], recompute_map, include_self=False,
+                                 get_row_count=row_counts.get)
+      self.assertEqual(recompute_map, {self.tax: {3}, self.total: {3}, self.customer_total: {2}})
+
+      # Once most rows of a dependent are dirty, it's recomputed in full, but its own dependents
+      # only get the rows actually affected.
+      self.graph.invalidate_deps(self.amount, [1, 2], recompute_map, include_self=False,
+                                 get_row_count=row_counts.get)
+      self.assertEqual(recompute_map, {self.tax: ALL_ROWS, self.total: ALL_ROWS,
+                                       self.customer_total: {1, 2}})
+
+      # Rows that get dirty later still get passed on through nodes that were expanded that way.
+      del recompute_map[self.customer_total]
+      self.graph.invalidate_deps(self.amount, [4], recompute_map, include_self=False,
+                                 get_row_count=row_counts.get)
+      self.assertEqual(recompute_map, {self.tax: ALL_ROWS, self.total: ALL_ROWS,
+                                       self.customer_total: {2}})
+
+      # While a real ALL_ROWS invalidation still propagates in full.
+      self.graph.invalidate_deps(self.amount, ALL_ROWS, recompute_map, include_self=False)
+      self.assertEqual(recompute_map, {self.tax: ALL_ROWS, self.total: ALL_ROWS,
+                                       self.customer_total: ALL_ROWS})
+
+      # The nodes invalidated directly are never expanded to ALL_ROWS.
+      recompute_map = {}
+      self.graph.invalidate_deps(self.amount, [1, 2, 3, 4], recompute_map,
+                                 get_row_count=row_counts.get)
+      self.assertEqual(recompute_map[self.amount], {1, 2, 3, 4})
+    finally:
+      depend.DENSE_MIN_ROWS, depend.DENSE_FRACTION = orig
+
+
+class TestDenseRecompute(test_engine.EngineTestCase):
+  def test_dense_forgotten(self):
+    # Once a node expanded to ALL_ROWS for being dense gets recomputed, it's no longer treated
+    # differently from other nodes.
+    self.load_sample(testutil.parse_test_sample({
+      "SCHEMA": [
+        [1, "Orders", [
+          [10, "amount",     "Numeric",        False, "", "", ""],
+          [11, "double",     "Numeric",        True, "$amount * 2", "", ""],
+        ]],
+      ],
+      "DATA": {
+        "Orders": [["id", "amount"], [1, 1], [2, 2], [3, 3], [4, 4]],
+      }
+    }))
+    orig = (depend.DENSE_MIN_ROWS, depend.DENSE_FRACTION)
+    try:
+      depend.DENSE_MIN_ROWS, depend.DENSE_FRACTION = 2, 0.75
+      out_actions = self.update_records("Orders", ["id", "amount"], [[1, 5], [2, 6], [3, 7]])
+    finally:
+      depend.DENSE_MIN_ROWS, depend.DENSE_FRACTION = orig
+    self.assertEqual(out_actions.calls, {"Orders": {"double": 4}})
+    self.assertEqual(self.engine.dep_graph._dense_nodes, set())
+    self.assertTableData("Orders", data=[
+      ["id", "amount", "double"],
+      [1,    5,        10],
+      [2,    6,        12],
+      [3,    7,        14],
+      [4,    4,        8],
+    ])
+
+
+if __name__ == "__main__":
+  unittest.main()
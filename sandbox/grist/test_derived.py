@@ -77,7 +77,8 @@ class TestDerived(test_engine.EngineTestCase):
         actions.BulkUpdateRecord("Orders", [1,2], {'amount': [14, 14]}),
         actions.BulkUpdateRecord("GristSummary_6_Orders", [1,2], {'amount': [14, 29]})
       ],
-      "calls": {"GristSummary_6_Orders": {"amount": 2}}
+      "calls": {"GristSummary_6_Orders": {"amount": 2},
+                "Orders": {"#aggregate#GristSummary_6_Orders:amount": 2}}
     })
 
     # Changing a record from one product to another should cause the two affected lines to change.
@@ -91,7 +92,9 @@ class TestDerived(test_engine.EngineTestCase):
       ],
       "calls": {"GristSummary_6_Orders": {"group": 2, "amount": 2, "count": 2},
                 "Orders": {"#lookup##summary#GristSummary_6_Orders": 1,
-                           "#summary#GristSummary_6_Orders": 1}}
+                           "#summary#GristSummary_6_Orders": 1,
+                           "#aggregate#GristSummary_6_Orders:": 1,
+                           "#aggregate#GristSummary_6_Orders:amount": 1}}
     })
 
     self.assertPartialData("GristSummary_6_Orders", ["id", "year", "count", "amount", "group" ], [
@@ -114,7 +117,9 @@ class TestDerived(test_engine.EngineTestCase):
       "calls": {
         "GristSummary_6_Orders": {'#lookup#year': 1, "group": 2, "amount": 2, "count": 2},
         "Orders": {"#lookup##summary#GristSummary_6_Orders": 2,
-                   "#summary#GristSummary_6_Orders": 2}}
+                   "#summary#GristSummary_6_Orders": 2,
+                   "#aggregate#GristSummary_6_Orders:": 1,
+                   "#aggregate#GristSummary_6_Orders:amount": 1}}
     })
 
     self.assertPartialData("GristSummary_6_Orders", ["id", "year", "count", "amount", "group" ], [
@@ -297,5 +302,7 @@ class TestDerived(test_engine.EngineTestCase):
       ],
       "calls": {"GristSummary_6_Orders": {"group": 1, "amount": 1, "count": 1},
                 "Orders": {"#lookup##summary#GristSummary_6_Orders": 2,
-                           "#summary#GristSummary_6_Orders": 2}}
+                           "#summary#GristSummary_6_Orders": 2,
+                           "#aggregate#GristSummary_6_Orders:": 1,
+                           "#aggregate#GristSummary_6_Orders:amount": 1}}
     })
@@ -523,6 +523,30 @@ class TestEngine(EngineTestCase):
     self.assertEqualDocData({'Address': data},
         {'Address': testutil.table_data_from_rows('Address', col_names, [])})
 
+  def test_fetch_table_chunks(self):
+    self.load_sample(testutil.parse_test_sample(self.sample1))
+    self.add_record('Address', city="Boston", state="MA", amount=3)
+
+    # Fetch selected columns in chunks, each starting after the last row of the previous chunk.
+    col_names = ["id",  "city"]
+    data = self.engine.fetch_table('Address', col_ids=['city'], limit=2)
+    self.assertEqualDocData({'Address': data},
+        {'Address': testutil.table_data_from_rows('Address', col_names, [
+          [ 21,   "New York" ],
+          [ 22,   "Albany"   ],
+        ])})
+    data = self.engine.fetch_table('Address', col_ids=['city'], start_row_id=23, limit=2)
+    self.assertEqualDocData({'Address': data},
+        {'Address': testutil.table_data_from_rows('Address', col_names, [
+          [ 23,   "Boston"   ],
+        ])})
+
+    # Queries on reference columns use the index of references.
+    data = self.engine.fetch_table('_grist_Tables_column', query={'parentId': [1]},
+                                   col_ids=['colId'], start_row_id=12)
+    self.assertEqual(data.row_ids, [12, 13])
+    self.assertEqual(data.columns, {'colId': ['state', 'amount']})
+
   def test_schema_restore_on_error(self):
     # Simulate an error inside a DocAction, and make sure we restore the schema (don't leave it in
     # inconsistent with metadata).
@@ -531,6 +555,48 @@ class TestEngine(EngineTestCase):
       self.add_column('Address', 'bad', isFormula=False, type="BAD")
     self.engine.assert_schema_consistent()
 
+  def test_reference_records_reused(self):
+    # Records obtained by following the same reference the same way get reused while computing a
+    # formula, and still track dependencies correctly.
+    self.load_sample(testutil.parse_test_sample({
+      "SCHEMA": [
+        [1, "Customers", [[10, "name", "Text", False, "", "", ""]]],
+        [2, "Orders", [
+          [20, "customer", "Ref:Customers", False, "", "", ""],
+          [21, "same", "Any", True, "$customer is rec.customer", "", ""],
+          [22, "name", "Any", True, "$customer.name.upper()", "", ""],
+        ]],
+      ],
+      "DATA": {
+        "Customers": [["id", "name"], [1, "alice"], [2, "bob"]],
+        "Orders": [["id", "customer"], [1, 1], [2, 2], [3, 1]],
+      }
+    }))
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "same", "name"],
+      [1,    True,   "ALICE"],
+      [2,    True,   "BOB"],
+      [3,    True,   "ALICE"],
+    ])
+    out_actions = self.update_record("Customers", 1, name="carol")
+    self.assertPartialOutActions(out_actions, {"calls": {"Orders": {"name": 2}}})
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "name"],
+      [1,    "CAROL"],
+      [2,    "BOB"],
+      [3,    "CAROL"],
+    ])
+
+    # The Records kept for reuse are bounded, even while computing a single record.
+    customers = self.engine.tables["Customers"]
+    relation = customers._identity_relation
+    with self.engine.open_compute_frame(None) as frame:
+      first = self.engine.make_record(customers, 1, relation)
+      self.assertIs(self.engine.make_record(customers, 1, relation), first)
+      for row_id in xrange(2, 3 * engine._MAX_FRAME_RECORDS):
+        self.engine.make_record(customers, row_id, relation)
+      self.assertLessEqual(len(frame.records), engine._MAX_FRAME_RECORDS)
+
 
 def create_tests_from_script(samples, test_cases):
   """
@@ -45,3 +45,18 @@ class TestFindCol(test_engine.EngineTestCase):
 
     # Test that it's safe to include a non-hashable value in the request.
     self.assertEqual(self.engine.find_col_from_values(("columbia", "yale", ["Eureka"]), 0), [23])
+
+  def test_find_col_after_changes(self):
+    # Distinct values of columns are remembered between calls, but not across changes.
+    self.load_sample(testsamples.sample_students)
+    self.assertEqual(self.engine.find_col_from_values(["Eureka"], 0), [4])
+    self.update_record("Students", 5, schoolName="Harvard")
+    self.assertEqual(self.engine.find_col_from_values(["Eureka"], 0), [])
+    self.assertEqual(self.engine.find_col_from_values(["Harvard"], 0), [4])
+
+    # Formula columns that get recomputed are seen with their new values too.
+    self.add_column("Students", "school_upper", formula="$schoolName.upper()")
+    self.assertEqual(self.engine.find_col_from_values(["HARVARD"], 0), [22])
+    self.update_record("Students", 5, schoolName="Eureka")
+    self.assertEqual(self.engine.find_col_from_values(["HARVARD"], 0), [])
+    self.assertEqual(self.engine.find_col_from_values(["EUREKA"], 0), [22])
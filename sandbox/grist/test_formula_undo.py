@@ -153,3 +153,76 @@ return '#%s %s' % (table.my_counter, $schoolName)
         ["ModifyColumn", "Students", "newCol", {"type": "Text"}],
       ]
     })
+
+  def test_compact_undo(self):
+    # Undo actions for a formula recalculated for many rows may be sent compactly, and still work.
+    self.load_sample(testsamples.sample_students)
+    self.add_records("Students", ["firstName"], [["Student %d" % i] for i in xrange(100)])
+    self.add_column("Students", "flag", formula="len($firstName) > 0")
+    out_actions = self.modify_column("Students", "flag", formula="False")
+
+    undo_repr = out_actions.get_repr(compact=True)["undo"]
+    self.assertEqual(undo_repr[-1][2], {"type": "ranges", "starts": [1], "counts": [106]})
+    self.assertEqual(undo_repr[-1][3], {"flag": {"type": "runs", "values": [True], "counts": [106]}})
+
+    self.apply_user_action(['ApplyUndoActions', undo_repr])
+    self.assertTableData("Students", cols="subset", rows="subset", data=[
+      ["id", "flag"],
+      [1,    True],
+      [106,  True],
+    ])
+
+  def test_lazy_formula_undo(self):
+    # With lazy_formula_undo, recomputed formula values get no undo actions, and undo still
+    # restores them by recomputing.
+    self.load_sample(testsamples.sample_students)
+    self.engine.lazy_formula_undo = True
+    out_actions = self.update_record("Students", 6, schoolName="Columbia")
+    self.assertOutActions(out_actions, {
+      "stored": [
+        ["UpdateRecord", "Students", 6, {"schoolName": "Columbia"}],
+        ["UpdateRecord", "Students", 6, {"schoolCities": "New York:Colombia"}],
+        ["UpdateRecord", "Students", 6, {"schoolIds": "1:2"}],
+      ],
+      "undo": [
+        ["UpdateRecord", "Students", 6, {"schoolName": "Yale"}],
+      ],
+    })
+
+    out_actions = self.apply_user_action(['ApplyUndoActions', out_actions.get_repr()["undo"]])
+    self.assertOutActions(out_actions, {
+      "stored": [
+        ["UpdateRecord", "Students", 6, {"schoolName": "Yale"}],
+        ["UpdateRecord", "Students", 6, {"schoolCities": "New Haven:West Haven"}],
+        ["UpdateRecord", "Students", 6, {"schoolIds": "3:4"}],
+      ],
+      "undo": [
+        ["UpdateRecord", "Students", 6, {"schoolName": "Columbia"}],
+      ],
+    })
+    self.assertTableData("Students", cols="subset", rows="subset", data=[
+      ["id", "schoolName", "schoolIds", "schoolCities"],
+      [6,    "Yale",       "3:4",       "New Haven:West Haven"],
+    ])
+
+    # Converting a data column to a formula overwrites its values, which undo must restore.
+    out_actions = self.modify_column("Students", "firstName", isFormula=True, formula='"X"')
+    self.assertIn(["BulkUpdateRecord", "Students", [1, 2, 3, 4, 5, 6], {"firstName":
+                   ["Barack", "George W", "Bill", "George H", "Ronald", "Gerald"]}],
+                  out_actions.get_repr()["undo"])
+    self.apply_user_action(['ApplyUndoActions', out_actions.get_repr()["undo"]])
+    self.assertTableData("Students", cols="subset", data=[
+      ["id", "firstName"],
+      [1,    "Barack"],
+      [2,    "George W"],
+      [3,    "Bill"],
+      [4,    "George H"],
+      [5,    "Ronald"],
+      [6,    "Gerald"],
+    ])
+
+    # Values of data columns changed by a conversion still get undo actions.
+    out_actions = self.modify_column("Students", "schoolIds", isFormula=False)
+    out_actions = self.modify_column("Students", "schoolIds", type="Numeric")
+    self.assertIn(["UpdateRecord", "Students", 5, {"schoolIds": ""}],
+                  out_actions.get_repr()["undo"])
@@ -1,7 +1,13 @@
 import unittest
 import difflib
+import json
+import os
 import re
+import shutil
+import tempfile
 
+import codebuilder
+import formula_cache
 import gencode
 import identifiers
 import records
@@ -84,6 +90,131 @@ class TestGenCode(unittest.TestCase):
     self.assertTrue(issubclass(module.Students.RecordSet, records.RecordSet))
     self.assertIs(module.Students.RecordSet.Record, module.Students.Record)
 
+  def test_disk_cache(self):
+    # Results of parsing formulas get reused by a new GenCode.
+    cache_dir = tempfile.mkdtemp()
+    orig_transform = codebuilder.transform_formula
+    try:
+      gcode = gencode.GenCode()
+      gcode.make_module(self.schema)
+
+      gcode_cached = gencode.GenCode()
+      gcode_cached.disk_cache = formula_cache.FormulaCache(cache_dir)
+      gcode_cached.make_module(self.schema)
+      # Only formula transforms are cached, not compiled code.
+      self.assertEqual(os.listdir(cache_dir), ['formulas.json'])
+
+      # Formulas with syntax errors don't get cached, so we don't count them.
+      transformed = []
+      def transform_formula(formula, default_value):
+        if formula != "for a in b\n10":
+          transformed.append(formula)
+        return orig_transform(formula, default_value)
+      codebuilder.transform_formula = transform_formula
+
+      gcode_cached = gencode.GenCode()
+      gcode_cached.disk_cache = formula_cache.FormulaCache(cache_dir)
+      gcode_cached.make_module(self.schema)
+      self.assertEqual(transformed, [])
+      self.assertEqual(gcode_cached.get_user_text(), gcode.get_user_text())
+      self.assertEqual(gcode_cached.grist_names(), gcode.grist_names())
+      self.assertTrue(isinstance(gcode_cached.usercode.Students, table.UserTable))
+
+      # Only a new formula needs parsing.
+      self.schema['Address'].columns['testcol'] = schema.SchemaColumn(
+        'testcol', 'Any', True, '$city.upper()')
+      gcode_cached.make_module(self.schema)
+      self.assertEqual(transformed, ['$city.upper()'])
+      gcode_cached = gencode.GenCode()
+      gcode_cached.disk_cache = formula_cache.FormulaCache(cache_dir)
+      gcode_cached.make_module(self.schema)
+      self.assertEqual(transformed, ['$city.upper()'])
+
+      # A cache of a different version is ignored.
+      num_formulas = len([c for t in self.schema.itervalues() for c in t.columns.itervalues()
+                          if c.formula and c.colId != 'badSyntax'])
+      orig_version = formula_cache.CACHE_VERSION
+      formula_cache.CACHE_VERSION = orig_version + ['other']
+      try:
+        gcode_cached = gencode.GenCode()
+        gcode_cached.disk_cache = formula_cache.FormulaCache(cache_dir)
+        gcode_cached.make_module(self.schema)
+        self.assertEqual(len(transformed), 1 + num_formulas)
+      finally:
+        formula_cache.CACHE_VERSION = orig_version
+    finally:
+      codebuilder.transform_formula = orig_transform
+      shutil.rmtree(cache_dir)
+
+  def test_disk_cache_tampered(self):
+    # Cached patches that transform_formula() couldn't have produced are ignored, so that code
+    # planted in a shared cache directory doesn't get into other documents.
+    cache_dir = tempfile.mkdtemp()
+    try:
+      gcode_cached = gencode.GenCode()
+      gcode_cached.disk_cache = formula_cache.FormulaCache(cache_dir)
+      gcode_cached.make_module(self.schema)
+
+      path = os.path.join(cache_dir, 'formulas.json')
+      with open(path) as f:
+        data = json.load(f)
+      data["formulas"] = [
+        # Inserts arbitrary code.
+        ["len(rec.fullName)", [[0, 0, "", "import os; "], [0, 0, "", "return "]]],
+        # Only inserts known snippets, but where they don't belong.
+        ["addr = $school.address\naddr.state if addr.country == 'US' else addr.region",
+         [[0, 0, "", "return "]]],
+      ]
+      with open(path, 'w') as f:
+        json.dump(data, f)
+
+      gcode = gencode.GenCode()
+      gcode.make_module(self.schema)
+      gcode_cached = gencode.GenCode()
+      gcode_cached.disk_cache = formula_cache.FormulaCache(cache_dir)
+      gcode_cached.make_module(self.schema)
+      self.assertEqual(gcode_cached.get_user_text(), gcode.get_user_text())
+    finally:
+      shutil.rmtree(cache_dir)
+
+  def test_incremental_module(self):
+    # Once the module exists, only the code of changed tables gets regenerated and re-executed.
+    gcode = gencode.GenCode()
+    gcode.make_module(self.schema)
+    module = gcode.usercode
+    students, schools, address = module.Students, module.Schools, module.Address
+
+    made = []
+    orig_make_table_model = gcode._make_table_model
+    def make_table_model(table_info, summary_tables, filter_for_user=False):
+      made.append(table_info.tableId)
+      return orig_make_table_model(table_info, summary_tables, filter_for_user)
+    gcode._make_table_model = make_table_model
+
+    self.schema['Address'].columns['testcol'] = schema.SchemaColumn(
+      'testcol', 'Any', True, '$city.upper()')
+    gcode.make_module(self.schema)
+    self.assertEqual(made, ['Address', 'Address'])
+    self.assertIs(gcode.usercode, module)
+    self.assertIs(module.Students, students)
+    self.assertIs(module.Schools, schools)
+    self.assertIsNot(module.Address, address)
+    self.assertIn('testcol', module.Address.Model.__dict__)
+
+    # The result is the same as generating the module from scratch.
+    gcode_new = gencode.GenCode()
+    gcode_new.make_module(self.schema)
+    self.assertEqual(gcode.get_user_text(), gcode_new.get_user_text())
+    self.assertEqual(gcode.grist_names(), gcode_new.grist_names())
+
+    # Tables that are gone get removed from the module.
+    del self.schema['Schools']
+    del made[:]
+    gcode.make_module(self.schema)
+    self.assertEqual(made, [])
+    self.assertFalse(hasattr(module, 'Schools'))
+    self.assertIs(module.Students, students)
+
   def test_pick_col_ident(self):
     self.assertEqual(identifiers.pick_col_ident("asdf"), "asdf")
     self.assertEqual(identifiers.pick_col_ident(" a s==d!~@#$%^f"), "a_s_d_f")
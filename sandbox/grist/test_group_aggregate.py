@@ -0,0 +1,198 @@
+"""
+Tests incremental maintenance of aggregate formulas in summary tables.
+"""
+import unittest
+
+import group_aggregate
+import objtypes
+import testutil
+import test_engine
+
+
+class TestGroupState(unittest.TestCase):
+  def test_float_sum_order(self):
+    # Float sums must come out as they would from adding up the values in row_id order.
+    state = group_aggregate._GroupState(ordered=True)
+    for row_id, value in [(1, 0.1), (2, 0.2), (3, 0.3)]:
+      state.update(row_id, value, 1)
+    self.assertEqual(state.get_result('SUM'), sum([0.1, 0.2, 0.3]))
+    self.assertEqual(state.get_result('SUM'), 0.6000000000000001)
+    self.assertEqual(state.get_result('AVERAGE'), sum([0.1, 0.2, 0.3], 0.0) / 3)
+
+    # Removing and re-adding values, or adding them out of order, still gives the same result.
+    state.update(1, 0.1, -1)
+    self.assertEqual(state.get_result('SUM'), 0.2 + 0.3)
+    state.update(1, 0.1, 1)
+    self.assertEqual(state.get_result('SUM'), 0.6000000000000001)
+    for row_id, value in [(2, 0.2), (3, 0.3), (1, 0.1)]:
+      state.update(row_id, value, -1)
+    for row_id, value in [(3, 0.3), (1, 0.1), (2, 0.2)]:
+      state.update(row_id, value, 1)
+    self.assertEqual(state.get_result('SUM'), 0.6000000000000001)
+
+    # Large values that cancel out must leave behind the same rounding errors as a full sum.
+    for row_id, value in [(4, 1e20), (5, True), (6, 5), (7, -1e20), (8, "x")]:
+      state.update(row_id, value, 1)
+    self.assertEqual(state.get_result('SUM'), sum([0.1, 0.2, 0.3, 1e20, 1, 5, -1e20, 0]))
+    self.assertEqual(state.get_result('AVERAGE'), sum([0.1, 0.2, 0.3, 1e20, 5, -1e20], 0.0) / 6)
+    self.assertEqual(state.get_result('COUNT'), 6)
+    self.assertEqual(state.get_result('MIN'), -1e20)
+    self.assertEqual(state.get_result('MAX'), 1e20)
+    self.assertEqual(state.get_result('len'), 8)
+
+    # Once the floats are gone, the sum goes back to being an int.
+    for row_id, value in [(1, 0.1), (2, 0.2), (3, 0.3), (4, 1e20), (7, -1e20)]:
+      state.update(row_id, value, -1)
+    self.assertEqual(state.get_result('SUM'), 6)
+    self.assertIs(type(state.get_result('SUM')), int)
+
+  def test_unsafe_values(self):
+    state = group_aggregate._GroupState(ordered=False)
+    state.update(1, 1.5, 1)
+    state.update(2, "text", 1)
+    self.assertEqual(state.get_result('SUM'), 1.5)
+    self.assertEqual(state.get_result('sum'), None)
+    state.update(3, float('inf'), 1)
+    self.assertEqual(state.get_result('SUM'), None)
+    self.assertEqual(state.get_result('len'), 3)
+    state.update(3, float('inf'), -1)
+    self.assertEqual(state.get_result('SUM'), 1.5)
+
+    # Averages of nothing should be left to the formula to report as an error.
+    state = group_aggregate._GroupState(ordered=False)
+    self.assertEqual(state.get_result('AVERAGE'), None)
+    self.assertEqual(state.get_result('SUM'), 0)
+
+
+class TestGroupAggregate(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Orders", [
+        [10, "year",       "Int",            False, "", "", ""],
+        [11, "amount",     "Numeric",        False, "", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Orders": [
+        ["id",  "year", "amount" ],
+        [1,     2012,   15  ],
+        [2,     2013,   15  ],
+        [3,     2013,   15.5],
+        [4,     2014,   35  ],
+        [5,     2014,   -3  ],
+        [6,     2014,   16  ],
+      ]
+    }
+  })
+
+  def setUp(self):
+    super(TestGroupAggregate, self).setUp()
+    self.load_sample(self.sample)
+    self.apply_user_action(["CreateViewSection", 1, 0, 'record', [10]])
+    for col_id, formula in [("avg", "AVERAGE($group.amount)"),
+                            ("min", "MIN($group.amount)"),
+                            ("max", "MAX(rec.group.amount)"),
+                            ("nums", "COUNT($group.amount)")]:
+      self.add_column("GristSummary_6_Orders", col_id, formula=formula)
+
+  def assertSummary(self, data):
+    self.assertTableData("GristSummary_6_Orders",
+                         cols="subset", data=[["id", "year", "count", "amount", "avg", "min",
+                                               "max", "nums"]] + data)
+
+  def test_aggregates(self):
+    self.assertSummary([
+      [1, 2012, 1, 15.0, 15.0,  15.0, 15.0, 1],
+      [2, 2013, 2, 30.5, 15.25, 15.0, 15.5, 2],
+      [3, 2014, 3, 48.0, 16.0,  -3.0, 35.0, 3],
+    ])
+
+    # Changing one record only affects its own group, and doesn't iterate through the group.
+    out_actions = self.update_record("Orders", 4, amount=5)
+    self.assertEqual(out_actions.calls, {
+      "GristSummary_6_Orders": {"amount": 1, "avg": 1, "min": 1, "max": 1, "nums": 1},
+      "Orders": {"#aggregate#GristSummary_6_Orders:amount": 1,
+                 "#aggregate#GristSummary_6_Orders:amount:ordered": 1},
+    })
+    self.assertSummary([
+      [1, 2012, 1, 15.0, 15.0,  15.0, 15.0, 1],
+      [2, 2013, 2, 30.5, 15.25, 15.0, 15.5, 2],
+      [3, 2014, 3, 18.0, 6.0,   -3.0, 16.0, 3],
+    ])
+
+    # Moving records between groups, adding and removing them.
+    self.update_record("Orders", 5, year=2012)
+    self.add_record("Orders", year=2013, amount=100)
+    self.remove_record("Orders", 2)
+    self.assertSummary([
+      [1, 2012, 2, 12.0,  6.0,   -3.0, 15.0,  2],
+      [2, 2013, 2, 115.5, 57.75, 15.5, 100.0, 2],
+      [3, 2014, 2, 21.0,  10.5,  5.0,  16.0,  2],
+    ])
+
+    # Alttext and errors in a group fall back to evaluating the formulas in full.
+    self.update_record("Orders", 1, amount="n/a")
+    self.assertSummary([
+      [1, 2012, 2, -3.0,  -3.0,  -3.0, -3.0,  1],
+      [2, 2013, 2, 115.5, 57.75, 15.5, 100.0, 2],
+      [3, 2014, 2, 21.0,  10.5,  5.0,  16.0,  2],
+    ])
+    self.update_record("Orders", 5, amount="n/a")
+    error = objtypes.RaisedException(ZeroDivisionError())
+    self.assertSummary([
+      [1, 2012, 2, 0,     error, 0,    0,     0],
+      [2, 2013, 2, 115.5, 57.75, 15.5, 100.0, 2],
+      [3, 2014, 2, 21.0,  10.5,  5.0,  16.0,  2],
+    ])
+    self.update_records("Orders", ["id", "amount"], [[1, 1.25], [5, 2]])
+    self.assertSummary([
+      [1, 2012, 2, 3.25,  1.625, 1.25, 2.0,   2],
+      [2, 2013, 2, 115.5, 57.75, 15.5, 100.0, 2],
+      [3, 2014, 2, 21.0,  10.5,  5.0,  16.0,  2],
+    ])
+
+  def test_float_sums(self):
+    # Summary sums of floats match what evaluating the formula in full gives, after any edits.
+    self.update_records("Orders", ["id", "year", "amount"],
+                        [[4, 2013, 0.1], [5, 2013, 0.2], [6, 2013, 0.3]])
+    self.remove_record("Orders", 2)
+    self.remove_record("Orders", 3)
+    error = objtypes.RaisedException(ZeroDivisionError())
+    self.assertSummary([
+      [1, 2012, 1, 15.0,               15.0,               15.0, 15.0, 1],
+      [2, 2013, 3, 0.6000000000000001, 0.6000000000000001 / 3, 0.1,  0.3,  3],
+      [3, 2014, 0, 0.0, error, 0, 0, 0],
+    ])
+    self.update_record("Orders", 4, amount=0.7)
+    self.update_record("Orders", 4, amount=0.1)
+    self.add_record("Orders", year=2013, amount=0.4)
+    self.assertSummary([
+      [1, 2012, 1, 15.0, 15.0, 15.0, 15.0, 1],
+      [2, 2013, 4, 0.1 + 0.2 + 0.3 + 0.4, (0.1 + 0.2 + 0.3 + 0.4) / 4, 0.1, 0.4, 4],
+      [3, 2014, 0, 0.0, error, 0, 0, 0],
+    ])
+
+  def test_changed_formula(self):
+    # Formulas that aren't simple aggregations get evaluated as usual, and unused totals get
+    # cleaned up.
+    self.modify_column("GristSummary_6_Orders", "min", formula="MIN($group.amount) * 2")
+    self.modify_column("GristSummary_6_Orders", "max", formula="max($group.amount)")
+    self.assertSummary([
+      [1, 2012, 1, 15.0, 15.0,  30.0, 15.0, 1],
+      [2, 2013, 2, 30.5, 15.25, 30.0, 15.5, 2],
+      [3, 2014, 3, 48.0, 16.0,  -6.0, 35.0, 3],
+    ])
+    self.assertNotIn("#aggregate#GristSummary_6_Orders:amount:ordered",
+                     self.engine.tables["Orders"].all_columns)
+    out_actions = self.update_record("Orders", 6, amount=-10)
+    self.assertEqual(out_actions.calls["Orders"],
+                     {"#aggregate#GristSummary_6_Orders:amount": 1})
+    self.assertSummary([
+      [1, 2012, 1, 15.0, 15.0,  30.0,  15.0, 1],
+      [2, 2013, 2, 30.5, 15.25, 30.0,  15.5, 2],
+      [3, 2014, 3, 22.0, 22.0/3, -20.0, 35.0, 3],
+    ])
+
+
+if __name__ == "__main__":
+  unittest.main()
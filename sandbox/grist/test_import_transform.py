@@ -1,4 +1,5 @@
 # pylint: disable=line-too-long
+import import_actions
 import logger
 import test_engine
 
@@ -198,3 +199,24 @@ class TestImportTransform(test_engine.EngineTestCase):
       [2, "Destination1"],
       [3, "NewTable"]
     ])
+
+  def test_finish_import_in_batches(self):
+    # Rows get added to the destination table in batches of bounded size.
+    self.init_state()
+    orig_batch_size = import_actions._import_batch_size
+    import_actions._import_batch_size = 1
+    try:
+      out_actions = self.apply_user_action(
+          ['TransformAndFinishImport', 'Hidden_table', 'NewTable', True, None])
+    finally:
+      import_actions._import_batch_size = orig_batch_size
+
+    self.assertEqual([a for a in out_actions.get_repr()["stored"] if a[1] == "NewTable"][-2:], [
+      ["AddRecord", "NewTable", 1, {"fname": "Carry", "lname": "Jonson", "mname": "M.", "manualSort": 1.0}],
+      ["AddRecord", "NewTable", 2, {"fname": "Don", "lname": "Yoon", "mname": "B.", "manualSort": 2.0}],
+    ])
+    self.assertTableData('NewTable', cols="all", data=[
+      ["id",  "fname",        "lname",      "mname",      "manualSort"],
+      [1,     "Carry",        "Jonson",     "M.",         1.0],
+      [2,     "Don",          "Yoon",       "B.",         2.0]
+    ])
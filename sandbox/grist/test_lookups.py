@@ -706,3 +706,97 @@ return ",".join(str(r.id) for r in Students.lookupRecords(firstName=fn, lastName
       [5,     "Eureka",     SchoolsRec(1),  "New York"  ],
       [6,     "Yale",       SchoolsRec(3),  "New Haven" ],
     ])
+
+  def test_range_lookups(self):
+    # Range lookups return records within a range of values, sorted by value, and only get
+    # re-evaluated for changes to records within the range.
+    self.load_sample(testutil.parse_test_sample({
+      "SCHEMA": [
+        [1, "Orders", [
+          [11, "customer",  "Text",     False, "", "", ""],
+          [12, "day",       "Numeric",  False, "", "", ""],
+          [13, "amount",    "Numeric",  False, "", "", ""],
+          [14, "item",      "Text",     False, "", "", ""],
+          [15, "to_date",   "Numeric",  True,
+           "SUM(Orders.lookupRange('day', end=$day + 1, customer=$customer).amount)", "", ""],
+        ]],
+      ],
+      "DATA": {
+        "Orders": [
+          ["id", "customer", "day", "amount", "item"],
+          [1,    "alice",    3,     10,       "apple"],
+          [2,    "bob",      1,     20,       "banana"],
+          [3,    "alice",    1,     30,       "apricot"],
+          [4,    "alice",    7,     40,       "cherry"],
+        ],
+      }
+    }))
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "to_date"],
+      [1,    40],
+      [2,    20],
+      [3,    30],
+      [4,    80],
+    ])
+
+    # A change to an order only affects the orders of the same customer on the same or later days.
+    out_actions = self.update_record("Orders", 1, amount=15)
+    self.assertPartialOutActions(out_actions, {
+      "calls": {"Orders": {"to_date": 2}},
+    })
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "to_date"],
+      [1,    45],
+      [2,    20],
+      [3,    30],
+      [4,    85],
+    ])
+
+    # Moving a record affects the lookups that include either its old or its new value.
+    out_actions = self.update_record("Orders", 4, day=2)
+    self.assertPartialOutActions(out_actions, {
+      "calls": {"Orders": {"to_date": 2, "#lookup#range#day#customer": 1}},
+    })
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "to_date"],
+      [1,    85],
+      [2,    20],
+      [3,    30],
+      [4,    70],
+    ])
+
+    # Results are sorted by the range column, and may be filtered by prefix.
+    self.add_column("Orders", "later", formula="Orders.lookupRange('day', $day + 0.5).id")
+    self.add_column("Orders", "same_start",
+                    formula="Orders.lookupRange('item', prefix=$item[0]).item")
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "later",   "same_start"],
+      [1,    [],        ["apple", "apricot"]],
+      [2,    [4, 1],    ["banana"]],
+      [3,    [4, 1],    ["apple", "apricot"]],
+      [4,    [1],       ["cherry"]],
+    ])
+    out_actions = self.update_record("Orders", 2, item="avocado")
+    self.assertPartialOutActions(out_actions, {
+      "calls": {"Orders": {"same_start": 3, "#lookup#range#item#": 1}},
+    })
+    self.assertTableData("Orders", cols="subset", rows="subset", data=[
+      ["id", "same_start"],
+      [1,    ["apple", "apricot", "avocado"]],
+    ])
+
+    # Range lookups work with dates, and records that are removed.
+    self.add_column("Orders", "date", type="Date", formula="DATE(2020, 1, int($day))")
+    self.add_column("Orders", "january_2nd", formula=(
+      "Orders.lookupRange('date', DATE(2020, 1, 2), DATE(2020, 1, 3)).id"))
+    self.assertTableData("Orders", cols="subset", rows="subset", data=[
+      ["id", "january_2nd"],
+      [1,    [4]],
+    ])
+    self.remove_record("Orders", 4)
+    self.assertTableData("Orders", cols="subset", data=[
+      ["id", "to_date", "later",  "january_2nd"],
+      [1,    45,        [],       []],
+      [2,    20,        [1],      []],
+      [3,    30,        [1],      []],
+    ])
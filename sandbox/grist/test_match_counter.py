@@ -83,6 +83,11 @@ class TestMatchCounter(unittest.TestCase):
     self.assertEqual(m.count_unique(data2), 15)
     self.assertEqual(m.count_unique(data3), 200)
 
+    # Counting against sketches of distinct values gives the same results.
+    self.assertEqual(m.count_distinct(match_counter.distinct_values(data1)), 5)
+    self.assertEqual(m.count_distinct(match_counter.distinct_values(data2)), 15)
+    self.assertEqual(m.count_distinct(match_counter.distinct_values(data3)), 200)
+
     m = MatchCounterOther(sample)
     self.assertEqual(m.count_unique(data1), 5)
     self.assertEqual(m.count_unique(data2), 15)
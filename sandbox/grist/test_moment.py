@@ -224,6 +224,23 @@ class TestMoment(unittest.TestCase):
     self.assertEqual(ts_to_dt_nyc(dst_after + 3599).strftime(fmt), "1918-10-27 01:59:59 EST")
 
 
+  def test_ts_to_dt_fast_path(self):
+    # Zone.ts_to_dt() matches the conversion via datetime.astimezone(), including around DST
+    # switches, and regardless of the order of timestamps (which matters for its caching).
+    zone = moment.get_zone('America/New_York')
+    timestamps = [-1633280401, -1615140000, 0, -1633280400, 1426291200, -1615140001, 1e9, 1.5,
+                  -1615140000 + 3599, 1604210400.25, 1604210399.999, 1604206800]
+    for ts in timestamps + timestamps[::-1]:
+      expected = (moment.EPOCH_UTC + timedelta(seconds=ts)).astimezone(zone.get_tzinfo(None))
+      dt = zone.ts_to_dt(ts)
+      self.assertEqual(dt, expected)
+      self.assertEqual(dt.strftime(fmt), expected.strftime(fmt))
+      self.assertEqual(dt.utcoffset(), expected.utcoffset())
+
+    self.assertEqual(moment.ts_list_to_dt(timestamps + [None], zone),
+                     [ts and zone.ts_to_dt(ts) for ts in timestamps] + [None])
+    self.assertEqual(moment.ts_list_to_dt([0, 1426291200], zone)[0], 0)
+
   def test_tzinfo(self):
     # Verify that tzinfo works correctly.
     ts1 = 294217199000      # In EST
@@ -0,0 +1,171 @@
+"""
+Tests recomputing independent groups of tables in parallel worker processes.
+"""
+import errno
+import os
+import unittest
+
+import actions
+import engine
+import objtypes
+import parallel_recompute
+import testutil
+import test_engine
+
+
+class TestParallelRecompute(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Customers", [
+        [10, "name",       "Text",           False, "", "", ""],
+        [11, "total",      "Numeric",        True,
+         "SUM(Orders.lookupRecords(customer=$id).amount)", "", ""],
+      ]],
+      [2, "Orders", [
+        [20, "customer",   "Ref:Customers",  False, "", "", ""],
+        [21, "amount",     "Numeric",        False, "", "", ""],
+        [22, "label",      "Text",           True, "$customer.name.upper()", "", ""],
+      ]],
+      [3, "Products", [
+        [30, "name",       "Text",           False, "", "", ""],
+        [31, "price",      "Numeric",        False, "", "", ""],
+        [32, "per_unit",   "Numeric",        True, "$price / len($name)", "", ""],
+        [33, "similar",    "RefList:Products", True,
+         "Products.lookupRecords(price=$price)", "", ""],
+      ]],
+      [4, "Sales", [
+        [40, "region",     "Text",           False, "", "", ""],
+        [41, "amount",     "Numeric",        False, "", "", ""],
+        [42, "double",     "Numeric",        True, "$amount * 2", "", ""],
+        [43, "first",      "Any",            True, "Sales.lookupOne(region=$region)", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Customers": [
+        ["id",  "name"],
+        [1,     "alice"],
+        [2,     "bob"],
+      ],
+      "Orders": [
+        ["id",  "customer", "amount"],
+        [1,     1,          15],
+        [2,     1,          10],
+        [3,     2,          5],
+      ],
+      "Products": [
+        ["id",  "name",   "price"],
+        [1,     "apple",  10],
+        [2,     "",       10],
+        [3,     "pear",   4],
+      ],
+      "Sales": [
+        ["id",  "region", "amount"],
+        [1,     "east",   5],
+        [2,     "west",   7],
+      ],
+    }
+  })
+
+  def setUp(self):
+    super(TestParallelRecompute, self).setUp()
+    self._orig_min_cells = parallel_recompute.MIN_COMPONENT_CELLS
+    parallel_recompute.MIN_COMPONENT_CELLS = 1
+
+  def tearDown(self):
+    parallel_recompute.MIN_COMPONENT_CELLS = self._orig_min_cells
+    super(TestParallelRecompute, self).tearDown()
+
+  def assertSameData(self, expected_engine):
+    for table_id in expected_engine.tables:
+      self.assertEqual(actions.encode_objects(self.engine.fetch_table(table_id)),
+                       actions.encode_objects(expected_engine.fetch_table(table_id)))
+
+  def test_components(self):
+    self.load_sample(self.sample)
+    self.apply_user_action(["CreateViewSection", 4, 0, 'record', [40]])
+    components = {tuple(sorted(t)): is_safe for (t, is_safe)
+                  in parallel_recompute.get_components(self.engine)
+                  if not any(table_id.startswith('_grist_') for table_id in t)}
+    self.assertEqual(components, {
+      ("Customers", "Orders"): True,
+      ("Products",): True,
+      ("GristSummary_5_Sales", "Sales"): False,
+    })
+
+  def test_parallel_recompute(self):
+    serial = self.engine
+    self.load_sample(self.sample)
+
+    self.engine = engine.Engine()
+    self.engine.formula_tracer = serial.formula_tracer
+    self.engine.recompute_workers = 2
+    self.call_counts.clear()
+    self.load_sample(self.sample)
+
+    # The independent groups get evaluated in the workers, so their formulas aren't traced here.
+    # Only Sales is recomputed by this engine, since records in an Any column can't be sent back.
+    self.assertEqual(self.call_counts, {"Sales": {"double": 2, "first": 2, "#lookup#region": 2}})
+    self.assertSameData(serial)
+    div_error = objtypes.RaisedException(ZeroDivisionError())
+    self.assertTableData("Products", cols="subset", data=[
+      ["id", "per_unit",  "similar"],
+      [1,    2,           [1, 2]],
+      [2,    div_error,   [1, 2]],
+      [3,    1,           [3]],
+    ])
+
+    # Changes still propagate through the dependencies and lookups built by the workers.
+    parallel = self.engine
+    for eng in (serial, parallel):
+      self.engine = eng
+      self.update_record("Orders", 3, customer=1)
+      self.update_record("Customers", 1, name="carol")
+      self.update_record("Products", 3, price=10)
+      self.add_record("Products", name="plum", price=4)
+    self.assertSameData(serial)
+    self.assertTableData("Customers", cols="subset", data=[
+      ["id", "name",  "total"],
+      [1,    "carol", 30],
+      [2,    "bob",   0],
+    ])
+    self.assertTableData("Products", cols="subset", data=[
+      ["id", "similar"],
+      [1,    [1, 2, 3]],
+      [2,    [1, 2, 3]],
+      [3,    [1, 2, 3]],
+      [4,    [4]],
+    ])
+
+  def test_fork_failure(self):
+    serial = self.engine
+    self.load_sample(self.sample)
+
+    # If starting a worker fails, the ones already started still do their part, and the rest gets
+    # recomputed serially, without leaking processes or file descriptors.
+    orig_fork = os.fork
+    fork_calls = []
+    def failing_fork():
+      fork_calls.append(1)
+      if len(fork_calls) > 1:
+        raise OSError(errno.EAGAIN, "Resource temporarily unavailable")
+      return orig_fork()
+
+    open_fds = os.listdir('/proc/self/fd')
+    os.fork = failing_fork
+    try:
+      self.engine = engine.Engine()
+      self.engine.formula_tracer = serial.formula_tracer
+      self.engine.recompute_workers = 2
+      self.call_counts.clear()
+      self.load_sample(self.sample)
+    finally:
+      os.fork = orig_fork
+
+    self.assertEqual(len(fork_calls), 2)
+    self.assertEqual(len(os.listdir('/proc/self/fd')), len(open_fds))
+    self.assertEqual(sorted(self.call_counts), ["Customers", "Orders", "Sales"])
+    self.assertSameData(serial)
+
+
+if __name__ == "__main__":
+  unittest.main()
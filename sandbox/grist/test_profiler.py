@@ -0,0 +1,88 @@
+"""
+Tests collecting per-column statistics about formula evaluation.
+"""
+import unittest
+
+import testutil
+import test_engine
+
+
+class TestProfiler(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Customers", [
+        [10, "name",       "Text",           False, "", "", ""],
+        [11, "total",      "Numeric",        True,
+         "SUM(Orders.lookupRecords(customer=$id).amount)", "", ""],
+        [12, "max_share",  "Numeric",        True,
+         "MAX(Orders.lookupRecords(customer=$id).share)", "", ""],
+      ]],
+      [2, "Orders", [
+        [20, "customer",   "Ref:Customers",  False, "", "", ""],
+        [21, "amount",     "Numeric",        False, "", "", ""],
+        [22, "share",      "Numeric",        True, "$amount / $customer.total", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Customers": [
+        ["id",  "name"],
+        [1,     "alice"],
+        [2,     "bob"],
+      ],
+      "Orders": [
+        ["id",  "customer", "amount"],
+        [1,     1,          15],
+        [2,     1,          5],
+        [3,     2,          5],
+      ],
+    }
+  })
+
+  def get_profile(self):
+    # Leave out metadata, whose formulas and lookups aren't of interest here.
+    return {(r["tableId"], r["colId"]): r for r in self.engine.get_profile()
+            if not r["tableId"].startswith("_grist_")}
+
+  def test_profile(self):
+    self.load_sample(self.sample)
+    self.assertEqual(self.engine.get_profile(), [])
+
+    self.engine.start_profiling()
+    self.update_record("Orders", 2, customer=2)
+    profile = self.get_profile()
+    self.assertEqual(sorted(profile), [
+      ("Customers", "max_share"),
+      ("Customers", "total"),
+      ("Orders", "#lookup#customer"),
+      ("Orders", "share"),
+    ])
+
+    # Customers.max_share gets evaluated first, but needs Orders.share, which in turn needs
+    # Customers.total, so evaluation gets reordered twice. The lookup count of max_share includes
+    # the lookup done before the first reordering.
+    counts = {key: (r["cells"], r["changed"], r["reorders"], r["lookups"])
+              for (key, r) in profile.iteritems()}
+    self.assertEqual(counts, {
+      ("Customers", "max_share"):     (2, 2, 1, 3),
+      ("Customers", "total"):         (2, 2, 0, 2),
+      ("Orders", "#lookup#customer"): (1, 0, 0, 0),
+      ("Orders", "share"):            (3, 3, 1, 0),
+    })
+    for entry in profile.itervalues():
+      self.assertGreaterEqual(entry["totalTime"], 0)
+      self.assertAlmostEqual(entry["meanTime"] * entry["cells"], entry["totalTime"])
+
+    # Entries are ranked by total time.
+    report = self.engine.get_profile()
+    self.assertEqual(sorted(report, key=lambda r: -r["totalTime"]), report)
+    self.assertEqual(self.engine.get_profile(limit=1), report[:1])
+
+    # Statistics accumulate until profiling is stopped.
+    self.update_record("Orders", 3, amount=10)
+    self.assertEqual(self.get_profile()[("Customers", "total")]["cells"], 3)
+    self.assertEqual(len(self.engine.stop_profiling()), len(report))
+    self.assertEqual(self.engine.get_profile(), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import relation
+
+
+def _make_reference(referring_table, target_table, references):
+  rel = relation.ReferenceRelation(referring_table, target_table, "ref")
+  for (referring_row_id, target_row_id) in references:
+    rel.add_reference(referring_row_id, target_row_id)
+  return rel
+
+
+class TestRelation(unittest.TestCase):
+  def setUp(self):
+    # Students refer to Schools, which refer to Addresses, which refer to Cities.
+    self.identity = relation.IdentityRelation("Students")
+    self.school = _make_reference("Students", "Schools", [(1, 10), (2, 10), (3, 11)])
+    self.address = _make_reference("Schools", "Addresses", [(10, 100), (11, 101)])
+    self.city = _make_reference("Addresses", "Cities", [(100, 1000), (101, 1000)])
+
+  def test_compose_interned(self):
+    # Composing the same relations returns the same object, regardless of grouping.
+    left = self.identity.compose(self.school).compose(self.address).compose(self.city)
+    self.assertIs(self.identity.compose(self.school).compose(self.address).compose(self.city),
+                  left)
+    self.assertIs(self.identity.compose(self.school.compose(self.address.compose(self.city))),
+                  left)
+    self.assertIs(self.identity.compose(self.school).compose(self.address.compose(self.city)),
+                  left)
+    self.assertEqual(str(left), "Identity(Students) + ReferenceRelation(Students.ref) + " +
+                     "ReferenceRelation(Schools.ref) + ReferenceRelation(Addresses.ref)")
+    self.assertEqual((left.referring_table, left.target_table), ("Students", "Cities"))
+
+  def test_get_affected_rows(self):
+    rel = self.identity.compose(self.school.compose(self.address.compose(self.city)))
+    self.assertEqual(rel.get_affected_rows([1000]), {1, 2, 3})
+    self.assertEqual(rel.compose(relation.IdentityRelation("Cities")).get_affected_rows([1000]),
+                     {1, 2, 3})
+    self.assertEqual(self.identity.compose(self.school).compose(self.address)
+                     .get_affected_rows([101]), {3})
+    self.assertEqual(rel.get_affected_rows([1001]), set())
+
+    # Changes to the underlying relations are reflected.
+    self.address.remove_reference(11, 101)
+    self.assertEqual(rel.get_affected_rows([1000]), {1, 2})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from rowset import RowSet
+
+
+class TestRowSet(unittest.TestCase):
+  def assertRowSet(self, row_set, expected):
+    self.assertEqual(list(row_set), sorted(expected))
+    self.assertEqual(len(row_set), len(expected))
+    self.assertEqual(bool(row_set), bool(expected))
+    self.assertEqual(row_set, set(expected))
+
+  def test_basic(self):
+    row_set = RowSet([5, 1, 70, 1, 31, 32])
+    self.assertRowSet(row_set, {1, 5, 31, 32, 70})
+    self.assertIn(31, row_set)
+    self.assertNotIn(33, row_set)
+    self.assertNotIn(1000, row_set)
+
+    row_set.add(33)
+    row_set.add(33)
+    row_set.discard(5)
+    row_set.discard(6)
+    self.assertRowSet(row_set, {1, 31, 32, 33, 70})
+
+    row_set.update(xrange(60, 66))
+    row_set.difference_update([1, 31, 64, 100])
+    self.assertRowSet(row_set, {32, 33, 60, 61, 62, 63, 65, 70})
+    self.assertEqual(repr(row_set), "RowSet([32, 33, 60, 61, 62, 63, 65, 70])")
+
+    row_set.difference_update(row_set.copy())
+    self.assertRowSet(row_set, set())
+    self.assertRowSet(RowSet(), set())
+
+  def test_set_algebra(self):
+    rand = random.Random(17)
+    for _ in xrange(20):
+      rows1 = {rand.randint(0, 500) for _ in xrange(rand.randint(0, 300))}
+      rows2 = {rand.randint(0, 500) for _ in xrange(rand.randint(0, 300))}
+      row_set = RowSet(rows1)
+      row_set.update(RowSet(rows2))
+      self.assertRowSet(row_set, rows1 | rows2)
+      row_set.difference_update(RowSet(rows2))
+      self.assertRowSet(row_set, rows1 - rows2)
+      row_set.update(rows2)
+      row_set.difference_update(sorted(rows1))
+      self.assertRowSet(row_set, rows2 - rows1)
+
+  def test_equality(self):
+    self.assertEqual(RowSet([1, 2]), RowSet([2, 1]))
+    self.assertNotEqual(RowSet([1, 2]), RowSet([1, 3]))
+    self.assertEqual(RowSet([1, 2]), {1, 2})
+    self.assertEqual({1, 2}, RowSet([1, 2]))
+    self.assertNotEqual(RowSet([1, 2]), {1})
+    self.assertNotEqual(RowSet([1, 2]), [1, 2])
+    self.assertFalse(RowSet() == None)
+
+  def test_modify_while_iterating(self):
+    # Rows removed during iteration are skipped or not, but iteration doesn't fail.
+    row_set = RowSet(xrange(100))
+    seen = []
+    for row_id in row_set:
+      seen.append(row_id)
+      row_set.discard(row_id + 40)
+    self.assertEqual(seen, range(40) + range(80, 100))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,111 @@
+import marshal
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import objtypes
+import sqlite_reader
+import test_engine
+import testutil
+
+
+def _encode_value(value):
+  # Encodes values as DocStorage does when storing them in SQLite.
+  if isinstance(value, bool):
+    return int(value)
+  if isinstance(value, str):
+    return value.decode('utf8')
+  if value is None or isinstance(value, (int, long, float)):
+    return value
+  return buffer(marshal.dumps(objtypes.encode_object(value), 2))
+
+
+def write_db(path, tables):
+  """Creates an SQLite file at path with the given dict of TableData objects."""
+  conn = sqlite3.connect(path)
+  for table_data in tables.itervalues():
+    col_ids = ["id"] + sorted(table_data.columns)
+    conn.execute("CREATE TABLE %s (%s)" % (sqlite_reader.quote_ident(table_data.table_id),
+                                            ", ".join(map(sqlite_reader.quote_ident, col_ids))))
+    rows = zip(table_data.row_ids, *[table_data.columns[c] for c in col_ids[1:]])
+    conn.executemany("INSERT INTO %s VALUES (%s)" % (sqlite_reader.quote_ident(table_data.table_id),
+                                                     ", ".join("?" for c in col_ids)),
+                     [map(_encode_value, row) for row in rows])
+  conn.commit()
+  conn.close()
+
+
+class TestSqliteReader(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Items", [
+        [1, "name", "Text", False, "", "", ""],
+        [2, "price", "Numeric", False, "", "", ""],
+        [3, "tags", "RefList:Tags", False, "", "", ""],
+        [4, "total", "Numeric", True, "$price * 2", "", ""],
+      ]],
+      [2, "Tags", [
+        [11, "tag", "Text", False, "", "", ""],
+      ]],
+    ],
+    "DATA": {
+      "Items": [
+        ["id", "name",      "price", "tags"],
+        [1,    "apple",     1.5,     [1, 2]],
+        [2,    "caf\xc3\xa9", 2,     None],
+        [4,    "",          None,    [2]],
+      ],
+      "Tags": [
+        ["id", "tag"],
+        [1,    "fruit"],
+        [2,    "sale"],
+      ],
+    }
+  })
+
+  def setUp(self):
+    super(TestSqliteReader, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "doc.grist")
+    tables = dict(self.sample["SCHEMA"], **self.sample["DATA"])
+    write_db(self.path, tables)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(TestSqliteReader, self).tearDown()
+
+  def test_read_table(self):
+    with sqlite_reader.DocReader(self.path) as reader:
+      self.assertEqual(reader.read_table("Items"), self.sample["DATA"]["Items"])
+      self.assertEqual(reader.read_table("Tags"), self.sample["DATA"]["Tags"])
+
+  def test_read_in_chunks(self):
+    orig_fetch_size = sqlite_reader.FETCH_SIZE
+    sqlite_reader.FETCH_SIZE = 2
+    try:
+      with sqlite_reader.DocReader(self.path) as reader:
+        self.assertEqual(reader.read_table("Items"), self.sample["DATA"]["Items"])
+    finally:
+      sqlite_reader.FETCH_SIZE = orig_fetch_size
+
+  def test_load_doc(self):
+    # Loading straight from SQLite produces the same data as loading the sample.
+    self.assertEqual(sqlite_reader.load_doc(self.engine, self.path), ["Items", "Tags"])
+    self.engine.load_done()
+    self.assertTableData("Items", data=[
+      ["id", "name",        "price", "tags",   "total"],
+      [1,    "apple",       1.5,     [1, 2],   3.0],
+      [2,    "caf\xc3\xa9", 2.0,     None,     4.0],
+      [4,    "",            None,    [2],      objtypes.RaisedException(TypeError())],
+    ])
+    self.assertTableData("Tags", data=[
+      ["id", "tag"],
+      [1,    "fruit"],
+      [2,    "sale"],
+    ])
+
+    # The file isn't modified by the reader.
+    with self.assertRaises(sqlite3.OperationalError):
+      with sqlite_reader.DocReader(self.path) as reader:
+        reader._conn.execute("DELETE FROM Tags")
@@ -0,0 +1,140 @@
+import marshal
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import actions
+import table_file
+import test_engine
+import testutil
+
+
+class TestTableFile(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "table")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_round_trip(self):
+    bulk_values = {
+      "id": range(1, 101),
+      "num": [i * 0.5 for i in xrange(100)],
+      "text": ["row %d" % i for i in xrange(99)] + [None],
+      "flag": [i % 2 == 0 for i in xrange(100)],
+      "list": [[i] for i in xrange(100)],
+    }
+    table_file.write_table_file(self.path, bulk_values)
+    self.assertEqual(table_file.read_table_file(self.path), bulk_values)
+
+    # Short columns are stored in the header, and it all still works.
+    bulk_values = {"id": [1, 2], "num": [1.5, None]}
+    table_file.write_table_file(self.path, bulk_values)
+    self.assertEqual(table_file.read_table_file(self.path), bulk_values)
+
+  def test_bad_files(self):
+    with open(self.path, 'wb') as f:
+      f.write("not a table file")
+    with self.assertRaisesRegexp(ValueError, "Not a table file"):
+      table_file.read_table_file(self.path)
+
+    table_file.write_table_file(self.path, {"id": range(100)})
+    with open(self.path, 'r+b') as f:
+      f.truncate(os.path.getsize(self.path) - 16)
+    with self.assertRaisesRegexp(ValueError, "is truncated"):
+      table_file.read_table_file(self.path)
+
+
+# Loads a table file through main.table_data_from_file(), which is what the sandbox calls.
+_LOAD_SCRIPT = """
+import marshal, sys
+import main
+table_data = main.table_data_from_file("Items", sys.argv[1])
+sys.stdout.write(marshal.dumps((table_data.row_ids, table_data.columns), 2))
+"""
+
+def _open_sandbox_fds():
+  # Importing main sets up the sandbox, which expects its pipes on fds 3 and 4.
+  null_fd = os.open(os.devnull, os.O_RDWR)
+  os.dup2(null_fd, 3)
+  os.dup2(null_fd, 4)
+
+
+class TestTableFileMain(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "table")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def load_via_main(self, bulk_values):
+    table_file.write_table_file(self.path, bulk_values)
+    output = subprocess.check_output([sys.executable, "-c", _LOAD_SCRIPT, self.path],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)),
+                                     preexec_fn=_open_sandbox_fds)
+    return marshal.loads(output)
+
+  def test_table_data_from_file(self):
+    # Short columns, which aren't encoded, with text and list cells.
+    self.assertEqual(self.load_via_main({"id": [1, 2], "name": ["a", "caf\xc3\xa9"],
+                                         "list": [[1, 2], None]}),
+                     ([1, 2], {"name": ["a", "caf\xc3\xa9"], "list": [[1, 2], None]}))
+
+    # Encoded columns, with outliers.
+    row_ids = range(1, 51)
+    names = ["item%d" % r for r in row_ids]
+    names[3] = None
+    prices = [r * 1.5 for r in row_ids]
+    prices[5] = None
+    prices[6] = [1, 2]
+    lists = [[r] for r in row_ids]
+    self.assertEqual(self.load_via_main({"id": row_ids, "name": names, "price": prices,
+                                         "list": lists}),
+                     (row_ids, {"name": names, "price": prices, "list": lists}))
+
+
+class TestTableFileLoad(test_engine.EngineTestCase):
+  sample = testutil.parse_test_sample({
+    "SCHEMA": [
+      [1, "Items", [
+        [1, "name", "Text", False, "", "", ""],
+        [2, "price", "Numeric", False, "", "", ""],
+        [3, "total", "Numeric", True, "$price * 2", "", ""],
+      ]],
+    ],
+    "DATA": {}
+  })
+
+  def test_load_table(self):
+    # Table data read from a file loads into the engine like data sent through the pipe.
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmp_dir, "Items")
+      row_ids = range(1, 51)
+      table_file.write_table_file(path, {
+        "id": row_ids,
+        "name": ["item%d" % r for r in row_ids],
+        "price": [float(r) for r in row_ids],
+      })
+      bulk_values = table_file.read_table_file(path)
+    finally:
+      shutil.rmtree(tmp_dir)
+
+    schema = self.sample["SCHEMA"]
+    self.engine.load_meta_tables(schema['_grist_Tables'], schema['_grist_Tables_column'])
+    self.engine.load_table(actions.TableData("Items", bulk_values.pop("id"), bulk_values))
+    self.engine.load_done()
+    self.assertTableData("Items", rows="subset", data=[
+      ["id", "name",   "price", "total"],
+      [1,    "item1",  1.0,     2.0],
+      [50,   "item50", 50.0,    100.0],
+    ])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=line-too-long
 
+import datetime
+
+import column
 import logger
+import objtypes
 import testutil
 import test_engine
+import usertypes
 
 log = logger.Logger(__name__, logger.INFO)
 
@@ -596,6 +601,78 @@ class TestTypes(test_engine.EngineTestCase):
       [20,   None,       None,       None,       None,       None]
     ])
 
+  def test_convert_list(self):
+    # convert_list() is the same as convert() for each value, including with fast paths for
+    # values of the right type.
+    values = ["New York", u"Chîcágö", False, True, 1509556595, 2**40, -17, 8.153, 0, 1, "", None,
+              "1", [1, 2], datetime.date(2017, 11, 1), objtypes.AltText("x", "Int")]
+    type_objs = [usertypes.Text(), usertypes.Blob(), usertypes.Any(), usertypes.Bool(),
+                 usertypes.Int(), usertypes.Numeric(), usertypes.Date(), usertypes.DateTime("UTC"),
+                 usertypes.PositionNumber(), usertypes.Id(), usertypes.Reference("Foo"),
+                 usertypes.ReferenceList("Foo")]
+    def typed(values):
+      return [(type(v), v) for v in values]
+
+    for type_obj in type_objs:
+      for test_values in [values, [v for v in values if type_obj.is_right_type(v)],
+                          [v for v in values if isinstance(v, int)], [None, 5, None]]:
+        self.assertEqual(typed(type_obj.convert_list(test_values)),
+                         typed(map(type_obj.convert, test_values)),
+                         "%s %r" % (type_obj.typename(), test_values))
+
+    error = objtypes.RaisedException(ValueError())
+    self.assertIs(usertypes.Numeric().convert_list([1.5, error])[1], error)
+
+  def test_datetime_column_view(self):
+    # Iterating through a DateTime column converts timestamps to datetimes in bulk, except in
+    # chunks that include other values.
+    self.load_sample(self.sample)
+    self.apply_user_action(["AddTable", "Dates", [
+      {"id": "dt", "type": "DateTime:America/New_York", "isFormula": False},
+    ]])
+    self.add_records("Dates", ["dt"], [[1426291200], [0], [None], ["hello"], [1426291200.5]])
+    self.add_column("Formulas", "hours", formula=(
+      "[d.strftime('%H:%M:%S') if isinstance(d, datetime.datetime) else str(d) "
+      "for d in Dates.all.dt]"))
+
+    expected = [["20:00:00", "0.0", "None", "hello", "20:00:00"]]
+    orig_chunk_size = column._BULK_CHUNK_SIZE
+    try:
+      for chunk_size in (2, 1000):
+        column._BULK_CHUNK_SIZE = chunk_size
+        self.engine.invalidate_column(self.engine.tables["Formulas"].get_column("hours"))
+        self.engine._bring_all_up_to_date()
+        self.assertTableData("Formulas", cols="subset", data=[["id", "hours"], [1] + expected])
+    finally:
+      column._BULK_CHUNK_SIZE = orig_chunk_size
+
+  def test_aggregate_column_view(self):
+    # Aggregate functions read ColumnViews of numeric columns straight from typed storage, and
+    # fall back to iterating through values when the column contains other values.
+    self.load_sample(self.sample)
+    self.apply_user_action(["AddTable", "Nums", [
+      {"id": "num", "type": "Numeric", "isFormula": False},
+      {"id": "int", "type": "Int", "isFormula": False},
+      {"id": "flag", "type": "Bool", "isFormula": False},
+    ]])
+    self.add_records("Nums", ["num", "int", "flag"],
+                     [[1.5, 4, True], [-2, 3, False], [7, 1, True], [3.5, 2, True]])
+    self.add_column("Formulas", "aggs", formula=(
+      "[f(Nums.all.num) for f in (SUM, AVERAGE, MIN, MAX, MEDIAN, COUNT)] + "
+      "[f(Nums.all.int) for f in (SUM, MEDIAN)] + "
+      "[SUM(Nums.all.flag), COUNT(Nums.all.flag), AVERAGEA(Nums.all.flag)]"))
+    self.assertTableData("Formulas", cols="subset", data=[
+      ["id", "aggs"],
+      [1, [10.0, 2.5, -2.0, 7.0, 2.5, 4, 10, 2.5, 3, 0, 0.75]],
+    ])
+
+    # Non-numeric values are skipped as before.
+    self.update_record("Nums", 2, num="hello", int=None, flag="maybe")
+    self.assertTableData("Formulas", cols="subset", data=[
+      ["id", "aggs"],
+      [1, [12.0, 4.0, 1.5, 7.0, 3.5, 3, 7, 2, 3, 0, 0.75]],
+    ])
+
   def test_numerics_are_floats(self):
     """
     Tests that in formulas, numeric values are floats, not integers.
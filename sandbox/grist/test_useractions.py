@@ -680,6 +680,22 @@ class TestUserActions(test_engine.EngineTestCase):
       [4,     "",             0,    1.0,  "x",  "False",  '-'   ],
     ])
 
+  def test_guess_type(self):
+    self.assertEqual(useractions.guess_type([1, 2.5, "", None, "x"]), "Text")
+    self.assertEqual(useractions.guess_type([1, 2.5, "", None] * 5 + ["x"]), "Numeric")
+    self.assertEqual(useractions.guess_type(["1", "2.5", None]), "Text")
+    self.assertEqual(useractions.guess_type(["1", "2.5", None], convert=True), "Numeric")
+    self.assertEqual(useractions.guess_type([]), "Text")
+
+    # Long lists get sampled, which should give the same answer for a mix of values.
+    orig_sample_size = useractions._guess_type_sample_size
+    useractions._guess_type_sample_size = 10
+    try:
+      self.assertEqual(useractions.guess_type(["x", 1, 2, 3, 4, 5, 6, 7, 8, 9] * 100), "Numeric")
+      self.assertEqual(useractions.guess_type(["x", "y", 2, 3, 4, 5, 6, 7, 8, 9] * 100), "Text")
+    finally:
+      useractions._guess_type_sample_size = orig_sample_size
+
   #----------------------------------------------------------------------
 
   def test_useraction_failures(self):
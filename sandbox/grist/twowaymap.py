@@ -71,6 +71,10 @@ class TwoWayMap(object):
     """ Returns an iterable over all values on the right."""
     return self._bwd.iterkeys()
 
+  def left_items(self):
+    """ Returns an iterable over (left, right) pairs, with right being the value(s) for left."""
+    return self._fwd.iteritems()
+
   def insert(self, left, right):
     """ Insert the (left, right) value pair. """
     # The tricky thing here is to keep the two maps consistent if an update to the second one
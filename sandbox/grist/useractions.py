@@ -1,7 +1,8 @@
 # pylint: disable=too-many-lines
-from collections import namedtuple, Counter, OrderedDict
+from collections import namedtuple, OrderedDict
 import re
 import json
+import random
 import sys
 
 import acl
@@ -125,16 +126,24 @@ def _make_clean_col_info(col_info, col_id=None):
   return ret
 
 
+# Maximum number of values that guess_type() looks at. Longer lists are sampled at random (with a
+# fixed seed, so that the same values always produce the same guess).
+_guess_type_sample_size = 10000
+
 def guess_type(values, convert=False):
   """
   Returns a suitable type for the given iterable of values, optionally attempting conversions.
   """
   # TODO: this should consider all possible types we support, and pick the most common one.
+  values = list(values)
+  if len(values) > _guess_type_sample_size:
+    values = random.Random(0).sample(values, _guess_type_sample_size)
+  values = [v for v in values if v not in ('', None)]
   numeric = usertypes.Numeric()
-  counter = Counter(bool(numeric.is_right_type(numeric.convert(v) if convert else v))
-      for v in values if v not in ('', None))
-  total = sum(counter.values())
-  return "Numeric" if total and counter[True] >= total * 0.9 else "Text"
+  if convert:
+    values = numeric.convert_list(values)
+  num_numeric = len(filter(numeric.is_right_type, values))
+  return "Numeric" if values and num_numeric >= len(values) * 0.9 else "Text"
 
 
 class UserActions(object):